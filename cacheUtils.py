@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+import hashlib
+import json
+import os
+import pickle
+import types
+import xml.etree.ElementTree as ET
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Returns the sha256 hex digest of a file's content. The file is read in chunks, so large (gzipped) networks and
+    route files do not have to fit into memory.
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def value_digest(value) -> str:
+    """
+    Returns the sha256 hex digest of any json serializable value. Dictionaries are hashed independent of key order.
+    """
+    encoded = json.dumps(value, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def module_values(module, excluded_keys=()) -> dict:
+    """
+    Collects all plain configuration values of a config module like simConfig or uamHubConfig.
+    Imported modules, functions, classes and private names are ignored.
+    """
+    values = dict()
+    for key, value in vars(module).items():
+        if key.startswith("_") or key in excluded_keys:
+            continue
+        if isinstance(value, (types.ModuleType, types.FunctionType, type)):
+            continue
+        values[key] = value
+    return values
+
+
+def get_sumocfg_files(sumocfg_path: str, options=("net-file", "route-files", "additional-files")) -> list[str]:
+    """
+    Returns the paths of all net, route and additional files referenced by a sumocfg, relative to the working directory.
+
+    :param options: the sumocfg options to read, e.g. ("route-files",) for the route files only
+    """
+    sumocfg_dir_path = os.path.dirname(sumocfg_path)
+    root = ET.parse(sumocfg_path).getroot()
+    files = list()
+    for option in options:
+        element = root.find(".//" + option)
+        if element is None:
+            continue
+        for file_name in element.get("value").split(","):
+            file_name = file_name.strip()
+            if file_name != "":
+                files.append(os.path.join(sumocfg_dir_path, file_name))
+    return files
+
+
+def write_json_atomic(path: str, content):
+    """
+    Writes json content to a temporary file first and moves it into place afterward, so readers never see a half
+    written file.
+    """
+    temp_path = path + ".tmp" + str(os.getpid())
+    with open(temp_path, 'w') as file:
+        json.dump(content, file, indent=2, sort_keys=True, default=str)
+    os.replace(temp_path, path)
+
+
+def get_pickle_cache_path(net_path: str, net_digest: str, kind: str, cache_folder: str) -> str:
+    name = os.path.basename(net_path).replace(".net.xml.gz", "").replace(".net.xml", "")
+    return os.path.join(cache_folder, name + "-" + net_digest[:16] + "." + kind + ".pickle")
+
+
+def load_cached_pickle(net_path: str, kind: str, version: int, build, cache_folder: str, use_cache: bool = True,
+                       settings=None) -> dict:
+    """
+    Returns the content derived from a network, e.g. its edge index, as a dict of plain values. The content is read
+    from the cache folder if it was built with the same version and settings for a network file with the same content,
+    otherwise build is called without arguments and its result is cached.
+
+    :param kind: name of the content, part of the cache file name, e.g. "edge-index"
+    :param version: increase when the content built for the same network changes, old cache files are rebuilt afterward
+    :param settings: further values the content depends on, e.g. the speed of the Air Taxis
+    """
+    net_digest = file_digest(net_path)
+    cache_path = get_pickle_cache_path(net_path, net_digest, kind, cache_folder)
+    if use_cache and os.path.isfile(cache_path):
+        try:
+            with open(cache_path, 'rb') as cache_file:
+                cached = pickle.load(cache_file)
+            if (cached["version"] == version and cached["net_digest"] == net_digest
+                    and cached["settings"] == settings):
+                return cached["content"]
+        except (OSError, EOFError, KeyError, TypeError, pickle.UnpicklingError):
+            pass  # unreadable caches are rebuilt below
+
+    content = build()
+    if use_cache:
+        os.makedirs(cache_folder, exist_ok=True)
+        temp_path = cache_path + ".tmp" + str(os.getpid())
+        with open(temp_path, 'wb') as cache_file:
+            pickle.dump({"version": version, "net_digest": net_digest, "net_path": net_path, "settings": settings,
+                         "content": content}, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
+    return content
@@ -1,13 +1,29 @@
 import argparse
 import os
+import re
+import shutil
 import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import xml.etree.ElementTree as ET
 import math
 import uamHubConfig as config
-# import numpy as np
+import hubTopology
+import xmlRewriter
+from cacheUtils import file_digest, value_digest
+from hubCache import HubStageCache
+from networkCache import EdgeIndex
+from runCache import get_sumo_version
+import numpy as np
 
 import sumolib
 
+default_layout_file = "uam_hub_locations.txt"    # named hub coordinate sets, see --layout
+hub_edge_pattern = re.compile(r"^uam_(?P<from_index>\d+)_(?P<to_index>\d+)$")
+hub_file_prefix_pattern = re.compile(r"^\d+_uam_hubs_")
+# the sidewalk of an edge can be closer to a hub than the one of the closest edge, by up to half the widths of both edges
+sidewalk_lane_tolerance = 20
+
 
 def get_options():
     """
@@ -15,9 +31,34 @@ def get_options():
     """
     parser = argparse.ArgumentParser(description="Process some coordinates.")
     parser.add_argument('file_path', type=str, help='Path to the sumocfg file.')
-    parser.add_argument('coordinates', type=float, nargs='+',
+    parser.add_argument('coordinates', type=float, nargs='*',
                         help="The coordinates for the uam hub locations, always pass x first, followed by y. Repeat any number of times. "
                              "Example: passing 1 2 3 4 5 6 creates [(1.0, 2.0), (3.0, 4.0), (5.0, 6.0)].")
+    parser.add_argument('--layout', dest='layout', type=str,
+                        help="Use the hub coordinates of a named layout in the layout file instead of passing coordinates, "
+                             "e.g. Ingolstadt.")
+    parser.add_argument('--layout_file', dest='layout_file', type=str, default=default_layout_file,
+                        help="Default = " + default_layout_file + ". File with one hub layout per line: the "
+                             "coordinates, followed by dashes and the name of the layout.")
+    parser.add_argument('--hub_counts', dest='hub_counts', type=int, nargs='+',
+                        help="Batch mode: generates one scenario per hub count from the first n hub coordinates, "
+                             "e.g. --hub_counts 2 3 5. The scenarios are generated at the same time.")
+    parser.add_argument('--add_hubs', dest='add_hubs', type=float, nargs='+',
+                        help="Incremental mode: file_path is an existing <n>_uam_hubs_*.sumocfg. Adds hubs at the "
+                             "given coordinates (x y x y ...) and only patches the affected parts of the scenario.")
+    parser.add_argument('--remove_hubs', dest='remove_hubs', type=int, nargs='+',
+                        help="Incremental mode: file_path is an existing <n>_uam_hubs_*.sumocfg. Removes the hubs with "
+                             "the given indices, e.g. 2 for uam_parking_area2 and uam_hub_stop_2.")
+    parser.add_argument('--overwrite', action='store_true', default=False,
+                        help="Incremental mode: replace existing files of a scenario with the same hub count, e.g. "
+                             "the input scenario itself when adding and removing the same number of hubs. Without "
+                             "it, no files are replaced.")
+    parser.add_argument('--processes', dest='processes', type=int, default=os.cpu_count(),
+                        help="Default = number of CPUs. Maximum number of scenarios generated at the same time in "
+                             "batch mode.")
+    parser.add_argument('--no_cache', action='store_true', default=False,
+                        help="Run every stage of the hub generation, even if its output for the same inputs is already "
+                             "in the hub stage cache (see hubCache.py).")
     args = parser.parse_args()
     return args
 
@@ -52,156 +93,238 @@ def get_orthogonal_points(centre: (float, float), point: (float, float), distanc
     return point1, point2
 
 
-def generate_junctions(net_file, coordinates: list[(float, float)], out_net_file) -> list[str]:
-    tree = ET.parse(net_file)
-    root = tree.getroot()
-    centre = get_centre(coordinates)
-    hub_count = 0
+class NetworkPatch:
+    """
+    Collects new nodes, edges and connections as well as lane permission changes of existing edges in memory, so that
+    all changes to a network are written as one set of plain-xml patch files and applied with a single netconvert call.
+    Chunks of this class have been taken from Jakob Erdmann's buildFullGraph.py and patchVClasses.py
+    """
+
+    def __init__(self):
+        self.nodes = list()
+        self.edges = list()
+        self.lane_permissions = dict()
+        self.connections = list()
+        self.deleted_nodes = list()
+        self.deleted_edges = list()
+
+    def add_node(self, node_id, x, y, node_type="priority"):
+        self.nodes.append('    <node id="%s" x="%s" y="%s" type="%s"/>\n' % (node_id, x, y, node_type))
+
+    def add_edge(self, edge_id, from_node, to_node, speed, width, allow, num_lanes=1):
+        self.edges.append('    <edge id="%s" from="%s" to="%s" speed="%s" numLanes="%s" width="%s" allow="%s"/>\n' % (  # noqa
+            edge_id, from_node, to_node, speed, num_lanes, width, allow))
+
+    def delete_node(self, node_id):
+        self.deleted_nodes.append('    <delete id="%s"/>\n' % node_id)
+
+    def delete_edge(self, edge_id):
+        self.deleted_edges.append('    <delete id="%s"/>\n' % edge_id)
+
+    def set_lane_permissions(self, edge_id, lane_index, allow):
+        self.lane_permissions.setdefault(edge_id, list()).append((lane_index, allow))
+
+    def add_connection(self, from_edge, to_edge, from_lane=0, to_lane=0):
+        self.connections.append('    <connection from="%s" to="%s" fromLane="%s" toLane="%s"/>\n' % (
+            from_edge, to_edge, from_lane, to_lane))
+
+    def write(self, prefix) -> (str, str, str):
+        node_patch = prefix + ".patch.nod.xml"
+        edge_patch = prefix + ".patch.edg.xml"
+        con_patch = prefix + ".patch.con.xml"
+        with open(node_patch, 'w') as outfn, open(edge_patch, 'w') as outfe, open(con_patch, 'w') as outfc:
+            sumolib.writeXMLHeader(outfn, "$Id$", "nodes")
+            sumolib.writeXMLHeader(outfe, "$Id$", "edges", schemaPath="edgediff_file.xsd")  # allows partial edges
+            sumolib.writeXMLHeader(outfc, "$Id$", "connections")
+            outfn.writelines(self.deleted_nodes)
+            outfn.writelines(self.nodes)
+            outfe.writelines(self.deleted_edges)
+            for edge_id, lanes in self.lane_permissions.items():
+                outfe.write('    <edge id="%s">\n' % edge_id)
+                for lane_index, allow in lanes:
+                    outfe.write('         <lane index="%s" allow="%s"/>\n' % (lane_index, allow))
+                outfe.write('    </edge>\n')
+            outfe.writelines(self.edges)
+            outfc.writelines(self.connections)
+            outfn.write("</nodes>\n")
+            outfe.write("</edges>\n")
+            outfc.write("</connections>\n")
+        return node_patch, edge_patch, con_patch
+
+    def apply(self, net_file, out_net_file):
+        """
+        Writes the patch files next to out_net_file, runs netconvert once and removes the patch files afterward.
+        """
+        node_patch, edge_patch, con_patch = self.write(get_prefix(out_net_file))
+        print("applying " + str(len(self.nodes)) + " nodes, " + str(len(self.edges)) + " edges, "
+              + str(len(self.connections)) + " connections, " + str(len(self.deleted_edges)) + " deleted edges and "
+              + "permission changes of " + str(len(self.lane_permissions)) + " edges with netconvert")
+        NETCONVERT = sumolib.checkBinary('netconvert')
+        return_code = subprocess.call([NETCONVERT,
+                                       '-s', net_file,
+                                       '-n', node_patch,
+                                       '-e', edge_patch,
+                                       '-x', con_patch,
+                                       '-o', out_net_file])
+        for patch_file in (node_patch, edge_patch, con_patch):
+            if os.path.exists(patch_file):
+                os.remove(patch_file)
+        if return_code != 0:
+            raise RuntimeError("netconvert failed to patch \"" + net_file + "\" (exit code " + str(return_code) + ")")
+
+
+class NetworkSession:
+    """
+    The network of the current hub generation stage, read at most once and shared by all stages that only look up
+    edges. sumolib keeps the spatial index of a loaded network, so it is built once as well. Stages that write a new
+    network call invalidate with its path, the next lookup then reads the new network.
+    """
+
+    def __init__(self, net_path):
+        self.net_path = net_path
+        self._net = None
+        self._edge_index = None
+        self.access_points = dict()
+
+    @property
+    def net(self):
+        if self._net is None:
+            self._net = sumolib.net.readNet(self.net_path)
+        return self._net
+
+    @property
+    def edge_index(self) -> EdgeIndex:
+        if self._edge_index is None:
+            self._edge_index = EdgeIndex.from_net(self.net)
+        return self._edge_index
+
+    def invalidate(self, net_path=None):
+        if net_path is not None:
+            self.net_path = net_path
+        self._net = None
+        self._edge_index = None
+        self.access_points = dict()
+
+
+def get_prefix(net_file) -> str:
+    prefix = net_file
+    if prefix.endswith(".net.xml.gz"):
+        prefix = prefix[:-11]
+    elif prefix.endswith(".net.xml"):
+        prefix = prefix[:-8]
+    return prefix
+
+
+def generate_junctions(patch: NetworkPatch, coordinates: list[(float, float)], first_hub_index=0, centre=None) -> list[str]:
+    if centre is None:
+        centre = get_centre(coordinates)
+    hub_count = first_hub_index
     junction_ids = list()
     for hub_location in coordinates:
         orthogonals = get_orthogonal_points(centre, hub_location, config.uam_hub_length / 2)
         hub_junction_count = 0
         for point in orthogonals:
             new_id = "uam_hub_junction_" + str(hub_count) + "_" + str(hub_junction_count)
-            root.append(ET.Element('junction', {
-                'id': new_id,
-                'x': str(point[0]),
-                'y': str(point[1]),
-                'type': 'priority',
-            }))
+            patch.add_node(new_id, point[0], point[1])
             junction_ids.append(new_id)
             print("creating new junction: \"" + new_id + "\" at x = " + str(point[0]) + ", y = " + str(point[1]))
             hub_junction_count += 1
         hub_count += 1
 
-    tree.write(out_net_file)
     return junction_ids
 
 
-def generate_edges(root, junction_ids: list[str]):
-    for index in range(0, len(junction_ids), 2):
-        edge_id = "uam_edge_" + str(index) + "_" + str(index + 1)
-        new_edge = ET.Element('edge', {
-            'id': edge_id,
-            'from': junction_ids[index],
-            'to': junction_ids[index + 1],
-            'priority': '-1'
-        })
-        print("creating new edge: \"" + edge_id + "\" from " + str(junction_ids[index]) + " to = " + junction_ids[index + 1])
-        #lane_id = edge_id + "_0"
-        #new_lane = ET.SubElement(new_edge, 'lane', {
-        #    'id': lane_id,
-        #    'index': '0',
-        #    'speed': '13.89',
-        #    'width': '2.0',
-        #    'allow': 'taxi'})
-        #print("creating new lane for edge.")
-        root.append(new_edge)
-
-
-def connect_junctions(net_file, junction_ids, out_file_path, edge_coord_dict, coordinates) -> list[str]:
+def connect_junctions(patch: NetworkPatch, junction_ids, edge_coord_dict, coordinates, first_index=0) -> list[str]:
     """
     Chunks of this function have been taken from Jakob Erdmann's buildFullGraph.py, authored 2024-05-02
+
+    :param first_index: index of the first junction in junction_ids, when hubs are added to an existing uam network
     """
-    prefix = net_file
-    if prefix.endswith(".net.xml.gz"):
-        prefix = prefix[:-11]
-    elif prefix.endswith(".net.xml"):
-        prefix = prefix[:-8]
+    edge_ids = list()
+    for index in range(0, len(junction_ids), 2):
+        new_edge_id = "uam_%s_%s" % (first_index + index, first_index + index + 1)
+        patch.add_edge(new_edge_id, junction_ids[index], junction_ids[index + 1],
+                       config.uam_hub_edge_speed, config.uam_hub_edge_width, "taxi pedestrian")
+        print("creating new edge: \"" + new_edge_id + "\" from " + str(junction_ids[index]) + " to " + junction_ids[
+            index + 1])
+        edge_ids.append(new_edge_id)
+        edge_coord_dict[new_edge_id] = coordinates[int(index / 2)]
+    return edge_ids
 
-    edge_patch = prefix + ".patch.edg.xml"
 
-    edge_ids = list()
+def create_hub_additionals(edge, hub_index, access_point: (str, float)):
+    """
+    Returns the parking area and the bus stop of a uam hub, or None if there is no sidewalk for its access point.
 
-    with open(edge_patch, 'w') as outfe:
-        sumolib.writeXMLHeader(outfe, "$Id$", "edges")
-        for index in range(0, len(junction_ids), 2):
-            new_edge_id = "uam_%s_%s" % (index, index + 1)
-            outfe.write(
-                '    <edge id="%s" from="%s" to="%s" speed="%s" numLanes="%s" width="%s" allow="%s"/>\n' % (  # noqa
-                    new_edge_id, junction_ids[index], junction_ids[index + 1],
-                    config.uam_hub_edge_speed, 1, config.uam_hub_edge_width, "taxi pedestrian"))
-            print("creating new edge: \"" + new_edge_id + "\" from " + str(junction_ids[index]) + " to " + junction_ids[
-                index + 1])
-            edge_ids.append(new_edge_id)
-            edge_coord_dict[new_edge_id] = coordinates[int(index / 2)]
-
-        outfe.write("</edges>\n")
-
-    NETCONVERT = sumolib.checkBinary('netconvert')
-    subprocess.call([NETCONVERT,
-                     '-s', net_file,
-                     '-e', edge_patch,
-                     '-o', out_file_path])
-    return edge_ids
+    :param access_point: sidewalk lane and position as returned by find_access_points
+    """
+    bus_stop_id = "uam_hub_stop_" + str(hub_index)
+    parking_area_id = "uam_parking_area" + str(hub_index)
+    #new_pa_start_pos = edge_length / 4 - config.parking_area_length / 2
+    new_pa_start_pos = 20
+    #new_bs_start_pos = 3 * edge_length / 4 - config.bus_stop_length / 2
+    new_bs_start_pos = 20
+
+    access_lane, access_pos = access_point
+    if access_lane == "":
+        print("No nearby sidewalk could be found, aborting creation of access points.")
+        print("couldn't generate uam hub, skipping to next.")
+        return None
+
+    new_pa = ET.Element('parkingArea', {
+        'id': parking_area_id,
+        'lane': "-" + edge + "_0",
+        'startPos': str(new_pa_start_pos),
+        'endPos': str(new_pa_start_pos + config.parking_area_length),
+        'roadsideCapacity': str(config.uam_pa_capacity)
+    })
+    print("creating new parking area : \"" + parking_area_id + "\" for edge " + edge)
+    new_stop = ET.Element('busStop', {
+        'id': bus_stop_id,
+        'lane': edge + "_0",  # uam lane should only have 1 lane
+        'startPos': str(new_bs_start_pos),
+        'endPos': str(new_bs_start_pos + config.bus_stop_length)
+    })
+    print("creating new parking bus stop : \"" + bus_stop_id + "\" for edge " + edge)
+
+    ET.SubElement(new_stop, 'access', {
+        'lane': access_lane,
+        'pos': str(round(access_pos, 2))
+    })
+    print("creating access point for \"" + bus_stop_id + "\": connecting with lane: \"" + access_lane + "\" at "
+          + str(round(access_pos, 2)))
+    return new_pa, new_stop
+
+
+def create_fake_parking_area(edge) -> ET.Element:
+    return ET.Element('parkingArea', {
+        'id': config.fake_parking_area_id,
+        'lane': edge + "_0",
+        'startPos': "0",
+        'endPos': "10",
+        'roadsideCapacity': "0"
+    })
 
 
-def generate_additionals(edges: list[str], add_file, net_file, out_add_file, coordinates: list[(float, float)], pa_edge_ids):
-    tree = ET.parse(add_file)
-    root = tree.getroot()
+def generate_additionals(edges: list[str], add_file, session: NetworkSession, out_add_file, coordinates: list[(float, float)], pa_edge_ids):
+    new_elements = list()
     edge_count = 0
     pa_ids = list()
-    net = sumolib.net.readNet(net_file)
+    access_points = find_access_points(coordinates, session)
     for edge in edges:
-        edge_length = net.getEdge(edge).getLength()
-        bus_stop_id = "uam_hub_stop_" + str(edge_count)
-        parking_area_id = "uam_parking_area" + str(edge_count)
-        #new_pa_start_pos = edge_length / 4 - config.parking_area_length / 2
-        new_pa_start_pos = 20
-        #new_bs_start_pos = 3 * edge_length / 4 - config.bus_stop_length / 2
-        new_bs_start_pos = 20
-        pa_start_pos = config.uam_hub_length / 2 + 1
-
-        closest_edge_with_sidewalk = find_closest_sidewalk(coordinates[edge_count], net_file)
-        if closest_edge_with_sidewalk == "":
-            print("couldn't generate uam hub, skipping to next.")
+        hub_additionals = create_hub_additionals(edge, edge_count, access_points[edge_count])
+        if hub_additionals is None:
             edge_count += 1
             continue
 
         if edge_count == 0:
-            fake_pa = ET.Element('parkingArea', {
-                'id': config.fake_parking_area_id,
-                'lane': edge + "_0",
-                'startPos': "0",
-                'endPos': "10",
-                'roadsideCapacity': "0"
-            })
             pa_ids.append(config.fake_parking_area_id)
-            root.append(fake_pa)
-
-        new_pa = ET.Element('parkingArea', {
-            'id': parking_area_id,
-            'lane': "-" + edge + "_0",
-            'startPos': str(new_pa_start_pos),
-            'endPos': str(new_pa_start_pos + config.parking_area_length),
-            'roadsideCapacity': str(config.uam_pa_capacity)
-        })
-        print("creating new parking area : \"" + parking_area_id + "\" for edge " + edge)
-        pa_ids.append(parking_area_id)
-        '''
-        new_stop = ET.Element('busStop', {
-            'id': bus_stop_id,
-            'lane': edge + "_0",                                # uam lane should only have 1 lane
-            'startPos': str(pa_start_pos + config.parking_area_length + 1),
-            'endPos': str(pa_start_pos + config.parking_area_length + 1 + config.bus_stop_length)
-        })
-        '''
-        new_stop = ET.Element('busStop', {
-            'id': bus_stop_id,
-            'lane': edge + "_0",  # uam lane should only have 1 lane
-            'startPos': str(new_bs_start_pos),
-            'endPos': str(new_bs_start_pos + config.bus_stop_length)
-        })
-        print("creating new parking bus stop : \"" + bus_stop_id + "\" for edge " + edge)
-
-        ET.SubElement(new_stop, 'access', {
-            'lane': closest_edge_with_sidewalk + "_0",
-            'pos': "0"                                          # TODO: optimize
-        })
-        print("creating access point for \"" + bus_stop_id + "\": connecting with edge: \"" + closest_edge_with_sidewalk + "\"")
+            new_elements.append(create_fake_parking_area(edge))
 
-        root.append(new_pa)
-        root.append(new_stop)
+        new_pa, new_stop = hub_additionals
+        pa_ids.append(new_pa.get('id'))
+        new_elements.append(new_pa)
+        new_elements.append(new_stop)
         edge_count += 1
 
     rerouter_element_edges = pa_edge_ids + edges
@@ -219,73 +342,109 @@ def generate_additionals(edges: list[str], add_file, net_file, out_add_file, coo
             'id': pa_id,
             'visible': "1"
         })
-    root.append(rerouter)
+    new_elements.append(rerouter)
     print("creating uam taxi rerouter \"" + config.rerouter_id + "\"")
 
-    tree.write(out_add_file)
-
+    xmlRewriter.insert_elements(add_file, out_add_file, last_elements=new_elements)
 
-def find_closest_sidewalk(point: (float, float), net_file) -> str:
-    net = sumolib.net.readNet(net_file)
-    for i in range(1, 10):
-        nearby_edges = net.getNeighboringEdges(point[0], point[1],
-                                               config.sidewalk_search_radius * i, includeJunctions=False)
-        if len(nearby_edges) > 0:
-            nearby_edges_sorted = sorted([(dist, edge) for edge, dist in nearby_edges], key=lambda x: x[0])
-            for nearby_edge in nearby_edges_sorted:
-                edge_id = nearby_edge[1].getID()
-                if nearby_edge[1].allows("pedestrian"):
-                    if "uam" not in edge_id:    # avoid pointing to uam lane
-                        return edge_id
-        if i == 9:
-            print("No nearby sidewalk could be found, aborting creation of access points.")
-            return ""
 
+def is_sidewalk(edge_index: EdgeIndex, edge_id: str) -> bool:
+    # avoid pointing to uam lane or to the access fix of another hub
+    return edge_index.allows(edge_id, "pedestrian") and "uam" not in edge_id and not edge_id.startswith("hub_con_")
 
-'''
-def calculate_optimal_access_point_distance(from_coord, to_coord, point):
-    A = np.array(from_coord)
-    B = np.array(to_coord)
-    P = np.array(point)
 
-    AB = B - A
-    AP = P - A
-
-    AB_AB = np.dot(AB, AB)
-    AP_AB = np.dot(AP, AB)
-
-    t = AP_AB / AB_AB
-
-    if t < 0.0:
-        closest_point = A
-    elif t > 1.0:
-        closest_point = B
-    else:
-        closest_point = A + t * AB
-
-    # Calculate the distance from to_coord to the closest point
-    distance = np.linalg.norm(closest_point - B)
+def find_sidewalk_lanes(points: list[(float, float)], session: NetworkSession) -> list[list]:
+    """
+    Returns for each point the lanes that allow pedestrians of the closest edge with a sidewalk within 9 times the
+    sidewalk_search_radius, and of the edges which are at most sidewalk_lane_tolerance further away. The edges are
+    visited in order of their distance, so the search stops at the first sidewalk.
+    """
+    edge_index = session.edge_index
+    nearest_edges = edge_index.get_nearest_edges(points, lambda edge_id: is_sidewalk(edge_index, edge_id),
+                                                 9 * config.sidewalk_search_radius, sidewalk_lane_tolerance)
+    return [[lane for edge_id, _ in edges for lane in session.net.getEdge(edge_id).getLanes() if lane.allows("pedestrian")]
+            for edges in nearest_edges]
 
-    return distance
-'''
 
+def find_access_points(points: list[(float, float)], session: NetworkSession) -> list[(str, float)]:
+    """
+    Returns the sidewalk lane and the position on it closest to each point, ("", 0.0) if there is no sidewalk nearby.
+    The points are projected onto every segment of their candidate lane shapes in one pass. Results are kept in the
+    session, as every hub is looked up for its access point and its access fix.
+    """
+    new_points = [point for point in dict.fromkeys(points) if point not in session.access_points]
+    lane_ids = list()
+    segment_points, segment_lanes, starts, ends, offsets = list(), list(), list(), list(), list()
+    for point_index, (point, lanes) in enumerate(zip(new_points, find_sidewalk_lanes(new_points, session))):
+        session.access_points[point] = ("", 0.0)
+        for lane in lanes:
+            shape = [coord[:2] for coord in lane.getShape()]
+            offset = 0.0
+            for start, end in zip(shape[:-1], shape[1:]):
+                segment_points.append(point_index)
+                segment_lanes.append(len(lane_ids))
+                starts.append(start)
+                ends.append(end)
+                offsets.append(offset)
+                offset += math.dist(start, end)
+            # positions on a lane are measured in its length, which may differ from the length of its shape
+            lane_ids.append((lane.getID(), lane.getLength() / offset if offset > 0 else 0.0))
+    if len(segment_points) > 0:
+        segment_points = np.array(segment_points)
+        starts, ends = np.array(starts, dtype=float), np.array(ends, dtype=float)
+        positions = np.array(new_points, dtype=float)[segment_points]
+        directions = ends - starts
+        squared_lengths = np.einsum('ij,ij->i', directions, directions)
+        fractions = np.einsum('ij,ij->i', positions - starts, directions) / np.where(squared_lengths > 0, squared_lengths, 1)
+        fractions = np.clip(fractions, 0, 1)
+        distances = np.hypot(*(starts + fractions[:, None] * directions - positions).T)
+        lane_positions = np.array(offsets) + fractions * np.sqrt(squared_lengths)
+        # the closest segment of each point comes first
+        order = np.lexsort((distances, segment_points))
+        first = order[np.unique(segment_points[order], return_index=True)[1]]
+        for segment in first:
+            lane_id, scale = lane_ids[segment_lanes[segment]]
+            session.access_points[new_points[segment_points[segment]]] = (lane_id, float(lane_positions[segment] * scale))
+    return [session.access_points[point] for point in points]
+
+
+def relocate_access_points(points: list[(float, float)], access_points: list[(str, float)], net) -> list[(str, float)]:
+    """
+    Returns the access points with their positions projected anew onto their sidewalk lanes in the given network.
+    netconvert rebuilds the junctions at the ends of a sidewalk that gets an access fix, which shortens the sidewalk,
+    so positions found in the original network can lie behind the end of the lane.
+    """
+    relocated = list()
+    for point, (lane_id, pos) in zip(points, access_points):
+        if lane_id == "" or not net.hasEdge(lane_id.rsplit("_", 1)[0]):
+            relocated.append((lane_id, pos))
+            continue
+        lane = net.getLane(lane_id)
+        shape = [coord[:2] for coord in lane.getShape()]
+        shape_length = sum(math.dist(start, end) for start, end in zip(shape[:-1], shape[1:]))
+        offset = sumolib.geomhelper.polygonOffsetWithMinimumDistanceToPoint(point, shape)
+        scale = lane.getLength() / shape_length if shape_length > 0 else 0.0
+        relocated.append((lane_id, min(max(offset * scale, 0.0), lane.getLength())))
+    return relocated
 
-def disallow_taxis(net_file, out_net_file):
-    sumo_home = os.environ.get('SUMO_HOME')
-    if sumo_home is None:
-        raise EnvironmentError("SUMO_HOME environment variable is not set.")
 
-    subprocess.call(["python",
-                     f"{sumo_home}/tools/net/patchVClasses.py",
-                     net_file,
-                     "--disallow", "taxi",
-                     "-o", out_net_file])
-    print("disallowed taxis on all edges of the network")
+def disallow_taxis(net, patch: NetworkPatch):
+    """
+    Removes taxi from the permissions of every lane, so that Air Taxis can only use the uam network.
+    Same result as calling patchVClasses.py --disallow taxi, but applied together with all other changes.
+    """
+    lane_count = 0
+    for edge in net.getEdges():
+        for lane in edge.getLanes():
+            allowed = set(lane.getPermissions()).difference({"taxi"})
+            if allowed != lane.getPermissions():
+                allowed = allowed.difference(sumolib.net.lane.SUMO_VEHICLE_CLASSES_DEPRECATED)
+                patch.set_lane_permissions(edge.getID(), lane.getIndex(), " ".join(allowed))
+                lane_count += 1
+    print("disallowing taxis on " + str(lane_count) + " lanes of the network")
 
 
 def add_uam_taxi_vclass(route_file, out_route_file):
-    tree = ET.parse(route_file)
-    root = tree.getroot()
     uam_taxi = ET.Element('vType', {    # TODO: width, height, length; add behind aircraft: 'width': str(config.uam_taxi_width), etc
         'id': "uamtaxi",
         'vClass': "taxi",
@@ -327,113 +486,81 @@ def add_uam_taxi_vclass(route_file, out_route_file):
         'value': str(config.uam_drop_off_duration)
     })
     print("adding new vehicle type \"uamtaxi\"")
-    root.insert(0, uam_taxi)
-    tree.write(out_route_file)
+    # route files can be hundreds of MB, so the vType is inserted while copying the file instead of parsing it
+    xmlRewriter.insert_elements(route_file, out_route_file, first_elements=[uam_taxi])
 
 
-def connect_hubs(net_file, out_net_file, edge_coord_dict):
+def connect_hubs(patch: NetworkPatch, hub_junctions: dict[str, (str, str)], edge_coord_dict, existing_connectors=None):
     """
     Chunks of this function have been taken from Jakob Erdmann's buildFullGraph.py, authored 2024-05-02
-    """
-    net = sumolib.net.readNet(net_file)
-    base_edges = [e for e in net.getEdges() if e.allows("taxi") and "uam" in e.getID()]
-    prefix = net_file
-    if prefix.endswith(".net.xml.gz"):
-        prefix = prefix[:-11]
-    elif prefix.endswith(".net.xml"):
-        prefix = prefix[:-8]
-
-    edge_patch = prefix + ".patch.edg.xml"
-    con_patch = prefix + ".patch.con.xml"
-    with open(edge_patch, 'w') as outfe, open(con_patch, 'w') as outfc:
-        sumolib.writeXMLHeader(outfe, "$Id$", "edges")
-        sumolib.writeXMLHeader(outfc, "$Id$", "connections")
-        for e1 in base_edges:
-            for e2 in base_edges:
-                if e1 != e2 and e2 not in e1.getOutgoing():
-                    if not in_radius(edge_coord_dict[e1.getID()], edge_coord_dict[e2.getID()]):
-                        continue
-                    new_eid = "%s_%s" % (e1.getToNode().getID(), e2.getFromNode().getID())
-                    width = config.uam_con_edge_width if config.uam_con_edge_width is not None else e1.getLanes()[-1].getWidth()
-                    outfe.write('    <edge id="%s" from="%s" to="%s" speed="%s" numLanes="%s" width="%s" allow="%s"/>\n' % (  # noqa
-                        new_eid, e1.getToNode().getID(), e2.getFromNode().getID(),
-                        config.uam_con_edge_speed, 1, width, "taxi"))
-                    print("creating edge from \"" + e1.getToNode().getID() + "\" to \"" + e2.getFromNode().getID() + "\"")
-                    outfc.write('    <connection from="%s" to="%s" fromLane="0" toLane="0"/>\n' % (e1.getID(), new_eid))
-                    print("creating connection from \"" + e1.getID() + "\" to \"" + new_eid + "\"")
-                    outfc.write('    <connection from="%s" to="%s" fromLane="0" toLane="0"/>\n' % (new_eid, e2.getID()))
-                    print("creating connection from \"" + new_eid + "\" to \"" + e2.getID() + "\"")
-
-        outfe.write("</edges>\n")
-        outfc.write("</connections>\n")
-
-    NETCONVERT = sumolib.checkBinary('netconvert')
-    subprocess.call([NETCONVERT,
-                     '-s', net_file,
-                     '-e', edge_patch,
-                     '-x', con_patch,
-                     '-o', out_net_file])
-
-
-def in_radius(point1: (float, float), point2: (float, float)) -> bool:
-    if math.dist(point1, point2) <= config.uam_hub_connection_radius:
-        return True
-    else:
-        return False
 
+    Connects the hubs in both directions along the pairs of the configured uam_hub_topology.
 
-def create_reverse_directions(net_file, out_net_file, junction_ids):
+    :param hub_junctions: from and to junction of each hub edge
+    :param existing_connectors: connector edges of an existing uam network between the hubs in hub_junctions. They
+                                are kept if they are part of the topology and deleted otherwise
     """
-    Chunks of this function have been taken from Jakob Erdmann's buildFullGraph.py, authored 2024-05-02
+    width = config.uam_con_edge_width if config.uam_con_edge_width is not None else config.uam_hub_edge_width
+    neighbors = hubTopology.get_hub_neighbors({edge: edge_coord_dict[edge] for edge in hub_junctions},
+                                              config.uam_hub_topology, config.uam_hub_connection_radius,
+                                              config.uam_hub_topology_neighbors)
+    hub_order = {edge: index for index, edge in enumerate(hub_junctions)}
+    connectors = set()
+    new_connector_count = 0
+    for e1 in hub_junctions:
+        for e2 in sorted(neighbors[e1], key=hub_order.get):
+            from_junction = hub_junctions[e1][1]
+            to_junction = hub_junctions[e2][0]
+            new_eid = "%s_%s" % (from_junction, to_junction)
+            connectors.add(new_eid)
+            if existing_connectors is not None and new_eid in existing_connectors:
+                continue
+            patch.add_edge(new_eid, from_junction, to_junction, config.uam_con_edge_speed, width, "taxi")
+            patch.add_connection(e1, new_eid)
+            patch.add_connection(new_eid, e2)
+            new_connector_count += 1
+    deleted_connectors = sorted(set(existing_connectors or ()) - connectors)
+    for edge_id in deleted_connectors:
+        patch.delete_edge(edge_id)
+    print("connecting " + str(len(hub_junctions)) + " uam hubs with the " + config.uam_hub_topology + " topology: "
+          + str(len(connectors)) + " connection edges, " + str(new_connector_count) + " new, "
+          + str(len(deleted_connectors)) + " deleted")
+
+
+def get_hub_connectors(net, hub_junctions: dict[str, (str, str)]) -> set[str]:
     """
-    prefix = net_file
-    if prefix.endswith(".net.xml.gz"):
-        prefix = prefix[:-11]
-    elif prefix.endswith(".net.xml"):
-        prefix = prefix[:-8]
+    Returns the ids of the edges connecting the given hubs of a uam network with each other.
+    """
+    from_junctions = {junctions[0] for junctions in hub_junctions.values()}
+    connectors = set()
+    for edge, junctions in hub_junctions.items():
+        for connector in net.getNode(junctions[1]).getOutgoing():
+            if connector.getToNode().getID() in from_junctions and connector.getToNode().getID() != junctions[0]:
+                connectors.add(connector.getID())
+    return connectors
 
-    edge_patch = prefix + ".patch.edg.xml"
-    con_patch = prefix + ".patch.con.xml"
 
+def create_reverse_directions(patch: NetworkPatch, junction_ids, first_index=0) -> list[str]:
+    """
+    Chunks of this function have been taken from Jakob Erdmann's buildFullGraph.py, authored 2024-05-02
+    """
     reverse_edge_ids = list()
-
-    with open(edge_patch, 'w') as outfe, open(con_patch, 'w') as outfc:
-        sumolib.writeXMLHeader(outfe, "$Id$", "edges")
-        sumolib.writeXMLHeader(outfc, "$Id$", "connections")
-        for index in range(0, len(junction_ids), 2):
-            edge_id = "uam_%s_%s" % (index, index + 1)
-            reverse_edge_id = "-" + edge_id
-            outfe.write(
-                '    <edge id="%s" from="%s" to="%s" speed="%s" numLanes="%s" width="%s" allow="%s"/>\n' % (  # noqa
-                    reverse_edge_id, junction_ids[index + 1], junction_ids[index],
-                    config.uam_hub_edge_speed, 1, config.uam_con_edge_width, "taxi"))
-            print("creating edge from \"" + junction_ids[index + 1] + "\" to \"" + junction_ids[index] + "\"")
-            outfc.write('    <connection from="%s" to="%s" fromLane="0" toLane="0"/>\n' % (reverse_edge_id, edge_id))
-            print("creating connection from \"" + reverse_edge_id + "\" to \"" + edge_id + "\"")
-            outfc.write('    <connection from="%s" to="%s" fromLane="0" toLane="0"/>\n' % (edge_id, reverse_edge_id))
-            print("creating connection from \"" + edge_id + "\" to \"" + reverse_edge_id + "\"")
-
-            reverse_edge_ids.append(reverse_edge_id)
-
-        outfe.write("</edges>\n")
-        outfc.write("</connections>\n")
-
-    NETCONVERT = sumolib.checkBinary('netconvert')
-    subprocess.call([NETCONVERT,
-                     '-s', net_file,
-                     '-e', edge_patch,
-                     '-x', con_patch,
-                     '-o', out_net_file])
-
-    if os.path.exists(con_patch):
-        os.remove(con_patch)
-    else:
-        print(f"{con_patch} does not exist.")
-
+    for index in range(0, len(junction_ids), 2):
+        edge_id = "uam_%s_%s" % (first_index + index, first_index + index + 1)
+        reverse_edge_id = "-" + edge_id
+        patch.add_edge(reverse_edge_id, junction_ids[index + 1], junction_ids[index],
+                       config.uam_hub_edge_speed, config.uam_con_edge_width, "taxi")
+        print("creating edge from \"" + junction_ids[index + 1] + "\" to \"" + junction_ids[index] + "\"")
+        patch.add_connection(reverse_edge_id, edge_id)
+        print("creating connection from \"" + reverse_edge_id + "\" to \"" + edge_id + "\"")
+        patch.add_connection(edge_id, reverse_edge_id)
+        print("creating connection from \"" + edge_id + "\" to \"" + reverse_edge_id + "\"")
+
+        reverse_edge_ids.append(reverse_edge_id)
     return reverse_edge_ids
 
 
-def create_new_sumocfg(sumocfg_file, net_file, rou_files, add_files, hub_count):
+def create_new_sumocfg(sumocfg_file, net_file, rou_files, add_files, hub_count, out_dir, base_name=None) -> str:
     tree = ET.parse(sumocfg_file)
     root = tree.getroot()
 
@@ -443,71 +570,45 @@ def create_new_sumocfg(sumocfg_file, net_file, rou_files, add_files, hub_count):
     # root.find('.//additional-files').set('value', ",".join(add_files))
     # root.find('.//additional-files').set('value', add_files)
 
-    tree.write(os.path.join(os.path.dirname(sumocfg_file), str(hub_count) + "_uam_hubs_" + str(os.path.basename(sumocfg_file))))
+    if base_name is None:
+        base_name = os.path.basename(sumocfg_file)
+    new_sumocfg_file = os.path.join(out_dir, str(hub_count) + "_uam_hubs_" + base_name)
+    tree.write(new_sumocfg_file)
+    return new_sumocfg_file
 
 
-def connect_to_network(net_file, out_file_path, junction_ids, coordinates):
+def connect_to_network(patch: NetworkPatch, session: NetworkSession, junction_ids, coordinates, first_index=0):
 
     # as of 20.08.2024, there is a problem with routing using access elements
     # temporary fix: add pedestrian lanes to road network to allow routing to UAM network
-
-    net = sumolib.net.readNet(net_file)
-
-    prefix = net_file
-    if prefix.endswith(".net.xml.gz"):
-        prefix = prefix[:-11]
-    elif prefix.endswith(".net.xml"):
-        prefix = prefix[:-8]
-
-    edge_patch = prefix + ".patch.edg.xml"
-
-    with open(edge_patch, 'w') as outfe:
-        sumolib.writeXMLHeader(outfe, "$Id$", "edges")
-        for index in range(0, len(junction_ids), 2):
-
-            for i in range(1, 10):
-                nearby_edges = net.getNeighboringEdges(coordinates[int(index / 2)][0], coordinates[int(index / 2)][1],
-                                                       config.sidewalk_search_radius * i, includeJunctions=False)
-                if len(nearby_edges) > 0:
-                    nearby_edges_sorted = sorted([(dist, edge) for edge, dist in nearby_edges], key=lambda x: x[0])
-                    for nearby_edge in nearby_edges_sorted:
-                        edge_id = nearby_edge[1].getID()
-                        if nearby_edge[1].allows("pedestrian"):
-                            if "uam" not in edge_id:  # avoid pointing to uam lane
-                                from_junction_id = net.getEdge(edge_id).getFromNode().getID()
-                                temp_edge_id = "hub_con_%s_%s" % (index, from_junction_id)
-                                outfe.write(
-                                    '    <edge id="%s" from="%s" to="%s" speed="%s" numLanes="%s" width="%s" allow="%s"/>\n' % (
-                                        # noqa
-                                        temp_edge_id, from_junction_id, junction_ids[index],
-                                        100 / 3.6, 1, 2, "pedestrian"))
-                                print(
-                                    "creating new edge: \"" + temp_edge_id + "\" from " + str(junction_ids[index]) + " to " +
-                                    from_junction_id)
-                                break
-                    else:
-                        continue
-                    break
-                if i == 9:
-                    print("No nearby sidewalk could be found, aborting creation of access fix.")
-
-        outfe.write("</edges>\n")
-
-    NETCONVERT = sumolib.checkBinary('netconvert')
-    subprocess.call([NETCONVERT,
-                     '-s', net_file,
-                     '-e', edge_patch,
-                     '-o', out_file_path])
-
-    if os.path.exists(edge_patch):
-        os.remove(edge_patch)
-    else:
-        print(f"{edge_patch} does not exist.")
-
-
-def generate_hubs(coordinates: list[(float, float)]):
-    sumocfg_path = os.path.normpath(options.file_path)
+    access_points = find_access_points(coordinates, session)
+    for index in range(0, len(junction_ids), 2):
+        lane_id, pos = access_points[int(index / 2)]
+        if lane_id == "":
+            print("No nearby sidewalk could be found, aborting creation of access fix.")
+            continue
+        # connect the end of the sidewalk which is closer to the access point
+        lane = session.net.getLane(lane_id)
+        if pos <= lane.getLength() / 2:
+            from_junction_id = lane.getEdge().getFromNode().getID()
+        else:
+            from_junction_id = lane.getEdge().getToNode().getID()
+        temp_edge_id = "hub_con_%s_%s" % (first_index + index, from_junction_id)
+        patch.add_edge(temp_edge_id, from_junction_id, junction_ids[index], 100 / 3.6, 2, "pedestrian")
+        print("creating new edge: \"" + temp_edge_id + "\" from " + str(junction_ids[index]) + " to " + from_junction_id)
+
+
+def generate_hubs(sumocfg_path, coordinates: list[(float, float)], out_dir=None, use_cache=True) -> str:
+    """
+    Creates a copy of the scenario with uam hubs at the given coordinates and returns the path of its new sumocfg.
+    All new files are written to out_dir, by default the directory of the sumocfg.
+    The access points, the network, the additionals and the routes are taken from the hub stage cache if the stage
+    was already run with the same inputs, see hubCache.py.
+    """
+    sumocfg_path = os.path.normpath(sumocfg_path)
     sumocfg_dir_path = os.path.dirname(sumocfg_path)
+    if out_dir is None:
+        out_dir = sumocfg_dir_path
     net_path = os.path.join(os.path.dirname(sumocfg_path),
                             ET.parse(sumocfg_path).getroot().find(".//net-file").get("value").split("/")[0])
     net_file = ET.parse(sumocfg_path).getroot().find(".//net-file").get("value").split("/")[0]
@@ -532,72 +633,362 @@ def generate_hubs(coordinates: list[(float, float)]):
 
     edge_coord_dict = dict()
 
-    original_net_path = net_path
+    test_net_path = os.path.join(out_dir, str(int(len(coordinates))) + "_uam_hubs_" + str(os.path.basename(net_path)))
+    test_rou_path = os.path.join(out_dir, str(int(len(coordinates))) + "_uam_hubs_" + str(os.path.basename(route_path)))
+    test_add_path = os.path.join(out_dir, str(int(len(coordinates))) + "_uam_hubs_" + str(os.path.basename(add_path)))
+
+    # all changes to the network are collected first and applied with a single netconvert call. Until then, every
+    # stage looks up edges in the original network, which is read only once and only if a stage is not cached
+    session = NetworkSession(net_path)
+    cache = HubStageCache(enabled=use_cache)
+    net_digest = file_digest(net_path)
+    access_key = cache.get_key("access", {"net": net_digest, "coordinates": coordinates})
+    access_points = cache.load_value("access", access_key)
+    if access_points is None:
+        access_points = find_access_points(coordinates, session)
+        cache.store_value("access", access_key, access_points, str(len(coordinates)) + " hubs")
+    session.access_points.update(zip(coordinates, [tuple(access_point) for access_point in access_points]))
+    # later stages depend on the access points, not on how they were found
+    access_digest = value_digest(access_points)
+
+    network_key = cache.get_key("network", {"net": net_digest, "coordinates": coordinates, "access": access_digest,
+                                            "netconvert": get_sumo_version(sumolib.checkBinary('netconvert'))})
+    if cache.restore("network", network_key, test_net_path):
+        new_edges = ["uam_%s_%s" % (index, index + 1) for index in range(0, 2 * len(coordinates), 2)]
+        pa_edge_ids = ["-" + edge for edge in new_edges]
+    else:
+        patch = NetworkPatch()
+        disallow_taxis(session.net, patch)
+        junction_ids = generate_junctions(patch, coordinates)
+        new_edges = connect_junctions(patch, junction_ids, edge_coord_dict, coordinates)
+        hub_junctions = {edge: (junction_ids[2 * index], junction_ids[2 * index + 1]) for index, edge in enumerate(new_edges)}
+        connect_hubs(patch, hub_junctions, edge_coord_dict)
+        pa_edge_ids = create_reverse_directions(patch, junction_ids)
+        # temporary fix because of access element routing problem
+        connect_to_network(patch, session, junction_ids, coordinates)
+        patch.apply(net_path, test_net_path)
+        cache.store("network", network_key, test_net_path, os.path.basename(net_path) + ", " + str(len(coordinates)) + " hubs")
+
+    additionals_key = cache.get_key("additionals", {"additionals": file_digest(add_path), "coordinates": coordinates,
+                                                    "access": access_digest, "network": network_key})
+    if not cache.restore("additionals", additionals_key, test_add_path):
+        # the access positions have to fit the sidewalks of the new network
+        session.invalidate(test_net_path)
+        session.access_points.update(zip(coordinates, relocate_access_points(coordinates, access_points, session.net)))
+        generate_additionals(new_edges, add_path, session, test_add_path, coordinates, pa_edge_ids)
+        cache.store("additionals", additionals_key, test_add_path, os.path.basename(add_path) + ", " + str(len(coordinates)) + " hubs")
+
+    routes_key = cache.get_key("routes", {"routes": file_digest(route_path)})
+    if not cache.restore("routes", routes_key, test_rou_path):
+        add_uam_taxi_vclass(route_path, test_rou_path)
+        cache.store("routes", routes_key, test_rou_path, os.path.basename(route_path))
 
-    #new_dir_path = os.path.join(sumocfg_dir_path, "uamHubs")
+    route_files[0] = os.path.basename(test_rou_path)
+    add_files[0] = os.path.basename(test_add_path)
+    return create_new_sumocfg(sumocfg_path, os.path.basename(test_net_path), route_files, add_files,
+                              int(len(coordinates)), out_dir)
 
-    #if not os.path.exists(new_dir_path):
-    #    os.makedirs(new_dir_path)
-    test_net_path = os.path.join(sumocfg_dir_path, str(int(len(coordinates))) + "_uam_hubs_" + str(os.path.basename(net_path)))
-    test_rou_path = os.path.join(sumocfg_dir_path, str(int(len(coordinates))) + "_uam_hubs_" + str(os.path.basename(route_path)))
-    test_add_path = os.path.join(sumocfg_dir_path, str(int(len(coordinates))) + "_uam_hubs_" + str(os.path.basename(add_path)))
 
-    new_net_path = os.path.join(os.path.dirname(net_path), "no_taxis_" + str(os.path.basename(net_path)))
-    #disallow_taxis(net_path, new_net_path)
-    disallow_taxis(net_path, test_net_path)
-    net_path = new_net_path
+def get_existing_hubs(net) -> dict[int, (float, float)]:
+    """
+    Returns the location of every uam hub of a network created by generate_hubs by hub index. The location is the
+    middle between the two junctions of the hub.
+    """
+    hubs = dict()
+    for edge in net.getEdges():
+        match = hub_edge_pattern.match(edge.getID())
+        if match is None:
+            continue
+        from_coord = edge.getFromNode().getCoord()
+        to_coord = edge.getToNode().getCoord()
+        hubs[int(match.group("from_index")) // 2] = ((from_coord[0] + to_coord[0]) / 2, (from_coord[1] + to_coord[1]) / 2)
+    return hubs
 
-    new_net_path = os.path.join(os.path.dirname(net_path), "added_junctions_" + str(os.path.basename(net_path)))
-    #junction_ids = generate_junctions(net_path, coordinates, new_net_path)
-    junction_ids = generate_junctions(test_net_path, coordinates, test_net_path)
-    net_path = new_net_path
 
-    new_net_path = os.path.join(os.path.dirname(net_path), "added_hub_edges_" + str(os.path.basename(net_path)))
-    #new_edges = connect_junctions(net_path, junction_ids, new_net_path, edge_coord_dict, coordinates)
-    new_edges = connect_junctions(test_net_path, junction_ids, test_net_path, edge_coord_dict, coordinates)
-    net_path = new_net_path
+def remove_hubs(patch: NetworkPatch, net, hub_indices: list[int]):
+    """
+    Deletes the junctions of the hubs together with every edge connected to them: the hub edge and its reverse
+    direction, the connections to other hubs and the access fix to the road network.
+    """
+    for hub_index in hub_indices:
+        junction_ids = ["uam_hub_junction_%s_0" % hub_index, "uam_hub_junction_%s_1" % hub_index]
+        edge_ids = set()
+        for junction_id in junction_ids:
+            node = net.getNode(junction_id)
+            edge_ids.update(edge.getID() for edge in node.getIncoming() + node.getOutgoing())
+        for edge_id in sorted(edge_ids):
+            patch.delete_edge(edge_id)
+        for junction_id in junction_ids:
+            patch.delete_node(junction_id)
+        print("removing uam hub " + str(hub_index) + " with " + str(len(edge_ids)) + " edges")
+
+
+def update_additionals(add_file, out_add_file, session: NetworkSession, removed_hub_indices: list[int],
+                       new_edges: list[str], first_hub_index, coordinates: list[(float, float)], hub_edges: list[str]):
+    """
+    Removes the parking areas, bus stops and rerouter entries of removed hubs and adds those of new hubs to the
+    additionals of an existing uam scenario.
 
-    new_net_path = os.path.join(os.path.dirname(net_path), "added_hub_connections_" + str(os.path.basename(net_path)))
-    connect_hubs(test_net_path, test_net_path, edge_coord_dict)
-    # connect_hubs(net_path, new_net_path, edge_coord_dict)
-    net_path = new_net_path
+    :param hub_edges: the hub edges of the updated scenario, the first one takes over the fake parking area
+    """
+    removed_edges = {"uam_%s_%s" % (2 * hub_index, 2 * hub_index + 1) for hub_index in removed_hub_indices}
+    removed_ids = set()
+    for hub_index in removed_hub_indices:
+        removed_ids.update({"uam_parking_area" + str(hub_index), "uam_hub_stop_" + str(hub_index)})
+    new_additionals = list()
+    access_points = find_access_points(coordinates, session)
+    for index, edge in enumerate(new_edges):
+        hub_additionals = create_hub_additionals(edge, first_hub_index + index, access_points[index])
+        if hub_additionals is not None:
+            new_additionals.extend(hub_additionals)
+    rerouter_found = list()
+
+    def rewrite(element: ET.Element) -> list[ET.Element]:
+        if element.get('id') in removed_ids:
+            print("removing " + element.tag + " \"" + element.get('id') + "\"")
+            return []
+        # the fake parking area has to stay on a hub edge
+        if element.get('id') == config.fake_parking_area_id and element.get('lane').rsplit("_", 1)[0] in removed_edges:
+            element.set('lane', hub_edges[0] + "_0")
+            print("moving \"" + config.fake_parking_area_id + "\" to edge " + hub_edges[0])
+        if element.tag != 'rerouter' or element.get('id') != config.rerouter_id:
+            return [element]
+
+        rerouter_found.append(element.get('id'))
+        interval = element.find('interval')
+        for reroute in list(interval):
+            if reroute.get('id') in removed_ids:
+                interval.remove(reroute)
+        for new_pa in new_additionals[::2]:
+            ET.SubElement(interval, 'parkingAreaReroute', {
+                'id': new_pa.get('id'),
+                'visible': "1"
+            })
+        rerouter_edges = [edge for edge in element.get('edges').split() if edge.lstrip("-") not in removed_edges]
+        element.set('edges', " ".join([edge for edge in rerouter_edges if edge.startswith("-")] + ["-" + edge for edge in new_edges]
+                                      + [edge for edge in rerouter_edges if not edge.startswith("-")] + new_edges))
+        # keep the rerouter behind the stops, as in a newly generated scenario
+        return new_additionals + [element]
 
-    new_net_path = os.path.join(os.path.dirname(original_net_path), "uam_" + str(os.path.basename(original_net_path)))
-    pa_edge_ids = create_reverse_directions(test_net_path, test_net_path, junction_ids)
-    #create_reverse_directions(net_path, new_net_path, junction_ids)
+    xmlRewriter.rewrite_elements(add_file, out_add_file, rewrite)
+    if len(rerouter_found) == 0:
+        raise RuntimeError("\"" + add_file + "\" has no \"" + config.rerouter_id + "\", it was not created by generate_hubs")
 
-    new_add_path = os.path.join(os.path.dirname(net_path), "added_additionals_" + str(os.path.basename(add_path)))
-    #generate_additionals(new_edges, add_path, test_net_path, new_add_path, coordinates)
-    generate_additionals(new_edges, add_path, test_net_path, test_add_path, coordinates, pa_edge_ids)
 
-    # temporary fix because of access element routing problem
-    net_path = new_net_path
-    new_net_path = os.path.join(os.path.dirname(original_net_path), "fixed_uam_" + str(os.path.basename(original_net_path)))
-    #connect_to_network(net_path, new_net_path, junction_ids, coordinates)
-    connect_to_network(test_net_path, test_net_path, junction_ids, coordinates)
+def get_invalid_stops(net, add_file) -> list[str]:
+    """
+    Returns the ids of all uam parking areas and bus stops which do not fit on their lane. netconvert recomputes the
+    shape of every junction whose edges changed, which can shorten a hub edge that has a connection to another hub in
+    almost the same direction.
+    """
+    invalid_stops = list()
+    with xmlRewriter.open_xml(add_file) as in_file:
+        for _, element in ET.iterparse(in_file):
+            if element.tag in ('parkingArea', 'busStop') and "uam" in element.get('lane'):
+                if float(element.get('endPos')) > net.getLane(element.get('lane')).getLength():
+                    invalid_stops.append(element.get('id'))
+    return invalid_stops
 
-    new_route_path = os.path.join(os.path.dirname(route_path), "modified_" + str(os.path.basename(route_path)))
-    #add_uam_taxi_vclass(route_path, new_route_path)
-    add_uam_taxi_vclass(route_path, test_rou_path)
 
-    #route_files[0] = os.path.basename(new_route_path)
-    route_files[0] = os.path.basename(test_rou_path)
-    #add_files[0] = os.path.basename(new_add_path)
-    add_files[0] = os.path.basename(test_add_path)
-    #create_new_sumocfg(sumocfg_path, os.path.basename(new_net_path), route_files, add_files)
-    create_new_sumocfg(sumocfg_path, os.path.basename(test_net_path), route_files, add_files, int(len(coordinates)))
+def update_hubs(sumocfg_path, coordinates: list[(float, float)], removed_hub_indices: list[int], out_dir=None) -> str:
+    """
+    Adds hubs at the given coordinates to an existing uam scenario created by generate_hubs and removes the hubs with
+    the given indices. Only the affected junctions, edges, parking areas, bus stops and rerouter entries are patched,
+    the remaining hubs keep their indices. Connections between remaining hubs which are no longer part of the
+    topology are deleted. Returns the path of the new sumocfg.
+    """
+    sumocfg_path = os.path.normpath(sumocfg_path)
+    sumocfg_dir_path = os.path.dirname(sumocfg_path)
+    if out_dir is None:
+        out_dir = sumocfg_dir_path
+    if not (os.path.isfile(sumocfg_path)):
+        print("Not a valid sumocfg path.")
+        return
+    root = ET.parse(sumocfg_path).getroot()
+    net_file = root.find(".//net-file").get("value")
+    route_files = root.find(".//route-files").get("value").split(",")
+    add_files = root.find(".//additional-files").get("value").split(",")
+    net_path = os.path.join(sumocfg_dir_path, net_file)
+    add_path = os.path.join(sumocfg_dir_path, add_files[0])
+    if not (os.path.isfile(net_path)):
+        print("Not a valid net path.")
+        return
+    if not (os.path.isfile(add_path)):
+        print("Not a valid additionals path.")
+        return
+
+    session = NetworkSession(net_path)
+    hubs = get_existing_hubs(session.net)
+    if len(hubs) == 0:
+        print("\"" + sumocfg_path + "\" contains no uam hubs, generate them with coordinates instead.")
+        return
+    unknown_hub_indices = sorted(set(removed_hub_indices) - set(hubs))
+    if len(unknown_hub_indices) > 0:
+        print("Unknown uam hubs " + str(unknown_hub_indices) + ". Existing hubs: " + str(sorted(hubs)))
+        return
+    remaining_hubs = {hub_index: location for hub_index, location in hubs.items() if hub_index not in removed_hub_indices}
+    hub_count = len(remaining_hubs) + len(coordinates)
+    if hub_count == 0:
+        print("Removing all uam hubs is not supported, use the original scenario instead.")
+        return
+
+    invalid_stops = set(get_invalid_stops(session.net, add_path))
+    patch = NetworkPatch()
+    remove_hubs(patch, session.net, sorted(set(removed_hub_indices)))
+
+    # new hubs get new indices, so that the ids of the remaining hubs do not change
+    first_hub_index = max(hubs) + 1
+    edge_coord_dict = dict()
+    hub_junctions = dict()
+    for hub_index, location in sorted(remaining_hubs.items()):
+        edge = "uam_%s_%s" % (2 * hub_index, 2 * hub_index + 1)
+        edge_coord_dict[edge] = location
+        hub_junctions[edge] = ("uam_hub_junction_%s_0" % hub_index, "uam_hub_junction_%s_1" % hub_index)
+    junction_ids = generate_junctions(patch, coordinates, first_hub_index,
+                                      get_centre(list(remaining_hubs.values()) + coordinates))
+    new_edges = connect_junctions(patch, junction_ids, edge_coord_dict, coordinates, 2 * first_hub_index)
+    hub_junctions.update({edge: (junction_ids[2 * index], junction_ids[2 * index + 1]) for index, edge in enumerate(new_edges)})
+    existing_connectors = get_hub_connectors(session.net, {edge: junctions for edge, junctions in hub_junctions.items()
+                                                           if edge not in new_edges})
+    connect_hubs(patch, hub_junctions, edge_coord_dict, existing_connectors)
+    create_reverse_directions(patch, junction_ids, 2 * first_hub_index)
+
+    access_points = find_access_points(coordinates, session)
+    connect_to_network(patch, session, junction_ids, coordinates, 2 * first_hub_index)
+    new_net_path = os.path.join(out_dir, str(hub_count) + "_uam_hubs_"
+                                + hub_file_prefix_pattern.sub("", os.path.basename(net_path)))
+    patch.apply(net_path, new_net_path)
+    session.invalidate(new_net_path)
+    # the access positions have to fit the sidewalks of the new network
+    session.access_points.update(zip(coordinates, relocate_access_points(coordinates, access_points, session.net)))
+    base_add_file = hub_file_prefix_pattern.sub("", os.path.basename(add_path))
+    new_add_path = os.path.join(out_dir, str(hub_count) + "_uam_hubs_" + base_add_file)
+    update_additionals(add_path, new_add_path, session, removed_hub_indices, new_edges, first_hub_index, coordinates,
+                       list(hub_junctions))
+    new_invalid_stops = [stop for stop in get_invalid_stops(session.net, new_add_path) if stop not in invalid_stops]
+    if len(new_invalid_stops) > 0:
+        print("The hub edges of " + ", ".join(new_invalid_stops) + " became too short, generate the scenario with all "
+              "coordinates instead.")
+        return
+
+    # the routes already use the uam taxi vClass and are referenced unchanged
+    add_files[0] = os.path.basename(new_add_path)
+    return create_new_sumocfg(sumocfg_path, os.path.basename(new_net_path), route_files, add_files, hub_count, out_dir,
+                              hub_file_prefix_pattern.sub("", os.path.basename(sumocfg_path)))
+
+
+def read_hub_layouts(layout_file) -> dict[str, list[(float, float)]]:
+    """
+    Reads a file like uam_hub_locations.txt. Each line holds the hub coordinates of one layout (x first, followed by y),
+    followed by at least two dashes and the name of the layout.
+    """
+    layouts = dict()
+    with open(layout_file, 'r') as file:
+        for line_number, line in enumerate(file, 1):
+            if line.strip() == "":
+                continue
+            match = re.match(r"^(?P<coordinates>.*?)-{2,}(?P<name>.+)$", line.strip())
+            if match is None:
+                raise ValueError(layout_file + ", line " + str(line_number) + ": missing layout name.")
+            values = [float(value) for value in match.group("coordinates").split()]
+            if len(values) % 2 != 0:
+                raise ValueError(layout_file + ", line " + str(line_number) + ": odd number of coordinates.")
+            layouts[match.group("name").strip()] = [(values[i], values[i + 1]) for i in range(0, len(values), 2)]
+    return layouts
+
+
+def generate_and_publish_hubs(sumocfg_path, coordinates: list[(float, float)], removed_hub_indices=None,
+                              use_cache=True, overwrite=False) -> str:
+    """
+    Generates a scenario in its own temporary directory next to the sumocfg and moves the new files into place
+    afterward, the sumocfg last. Other processes therefore never see half written files or a sumocfg whose files are
+    still missing, and several scenarios can be generated from the same sumocfg at the same time.
+    With removed_hub_indices, the sumocfg is an existing uam scenario which is updated with update_hubs. The updated
+    scenario is named after its hub count, so unless overwrite is set, it is not published if any of its files
+    already exist, e.g. those of another scenario with the same hub count or of the updated scenario itself.
+    """
+    sumocfg_dir_path = os.path.dirname(os.path.normpath(sumocfg_path))
+    # in the same directory, so that moving the files into place is atomic
+    temp_dir = tempfile.mkdtemp(prefix=".uam_hubs_" + str(len(coordinates)) + "_", dir=sumocfg_dir_path or ".")
+    try:
+        if removed_hub_indices is None:
+            new_sumocfg_path = generate_hubs(sumocfg_path, coordinates, temp_dir, use_cache)
+        else:
+            new_sumocfg_path = update_hubs(sumocfg_path, coordinates, removed_hub_indices, temp_dir)
+        if new_sumocfg_path is None:
+            raise RuntimeError("no scenario generated for \"" + sumocfg_path + "\"")
+        new_files = [file_name for file_name in os.listdir(temp_dir)
+                     if file_name != os.path.basename(new_sumocfg_path) and hub_file_prefix_pattern.match(file_name)]
+        existing_files = [file_name for file_name in new_files + [os.path.basename(new_sumocfg_path)]
+                          if os.path.exists(os.path.join(sumocfg_dir_path, file_name))]
+        if removed_hub_indices is not None and not overwrite and len(existing_files) > 0:
+            raise RuntimeError("not replacing the existing " + ", ".join(existing_files) + " in \""
+                               + (sumocfg_dir_path or ".") + "\", pass --overwrite to replace them")
+        for file_name in new_files + [os.path.basename(new_sumocfg_path)]:
+            os.replace(os.path.join(temp_dir, file_name), os.path.join(sumocfg_dir_path, file_name))
+        return os.path.join(sumocfg_dir_path, os.path.basename(new_sumocfg_path))
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def generate_hub_variants(sumocfg_path, coordinates: list[(float, float)], hub_counts: list[int], processes,
+                          use_cache=True) -> list[str]:
+    """
+    Generates one scenario per hub count from the first n coordinates, up to processes of them at the same time.
+    Returns the paths of the new sumocfgs.
+    """
+    new_sumocfg_paths = list()
+    with ProcessPoolExecutor(max_workers=min(processes, len(hub_counts))) as executor:
+        futures = {executor.submit(generate_and_publish_hubs, sumocfg_path, coordinates[:hub_count], None,
+                                   use_cache): hub_count for hub_count in hub_counts}
+        for future in as_completed(futures):
+            try:
+                new_sumocfg_paths.append(future.result())
+                print("Finished " + str(futures[future]) + " uam hubs: " + new_sumocfg_paths[-1])
+            except Exception as e:
+                print("Error: generating " + str(futures[future]) + " uam hubs failed: " + str(e))
+    return new_sumocfg_paths
 
 
 def main():
-    # Ensure we have pairs of coordinates
-    if len(options.coordinates) % 2 != 0:
-        print("Please provide an even number of coordinates.")
+    if options.add_hubs is not None or options.remove_hubs is not None:
+        add_coordinates = options.add_hubs if options.add_hubs is not None else []
+        if len(add_coordinates) % 2 != 0:
+            print("Please provide an even number of coordinates.")
+            return
+        add_coordinates = [(add_coordinates[i], add_coordinates[i + 1]) for i in range(0, len(add_coordinates), 2)]
+        print("Adding hubs:", add_coordinates, "removing hubs:", options.remove_hubs or [])
+        try:
+            print("Created " + generate_and_publish_hubs(options.file_path, add_coordinates, options.remove_hubs or [],
+                                                         overwrite=options.overwrite))
+        except RuntimeError as e:
+            print("Error: " + str(e))
         return
+    if options.layout is not None:
+        layouts = read_hub_layouts(options.layout_file)
+        layout_names = {name.lower(): name for name in layouts}
+        if options.layout.lower() not in layout_names:
+            print("Unknown layout \"" + options.layout + "\". Available layouts: " + ", ".join(layouts))
+            return
+        coordinates = layouts[layout_names[options.layout.lower()]]
+    else:
+        # Ensure we have pairs of coordinates
+        if len(options.coordinates) == 0 or len(options.coordinates) % 2 != 0:
+            print("Please provide an even number of coordinates.")
+            return
 
-    # Process the coordinates
-    coordinates = [(options.coordinates[i], options.coordinates[i + 1]) for i in range(0, len(options.coordinates), 2)]
+        # Process the coordinates
+        coordinates = [(options.coordinates[i], options.coordinates[i + 1]) for i in range(0, len(options.coordinates), 2)]
     print("Coordinates:", coordinates)
-    generate_hubs(coordinates)
+
+    if options.hub_counts is None:
+        generate_hubs(options.file_path, coordinates, use_cache=not options.no_cache)
+        return
+    if max(options.hub_counts) > len(coordinates) or min(options.hub_counts) < 1:
+        print("Hub counts have to be between 1 and the number of coordinates (" + str(len(coordinates)) + ").")
+        return
+    generate_hub_variants(options.file_path, coordinates, sorted(set(options.hub_counts)), options.processes,
+                          not options.no_cache)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+import argparse
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+import simConfig
+import uamHubConfig
+from cacheUtils import value_digest, write_json_atomic
+
+# increase when a stage creates a different output for the same inputs, older entries are not used anymore
+hub_stage_version = 2
+default_cache_folder = os.path.join(simConfig.cache_folder_path, "hubs")
+
+# the uamHubConfig values each stage of createUamHubs.generate_hubs depends on. Changing one of them only rebuilds
+# its stage and the stages using the output of that stage
+stage_config_keys = {
+    "access": ("sidewalk_search_radius",),
+    "network": ("uam_hub_length", "uam_hub_edge_width", "uam_hub_edge_speed", "uam_con_edge_width",
+                "uam_con_edge_speed", "uam_hub_connection_radius", "uam_hub_topology", "uam_hub_topology_neighbors"),
+    "additionals": ("parking_area_length", "bus_stop_length", "uam_pa_capacity", "rerouter_id", "rerouter_end_time",
+                    "fake_parking_area_id"),
+    "routes": ("uam_taxi_person_capacity", "uam_taxi_max_speed", "uam_drop_off_duration", "uam_pick_up_duration",
+               "taxi_abs_free_space_weight", "taxi_distance_to_weight", "taxi_time_to_weight",
+               "taxi_rel_free_space_weight", "rerouter_id"),
+}
+
+
+class HubStageCache:
+    """
+    Keeps the output file of every hub generation stage under a hash of the stage's inputs: the digests of its input
+    files and the outputs of earlier stages, the hub coordinates and its uamHubConfig values. Each entry is the output
+    file and a json file describing it, which is written last, so entries of interrupted runs are never used.
+    """
+
+    def __init__(self, cache_folder: str = default_cache_folder, enabled: bool = True):
+        self.cache_folder = cache_folder
+        self.enabled = enabled
+
+    def get_key(self, stage: str, inputs: dict) -> str:
+        return value_digest({"stage": stage, "version": hub_stage_version, "inputs": inputs,
+                             "config": get_stage_config(stage)})
+
+    def get_entry_path(self, stage: str, key: str) -> str:
+        return os.path.join(self.cache_folder, stage + "-" + key[:24])
+
+    def get_data_path(self, stage: str, key: str) -> str:
+        """
+        Returns the path of the cached output of the stage and marks it as used, or "" if there is none.
+        """
+        if not self.enabled:
+            return ""
+        entry_path = self.get_entry_path(stage, key)
+        entry = read_entry(entry_path + ".json")
+        if entry is None or entry.get("key") != key or not os.path.isfile(entry_path + ".data"):
+            return ""
+        entry["last_used"] = datetime.now().isoformat(timespec="seconds")
+        write_json_atomic(entry_path + ".json", entry)
+        print("using cached " + stage + " stage " + key[:12] + " (" + entry["description"] + ")")
+        return entry_path + ".data"
+
+    def restore(self, stage: str, key: str, out_path: str) -> bool:
+        """
+        Copies the cached output file of the stage to out_path. Returns False if there is none.
+        """
+        data_path = self.get_data_path(stage, key)
+        if data_path == "":
+            return False
+        shutil.copyfile(data_path, out_path)
+        return True
+
+    def load_value(self, stage: str, key: str):
+        """
+        Returns the cached json output of the stage, or None if there is none.
+        """
+        data_path = self.get_data_path(stage, key)
+        if data_path == "":
+            return None
+        with open(data_path, 'r') as data_file:
+            return json.load(data_file)
+
+    def store(self, stage: str, key: str, path: str, description: str = ""):
+        if self.enabled:
+            self.write_entry(stage, key, lambda temp_path: shutil.copyfile(path, temp_path), description)
+
+    def store_value(self, stage: str, key: str, value, description: str = ""):
+        def write(temp_path):
+            with open(temp_path, 'w') as data_file:
+                json.dump(value, data_file)
+
+        if self.enabled:
+            self.write_entry(stage, key, write, description)
+
+    def write_entry(self, stage: str, key: str, write, description: str):
+        os.makedirs(self.cache_folder, exist_ok=True)
+        entry_path = self.get_entry_path(stage, key)
+        temp_path = entry_path + ".data.tmp" + str(os.getpid())
+        write(temp_path)
+        os.replace(temp_path, entry_path + ".data")
+        now = datetime.now().isoformat(timespec="seconds")
+        write_json_atomic(entry_path + ".json", {
+            "stage": stage, "key": key, "version": hub_stage_version, "description": description,
+            "size": os.path.getsize(entry_path + ".data"), "created": now, "last_used": now,
+            "config": get_stage_config(stage)})
+
+
+def get_stage_config(stage: str) -> dict:
+    return {config_key: getattr(uamHubConfig, config_key) for config_key in stage_config_keys[stage]}
+
+
+def read_entry(json_path: str):
+    try:
+        with open(json_path, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def list_entries(cache_folder: str = default_cache_folder) -> list[dict]:
+    """
+    Returns the description of every complete cache entry, the most recently used first.
+    """
+    if not os.path.isdir(cache_folder):
+        return []
+    entries = list()
+    for file_name in os.listdir(cache_folder):
+        if not file_name.endswith(".json"):
+            continue
+        entry = read_entry(os.path.join(cache_folder, file_name))
+        if entry is not None and os.path.isfile(os.path.join(cache_folder, file_name[:-5] + ".data")):
+            entry["path"] = os.path.join(cache_folder, file_name[:-5])
+            entries.append(entry)
+    return sorted(entries, key=lambda x: x["last_used"], reverse=True)
+
+
+def prune(cache_folder: str = default_cache_folder, max_age_days: float = None, max_size_mb: float = None) -> int:
+    """
+    Removes incomplete entries, entries of older stage versions, entries not used for max_age_days and the least
+    recently used entries beyond a total size of max_size_mb. Returns the number of removed files.
+    """
+    if not os.path.isdir(cache_folder):
+        return 0
+    kept = set()
+    total_size = 0
+    for entry in list_entries(cache_folder):
+        age_days = (datetime.now() - datetime.fromisoformat(entry["last_used"])).total_seconds() / 86400
+        if entry.get("version") != hub_stage_version or (max_age_days is not None and age_days > max_age_days):
+            continue
+        total_size += entry["size"]
+        if max_size_mb is not None and total_size > max_size_mb * 1024 * 1024:
+            continue
+        kept.update({entry["path"] + ".json", entry["path"] + ".data"})
+    removed = 0
+    for file_name in os.listdir(cache_folder):
+        path = os.path.join(cache_folder, file_name)
+        # temporary files of stages that are still being stored are kept for a while
+        if path in kept or (".tmp" in file_name and time.time() - os.path.getmtime(path) < 3600):
+            continue
+        os.remove(path)
+        removed += 1
+    return removed
+
+
+def get_options():
+    """
+    Command line options using the argparse library
+    """
+    arg_parser = argparse.ArgumentParser(description="Lists and prunes the cached stages of the uam hub generation.")
+    arg_parser.add_argument("--cache_folder", dest="cache_folder", type=str, default=default_cache_folder,
+                            help="Default = " + default_cache_folder + ". Folder of the cached stages.")
+    arg_parser.add_argument("--stage", dest="stage", type=str, choices=sorted(stage_config_keys),
+                            help="Only list entries of the given stage.")
+    arg_parser.add_argument("--prune", action="store_true", default=False,
+                            help="Remove incomplete entries and entries of older versions of the stages.")
+    arg_parser.add_argument("--max_age", dest="max_age", type=float,
+                            help="With --prune, also remove entries not used for this many days.")
+    arg_parser.add_argument("--max_size", dest="max_size", type=float,
+                            help="With --prune, also remove the least recently used entries beyond this total size in MB.")
+    arg_parser.add_argument("--clear", action="store_true", default=False, help="Remove all entries.")
+    return arg_parser.parse_args()
+
+
+if __name__ == '__main__':
+    options = get_options()
+    if options.clear:
+        shutil.rmtree(options.cache_folder, ignore_errors=True)
+        print("removed " + options.cache_folder)
+    elif options.prune:
+        print("removed " + str(prune(options.cache_folder, options.max_age, options.max_size)) + " files from "
+              + options.cache_folder)
+    cache_entries = [entry for entry in list_entries(options.cache_folder)
+                     if options.stage is None or entry["stage"] == options.stage]
+    for cache_entry in cache_entries:
+        print(cache_entry["key"][:12], cache_entry["stage"].ljust(11), cache_entry["last_used"],
+              str(round(cache_entry["size"] / 1024 / 1024, 2)) + " MB", cache_entry["description"])
+    print(str(len(cache_entries)) + " entries, " + str(round(sum(entry["size"] for entry in cache_entries) / 1024 / 1024, 2))
+          + " MB in " + options.cache_folder)
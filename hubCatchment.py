@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+import argparse
+import math
+import os
+import sys
+import time
+import importlib.util
+import simConfig as config
+from cacheUtils import load_cached_pickle
+from pedestrianGraph import PedestrianGraph
+
+# we need to import some python modules from the $SUMO_HOME/tools directory
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+elif importlib.util.find_spec("sumolib") is None:  # the pip package sumolib works without SUMO
+    sys.exit("please declare environment variable 'SUMO_HOME'")
+
+import sumolib
+
+# increase when the content of the cached catchment changes, old cache files are rebuilt afterward
+catchment_version = 1
+catchment_kind = "hub-catchment"
+
+
+class HubCatchment:
+    """
+    Walking distance from every edge pedestrians may use to the closest uam hub, from one shortest path search
+    starting at all hubs at once. Trips whose walks to and from the hubs alone are longer than walking the whole trip
+    cannot benefit from uam, so the controller does not have to ask SUMO's intermodal router for them.
+    Created from a sumolib network once and cached on disk by load_hub_catchment.
+    """
+
+    def __init__(self, access_distances: dict[str, float], hub_count: int):
+        self.access_distances = access_distances
+        self.hub_count = hub_count
+
+    @classmethod
+    def from_net(cls, net):
+        graph = PedestrianGraph.from_net(net)
+        node_indices = {node_id: index for index, node_id in enumerate(graph.node_ids)}
+        # pedestrians enter a hub at the start of its hub edge, where the bus stop is
+        hub_nodes = [node_indices[node.getID()] for node in net.getNodes()
+                     if node.getID().startswith("uam_hub_junction_") and node.getID().endswith("_0")
+                     and node.getID() in node_indices]
+        distances = graph.get_distances_from_nodes({node: 0.0 for node in hub_nodes})
+        access_distances = dict()
+        for edge in net.getEdges():
+            if edge.getFunction() != "" or not edge.allows("pedestrian"):
+                continue
+            from_index = node_indices[edge.getFromNode().getID()]
+            to_index = node_indices[edge.getToNode().getID()]
+            access_distances[edge.getID()] = float(min(distances[from_index], distances[to_index]))
+        return cls(access_distances, len(hub_nodes))
+
+    def get_access_distance(self, edge_id: str) -> float:
+        """
+        Walking distance from the closer end of the edge to the closest hub, np.inf if no hub can be reached and 0 for
+        unknown edges.
+        """
+        return self.access_distances.get(edge_id, 0.0)
+
+    def cannot_benefit(self, start_edge: str, dest_edge: str, start_coords: (float, float),
+                       dest_coords: (float, float), circuity: float) -> bool:
+        """
+        Whether walking to the closest hub at the start and from the closest hub at the destination is at least as
+        long as walking the whole trip, estimated as circuity times its straight-line distance.
+        """
+        return (self.get_access_distance(start_edge) + self.get_access_distance(dest_edge)
+                >= circuity * math.dist(start_coords, dest_coords))
+
+
+class CatchmentPrefilter:
+    """
+    Decides for the uam controller which conversion candidates are not routed intermodally. Every audit_interval-th
+    skipped trip is routed anyway to count the trips that would have used uam, which the prefilter missed.
+    """
+
+    def __init__(self, catchment: HubCatchment, circuity: float, audit_interval: int):
+        self.catchment = catchment
+        self.circuity = circuity
+        self.audit_interval = audit_interval
+        self.candidates = 0
+        self.skipped = 0
+        self.audited = 0
+        self.false_negatives = 0
+
+    def should_skip(self, start_edge: str, dest_edge: str, start_coords: (float, float),
+                    dest_coords: (float, float)) -> bool:
+        self.candidates += 1
+        if not self.catchment.cannot_benefit(start_edge, dest_edge, start_coords, dest_coords, self.circuity):
+            return False
+        self.skipped += 1
+        return True
+
+    def should_audit(self) -> bool:
+        """
+        Whether the trip that was just skipped is routed anyway for the audit.
+        """
+        return self.audit_interval > 0 and self.skipped % self.audit_interval == 0
+
+    def record_audit(self, uses_uam: bool):
+        self.audited += 1
+        if uses_uam:
+            self.false_negatives += 1
+
+    def get_false_negative_rate(self) -> float:
+        return self.false_negatives / self.audited if self.audited > 0 else 0.0
+
+    def get_summary(self) -> str:
+        summary = ("catchment prefilter skipped " + str(self.skipped) + " of " + str(self.candidates)
+                   + " router calls")
+        if self.audited > 0:
+            summary += (", " + str(self.false_negatives) + " of " + str(self.audited) + " audited trips would have "
+                        "used uam (false negative rate " + str(round(self.get_false_negative_rate() * 100, 1)) + " %)")
+        return summary
+
+
+def load_hub_catchment(net_path: str, cache_folder: str = config.cache_folder_path,
+                       use_cache: bool = True) -> HubCatchment:
+    """
+    Returns the HubCatchment of a uam network. It is read from the cache folder if it was built for a network file
+    with the same content, otherwise the network is parsed with sumolib and the new catchment is cached.
+    """
+    def build() -> dict:
+        catchment = HubCatchment.from_net(sumolib.net.readNet(net_path))
+        return {"access_distances": catchment.access_distances, "hub_count": catchment.hub_count}
+
+    content = load_cached_pickle(net_path, catchment_kind, catchment_version, build, cache_folder, use_cache)
+    return HubCatchment(content["access_distances"], content["hub_count"])
+
+
+def get_options():
+    """
+    Command line options using the argparse library
+    """
+    arg_parser = argparse.ArgumentParser(description="Builds the cached hub catchment of uam networks ahead of a "
+                                                     "simulation with the catchment prefilter.")
+    arg_parser.add_argument("net_paths", type=str, nargs="+", help="Paths to .net.xml(.gz) files with uam hubs.")
+    arg_parser.add_argument("--cache_folder", dest="cache_folder", type=str, default=config.cache_folder_path,
+                            help="Default = " + config.cache_folder_path + ". Folder of the cached catchments.")
+    return arg_parser.parse_args()
+
+
+if __name__ == '__main__':
+    options = get_options()
+    for path in options.net_paths:
+        start_time = time.perf_counter()
+        hub_catchment = load_hub_catchment(path, options.cache_folder)
+        reachable = [distance for distance in hub_catchment.access_distances.values() if distance < math.inf]
+        print(path + ": " + str(hub_catchment.hub_count) + " hubs, " + str(len(reachable)) + " of "
+              + str(len(hub_catchment.access_distances)) + " pedestrian edges can reach a hub"
+              + (", median walk " + str(round(sorted(reachable)[len(reachable) // 2])) + " m" if reachable else "")
+              + ", " + str(round(time.perf_counter() - start_time, 2)) + " s")
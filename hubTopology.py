@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+import importlib.util
+import math
+
+topologies = ("mesh", "knn", "delaunay", "rng")
+
+
+class HubGrid:
+    """
+    Grid of hub locations for finding the hubs near a position without comparing every pair of hubs. The cell size
+    is chosen so that a cell holds about one hub.
+    """
+
+    def __init__(self, locations: dict):
+        self.locations = locations
+        xs = [location[0] for location in locations.values()]
+        ys = [location[1] for location in locations.values()]
+        self.cell_size = max(max(xs) - min(xs), max(ys) - min(ys), 1.0) / max(1.0, math.sqrt(len(locations)))
+        self.cells = dict()
+        for hub, location in locations.items():
+            self.cells.setdefault(self.get_cell(location), list()).append(hub)
+        self.min_cell = (min(cell[0] for cell in self.cells), min(cell[1] for cell in self.cells))
+        self.max_cell = (max(cell[0] for cell in self.cells), max(cell[1] for cell in self.cells))
+
+    def get_cell(self, location: (float, float)) -> (int, int):
+        return math.floor(location[0] / self.cell_size), math.floor(location[1] / self.cell_size)
+
+    def get_ring(self, centre_cell: (int, int), ring: int) -> list:
+        """
+        Returns the hubs in the cells which are exactly ring cells away from the centre cell.
+        """
+        hubs = list()
+        for cell_x in range(max(centre_cell[0] - ring, self.min_cell[0]), min(centre_cell[0] + ring, self.max_cell[0]) + 1):
+            for cell_y in range(max(centre_cell[1] - ring, self.min_cell[1]), min(centre_cell[1] + ring, self.max_cell[1]) + 1):
+                if max(abs(cell_x - centre_cell[0]), abs(cell_y - centre_cell[1])) == ring:
+                    hubs.extend(self.cells.get((cell_x, cell_y), ()))
+        return hubs
+
+    def get_max_ring(self, centre_cell: (int, int)) -> int:
+        return max(centre_cell[0] - self.min_cell[0], self.max_cell[0] - centre_cell[0],
+                   centre_cell[1] - self.min_cell[1], self.max_cell[1] - centre_cell[1])
+
+    def get_hubs_in_radius(self, hub, radius: float) -> list:
+        location = self.locations[hub]
+        centre_cell = self.get_cell(location)
+        max_ring = self.get_max_ring(centre_cell)
+        if radius < math.inf:
+            # hubs in a ring are at least ring - 1 cells away
+            max_ring = min(max_ring, math.ceil(radius / self.cell_size) + 1)
+        hubs = list()
+        for ring in range(max_ring + 1):
+            hubs.extend(other for other in self.get_ring(centre_cell, ring)
+                        if other != hub and math.dist(location, self.locations[other]) <= radius)
+        return hubs
+
+    def get_nearest_hubs(self, hub, k: int, radius: float) -> list:
+        """
+        Returns the k hubs closest to the hub which are within the radius. The rings around the hub's cell are searched
+        until the k-th closest hub found so far is closer than any hub in the next ring can be.
+        """
+        location = self.locations[hub]
+        centre_cell = self.get_cell(location)
+        candidates = list()
+        for ring in range(self.get_max_ring(centre_cell) + 1):
+            if (ring - 1) * self.cell_size > radius:
+                break
+            candidates.extend((math.dist(location, self.locations[other]), other)
+                              for other in self.get_ring(centre_cell, ring) if other != hub)
+            candidates.sort(key=lambda x: x[0])
+            if len(candidates) >= k and candidates[k - 1][0] <= ring * self.cell_size:
+                break
+        return [other for distance, other in candidates[:k] if distance <= radius]
+
+
+def get_mesh_pairs(locations: dict, radius: float) -> set:
+    grid = HubGrid(locations)
+    return {frozenset((hub, other)) for hub in locations for other in grid.get_hubs_in_radius(hub, radius)}
+
+
+def get_knn_pairs(locations: dict, radius: float, k: int) -> set:
+    """
+    Connects each hub with its k nearest hubs. A pair is connected if either hub is among the k nearest of the other.
+    """
+    grid = HubGrid(locations)
+    return {frozenset((hub, other)) for hub in locations for other in grid.get_nearest_hubs(hub, k, radius)}
+
+
+def get_rng_pairs(locations: dict, radius: float) -> set:
+    """
+    Relative neighborhood graph: two hubs are connected unless a third hub is closer to both of them than they are to
+    each other. The graph stays connected while removing the long detours of a full mesh.
+    """
+    hubs = list(locations)
+    by_distance = {hub: sorted(((math.dist(locations[hub], locations[other]), other) for other in hubs if other != hub),
+                               key=lambda x: x[0]) for hub in hubs}
+    pairs = set()
+    for hub in hubs:
+        for distance, other in by_distance[hub]:
+            if distance > radius:
+                break
+            pair = frozenset((hub, other))
+            if pair in pairs:
+                continue
+            # only hubs closer to hub than other can block the pair, they are at the start of the sorted list
+            blocked = False
+            for third_distance, third in by_distance[hub]:
+                if third_distance >= distance:
+                    break
+                if third != other and math.dist(locations[other], locations[third]) < distance:
+                    blocked = True
+                    break
+            if not blocked:
+                pairs.add(pair)
+    return pairs
+
+
+def get_delaunay_pairs(locations: dict, radius: float) -> set:
+    if importlib.util.find_spec("scipy") is None:
+        raise ImportError("The delaunay hub topology requires scipy. Install it or use the rng topology instead.")
+    from scipy.spatial import Delaunay, QhullError
+    hubs = list(locations)
+    if len(hubs) < 3:
+        return get_mesh_pairs(locations, radius)
+    try:
+        triangulation = Delaunay([locations[hub] for hub in hubs])
+    except QhullError:
+        # all hubs on one line, the relative neighborhood graph is the same path
+        return get_rng_pairs(locations, radius)
+    pairs = set()
+    for simplex in triangulation.simplices:
+        for i in range(3):
+            hub, other = hubs[simplex[i]], hubs[simplex[(i + 1) % 3]]
+            if math.dist(locations[hub], locations[other]) <= radius:
+                pairs.add(frozenset((hub, other)))
+    return pairs
+
+
+def get_hub_neighbors(locations: dict, topology: str = "mesh", radius: float = math.inf, k: int = 4) -> dict:
+    """
+    Returns the set of hubs each hub is connected with by the topology. The connections are symmetric and no two
+    hubs further apart than the radius are connected.
+
+    :param locations: (x, y) location by hub
+    :param topology: mesh connects all hubs within the radius, knn the k nearest hubs, delaunay the edges of the
+                     delaunay triangulation and rng the relative neighborhood graph
+    """
+    if len(locations) < 2:
+        pairs = set()
+    elif topology == "mesh":
+        pairs = get_mesh_pairs(locations, radius)
+    elif topology == "knn":
+        pairs = get_knn_pairs(locations, radius, k)
+    elif topology == "delaunay":
+        pairs = get_delaunay_pairs(locations, radius)
+    elif topology == "rng":
+        pairs = get_rng_pairs(locations, radius)
+    else:
+        raise ValueError("Unknown hub topology \"" + str(topology) + "\", use one of " + ", ".join(topologies))
+    neighbors = {hub: set() for hub in locations}
+    for hub, other in pairs:
+        neighbors[hub].add(other)
+        neighbors[other].add(hub)
+    return neighbors
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+import asyncio
+import importlib
+import threading
+from abc import ABC, abstractmethod
+import simConfig as config
+
+modes = ("uam", "walk")
+
+
+class ModeChoiceBackend(ABC):
+    """
+    Interface of mode choice backends, e.g. a client of a language model service. decide is awaited on the event loop
+    of the ModeChoiceEngine, so backends have to use asynchronous io instead of blocking calls.
+    """
+
+    @abstractmethod
+    async def decide(self, requests: list[dict]) -> list[str]:
+        """
+        Returns one of modes for each decision request: "uam" to follow the planned uam trip or "walk" to walk the
+        whole way instead.
+        """
+
+    async def close(self):
+        pass
+
+
+class StubBackend(ModeChoiceBackend):
+    """
+    Local deterministic backend for testing and benchmarking the engine. Answers after a fixed latency and declines uam
+    if it saves less than min_time_saving of the time needed to walk the straight-line distance times circuity.
+    """
+
+    def __init__(self, latency: float = config.mode_choice_stub_latency, min_time_saving: float = 0.3,
+                 circuity: float = 1.3, walking_speed: float = config.router_walking_speed):
+        self.latency = latency
+        self.min_time_saving = min_time_saving
+        self.circuity = circuity
+        self.walking_speed = walking_speed
+
+    async def decide(self, requests: list[dict]) -> list[str]:
+        await asyncio.sleep(self.latency)
+        return ["walk" if request["travel_time"] > (1 - self.min_time_saving) * request["distance"] * self.circuity
+                / self.walking_speed else "uam" for request in requests]
+
+
+class ModeChoiceEngine:
+    """
+    Collects the decision requests of a simulation step and sends them in batches to the backend, which runs on an
+    event loop in a background thread, so the simulation never waits for an answer. At most max_concurrency batches
+    are decided at the same time and batches that are not answered within timeout seconds are dropped. Answers are
+    cached by their features, requests with cached features are answered by the next poll.
+    """
+
+    def __init__(self, backend: ModeChoiceBackend, batch_size: int = config.mode_choice_batch_size,
+                 max_concurrency: int = config.mode_choice_max_concurrency,
+                 timeout: float = config.mode_choice_timeout):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.cache = dict()
+        # customers waiting for the answer of each feature key, requests with the same key are decided once
+        self.waiting = dict()
+        self.pending = list()
+        self.cached_answers = list()
+        self.finished = list()
+        self.finished_lock = threading.Lock()
+        self.requests = 0
+        self.cache_hits = 0
+        self.batches = 0
+        self.answered = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.loop = asyncio.new_event_loop()
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def request(self, customer_id: str, features: dict):
+        self.requests += 1
+        key = get_feature_key(features)
+        if key in self.cache:
+            self.cache_hits += 1
+            self.cached_answers.append((customer_id, self.cache[key]))
+        elif key in self.waiting:
+            self.waiting[key].append(customer_id)
+        else:
+            self.waiting[key] = [customer_id]
+            self.pending.append((key, features))
+
+    def flush(self):
+        """
+        Submits the requests collected since the last flush to the backend.
+        """
+        for index in range(0, len(self.pending), self.batch_size):
+            self.batches += 1
+            asyncio.run_coroutine_threadsafe(self.decide_batch(self.pending[index:index + self.batch_size]),
+                                             self.loop)
+        self.pending = list()
+
+    async def decide_batch(self, batch: list[(tuple, dict)]):
+        async with self.semaphore:
+            try:
+                answers = await asyncio.wait_for(self.backend.decide([features for _, features in batch]),
+                                                 self.timeout)
+                if len(answers) != len(batch) or any(answer not in modes for answer in answers):
+                    raise ValueError("expected one of " + str(modes) + " per request, got " + str(answers))
+            except asyncio.TimeoutError:
+                answers = None
+                self.timeouts += 1
+            except Exception as e:
+                answers = None
+                self.errors += 1
+                print("Error: mode choice batch failed: " + str(e))
+        with self.finished_lock:
+            self.finished.append((batch, answers))
+
+    def poll(self) -> list[(str, str)]:
+        """
+        Returns the customers whose answer arrived since the last poll together with their mode. Customers of dropped
+        batches keep their planned trip.
+        """
+        with self.finished_lock:
+            finished, self.finished = self.finished, list()
+        decisions, self.cached_answers = self.cached_answers, list()
+        for batch, answers in finished:
+            for index, (key, _) in enumerate(batch):
+                customers = self.waiting.pop(key)
+                if answers is None:
+                    continue
+                self.answered += 1
+                self.cache[key] = answers[index]
+                decisions += [(customer, answers[index]) for customer in customers]
+        return decisions
+
+    def close(self):
+        try:
+            asyncio.run_coroutine_threadsafe(self.backend.close(), self.loop).result(self.timeout)
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
+
+    def get_summary(self) -> str:
+        return ("mode choice: " + str(self.requests) + " requests, " + str(self.cache_hits) + " cache hits, "
+                + str(self.answered) + " answered in " + str(self.batches) + " batches, " + str(self.timeouts)
+                + " timed out and " + str(self.errors) + " failed batches, " + str(len(self.waiting))
+                + " unanswered requests")
+
+
+def get_feature_key(features: dict) -> tuple:
+    return tuple(sorted(features.items()))
+
+
+def load_backend(name: str, stub_latency: float = config.mode_choice_stub_latency) -> ModeChoiceBackend:
+    """
+    Returns the backend "stub" answering after stub_latency seconds or the instance of a ModeChoiceBackend subclass
+    given as "module:ClassName", which is created without arguments.
+    """
+    if name == "stub":
+        return StubBackend(stub_latency)
+    module_name, _, class_name = name.partition(":")
+    if class_name == "":
+        raise ValueError("mode choice backend \"" + name + "\" is neither \"stub\" nor \"module:ClassName\"")
+    return getattr(importlib.import_module(module_name), class_name)()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+import argparse
+import heapq
+import math
+import os
+import sys
+import time
+import importlib.util
+import simConfig as config
+from cacheUtils import file_digest, get_pickle_cache_path, load_cached_pickle
+
+# we need to import some python modules from the $SUMO_HOME/tools directory
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+elif importlib.util.find_spec("sumolib") is None:  # the pip package sumolib works without SUMO
+    sys.exit("please declare environment variable 'SUMO_HOME'")
+
+import sumolib
+from sumolib.geomhelper import distancePointToPolygon
+
+# increase when the content of the cached index changes, old cache files are rebuilt afterward
+edge_index_version = 1
+edge_index_kind = "edge-index"
+default_cell_size = 100.0
+
+
+class EdgeIndex:
+    """
+    The parts of a network the controller needs, without keeping the full sumolib network in memory: the shape,
+    from-junction position and allowed vClasses of every normal edge, and a grid of cell_size x cell_size meter cells
+    for finding the edges near a position.
+    Created from a sumolib network once and cached on disk by load_edge_index.
+    """
+
+    def __init__(self, edge_ids: list[str], shapes: list[list[tuple[float, float]]],
+                 from_positions: list[tuple[float, float]], edge_permissions: list[int],
+                 permission_sets: list[frozenset[str]], cell_size: float, grid: dict[tuple[int, int], list[int]]):
+        self.edge_ids = edge_ids
+        self.shapes = shapes
+        self.from_positions = from_positions
+        self.edge_permissions = edge_permissions    # index into permission_sets, most edges share the same set
+        self.permission_sets = permission_sets
+        self.cell_size = cell_size
+        self.grid = grid
+        self.edge_indices = {edge_id: index for index, edge_id in enumerate(edge_ids)}
+        self.min_cell = (min(cell[0] for cell in grid), min(cell[1] for cell in grid)) if grid else (0, 0)
+        self.max_cell = (max(cell[0] for cell in grid), max(cell[1] for cell in grid)) if grid else (-1, -1)
+
+    @classmethod
+    def from_net(cls, net, cell_size: float = default_cell_size):
+        edge_ids = list()
+        shapes = list()
+        from_positions = list()
+        edge_permissions = list()
+        permission_indices = dict()
+        grid = dict()
+        for edge in net.getEdges():
+            index = len(edge_ids)
+            shape = [(x, y) for x, y, *_ in edge.getShape()]
+            edge_ids.append(edge.getID())
+            shapes.append(shape)
+            from_positions.append(tuple(edge.getFromNode().getCoord()[:2]))
+            permissions = frozenset(v_class for lane in edge.getLanes() for v_class in lane.getPermissions())
+            edge_permissions.append(permission_indices.setdefault(permissions, len(permission_indices)))
+            for cell in get_cells(*get_bounding_box(shape), cell_size):
+                grid.setdefault(cell, list()).append(index)
+        permission_sets = sorted(permission_indices, key=permission_indices.get)
+        return cls(edge_ids, shapes, from_positions, edge_permissions, permission_sets, cell_size, grid)
+
+    def get_edge_count(self) -> int:
+        return len(self.edge_ids)
+
+    def has_edge(self, edge_id: str) -> bool:
+        return edge_id in self.edge_indices
+
+    def allows(self, edge_id: str, v_class: str) -> bool:
+        """
+        Whether at least one lane of the edge allows the vClass.
+        """
+        return v_class in self.permission_sets[self.edge_permissions[self.edge_indices[edge_id]]]
+
+    def get_from_junction_position(self, edge_id: str) -> tuple[float, float]:
+        return self.from_positions[self.edge_indices[edge_id]]
+
+    def get_neighboring_edges(self, x: float, y: float, r: float) -> list[tuple[str, float]]:
+        """
+        Returns (edge id, distance) of all edges whose shape is closer than r to the position, the closest first.
+        Same result as sumolib's net.getNeighboringEdges(x, y, r, includeJunctions=False), but sorted.
+        """
+        candidates = set()
+        for cell in get_cells(x - r, y - r, x + r, y + r, self.cell_size):
+            candidates.update(self.grid.get(cell, ()))
+        neighboring_edges = list()
+        for index in candidates:
+            distance = distancePointToPolygon((x, y), self.shapes[index])
+            if distance < r:
+                neighboring_edges.append((self.edge_ids[index], distance))
+        neighboring_edges.sort(key=lambda x: (x[1], x[0]))
+        return neighboring_edges
+
+    def iter_nearest_edges(self, x: float, y: float, max_distance: float = math.inf):
+        """
+        Yields (edge id, distance) of the edges closer than max_distance, the closest first, in the same order as
+        get_neighboring_edges. The rings of grid cells around the position are searched one at a time, so a caller
+        looking for the closest edge with some property only pays for the rings up to that edge.
+        """
+        cell_x, cell_y = math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+        max_ring = max(cell_x - self.min_cell[0], self.max_cell[0] - cell_x, cell_y - self.min_cell[1],
+                       self.max_cell[1] - cell_y, 0)
+        seen = set()
+        queue = list()
+        for ring in range(max_ring + 1):
+            for cell in get_ring_cells(cell_x, cell_y, ring):
+                for index in self.grid.get(cell, ()):
+                    if index not in seen:
+                        seen.add(index)
+                        distance = distancePointToPolygon((x, y), self.shapes[index])
+                        if distance < max_distance:
+                            heapq.heappush(queue, (distance, self.edge_ids[index]))
+            # edges in cells of the next rings are at least ring cells away from the position
+            bound = min(ring * self.cell_size, max_distance)
+            while queue and queue[0][0] < bound:
+                yield heapq.heappop(queue)[::-1]
+            if ring * self.cell_size >= max_distance:
+                break
+        while queue:
+            yield heapq.heappop(queue)[::-1]
+
+    def get_nearest_edges(self, points: list[tuple[float, float]], accept, max_distance: float = math.inf,
+                          tolerance: float = 0.0) -> list[list[tuple[str, float]]]:
+        """
+        Returns for each point the closest accepted edge closer than max_distance together with all accepted edges that
+        are at most tolerance further away, as (edge id, distance) pairs, the closest first. An empty list if no edge is
+        accepted.
+
+        :param accept: function of an edge id, whether the edge is a result
+        """
+        results = list()
+        for x, y in points:
+            nearest_edges = list()
+            for edge_id, distance in self.iter_nearest_edges(x, y, max_distance):
+                if nearest_edges and distance > nearest_edges[0][1] + tolerance:
+                    break
+                if accept(edge_id):
+                    nearest_edges.append((edge_id, distance))
+            results.append(nearest_edges)
+        return results
+
+
+def get_bounding_box(shape: list[tuple[float, float]]) -> (float, float, float, float):
+    xs = [point[0] for point in shape]
+    ys = [point[1] for point in shape]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def get_cells(x_min: float, y_min: float, x_max: float, y_max: float, cell_size: float):
+    for cell_x in range(math.floor(x_min / cell_size), math.floor(x_max / cell_size) + 1):
+        for cell_y in range(math.floor(y_min / cell_size), math.floor(y_max / cell_size) + 1):
+            yield cell_x, cell_y
+
+
+def get_ring_cells(cell_x: int, cell_y: int, ring: int):
+    """
+    Yields the cells which are exactly ring cells away from the given cell.
+    """
+    if ring == 0:
+        yield cell_x, cell_y
+        return
+    for offset in range(-ring, ring + 1):
+        yield cell_x + offset, cell_y - ring
+        yield cell_x + offset, cell_y + ring
+    for offset in range(-ring + 1, ring):
+        yield cell_x - ring, cell_y + offset
+        yield cell_x + ring, cell_y + offset
+
+
+def load_edge_index(net_path: str, cache_folder: str = config.cache_folder_path, use_cache: bool = True) -> EdgeIndex:
+    """
+    Returns the EdgeIndex of a network. The index is read from the cache folder if it was built for a network file
+    with the same content, otherwise the network is parsed with sumolib and the new index is cached.
+    """
+    def build() -> dict:
+        edge_index = EdgeIndex.from_net(sumolib.net.readNet(net_path))
+        return {"edge_ids": edge_index.edge_ids, "shapes": edge_index.shapes,
+                "from_positions": edge_index.from_positions, "edge_permissions": edge_index.edge_permissions,
+                "permission_sets": edge_index.permission_sets, "cell_size": edge_index.cell_size,
+                "grid": edge_index.grid}
+
+    return EdgeIndex(**load_cached_pickle(net_path, edge_index_kind, edge_index_version, build, cache_folder,
+                                          use_cache))
+
+
+def get_options():
+    """
+    Command line options using the argparse library
+    """
+    arg_parser = argparse.ArgumentParser(description="Builds the cached edge index of networks ahead of a simulation.")
+    arg_parser.add_argument("net_paths", type=str, nargs="+", help="Paths to .net.xml(.gz) files.")
+    arg_parser.add_argument("--cache_folder", dest="cache_folder", type=str, default=config.cache_folder_path,
+                            help="Default = " + config.cache_folder_path + ". Folder of the cached edge indices.")
+    return arg_parser.parse_args()
+
+
+if __name__ == '__main__':
+    options = get_options()
+    for path in options.net_paths:
+        start_time = time.perf_counter()
+        index = load_edge_index(path, options.cache_folder)
+        print(path + ": " + str(index.get_edge_count()) + " edges, " + str(round(time.perf_counter() - start_time, 2))
+              + " s -> " + get_pickle_cache_path(path, file_digest(path), edge_index_kind, options.cache_folder))
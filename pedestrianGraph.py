@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+import heapq
+import math
+import numpy as np
+
+
+class PedestrianGraph:
+    """
+    Junction graph of all edges pedestrians may use, in both directions as pedestrians can walk against the driving
+    direction. Walking distances from a position to every junction are computed once per position and kept, so
+    estimating many hub layouts only needs one shortest path tree per distinct hub location.
+    """
+
+    def __init__(self, node_ids: list[str], positions: np.ndarray, neighbors: list[list[(int, float)]],
+                 arc_edges: list[list[str]] = None, cell_size: float = 200.0):
+        self.node_ids = node_ids
+        self.positions = positions
+        self.neighbors = neighbors
+        # id of the edge behind each entry of neighbors, needed to turn shortest paths into walking routes
+        self.arc_edges = arc_edges
+        self.cell_size = cell_size
+        self.grid = dict()
+        for index, (x, y) in enumerate(positions):
+            self.grid.setdefault((math.floor(x / cell_size), math.floor(y / cell_size)), list()).append(index)
+        self.coordinates = [(float(x), float(y)) for x, y in positions]
+        self.node_indices = {(round(float(x), 2), round(float(y), 2)): index for index, (x, y) in enumerate(positions)}
+        self.trees = dict()
+
+    @classmethod
+    def from_net(cls, net):
+        node_ids = list()
+        node_indices = dict()
+        positions = list()
+        neighbors = list()
+        arc_edges = list()
+
+        def get_index(node):
+            if node.getID() not in node_indices:
+                node_indices[node.getID()] = len(node_ids)
+                node_ids.append(node.getID())
+                positions.append(node.getCoord()[:2])
+                neighbors.append(list())
+                arc_edges.append(list())
+            return node_indices[node.getID()]
+
+        for edge in net.getEdges():
+            if edge.getFunction() != "" or not edge.allows("pedestrian"):
+                continue
+            from_index = get_index(edge.getFromNode())
+            to_index = get_index(edge.getToNode())
+            neighbors[from_index].append((to_index, edge.getLength()))
+            neighbors[to_index].append((from_index, edge.getLength()))
+            arc_edges[from_index].append(edge.getID())
+            arc_edges[to_index].append(edge.getID())
+        return cls(node_ids, np.array(positions, dtype=float).reshape(-1, 2), neighbors, arc_edges)
+
+    def get_node_count(self) -> int:
+        return len(self.node_ids)
+
+    def get_nearest_node(self, x: float, y: float) -> (int, float):
+        """
+        Returns the index of the junction closest to the position and its beeline distance.
+        """
+        index = self.node_indices.get((round(x, 2), round(y, 2)))
+        if index is not None:
+            return index, 0.0
+        cell_x, cell_y = math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+        ring = 0
+        best = (-1, math.inf)
+        # a junction in ring r is at least (r - 1) cells away
+        while best[0] < 0 or (ring - 1) * self.cell_size <= best[1]:
+            for dx in range(-ring, ring + 1):
+                for dy in range(-ring, ring + 1):
+                    if max(abs(dx), abs(dy)) != ring:
+                        continue
+                    for candidate in self.grid.get((cell_x + dx, cell_y + dy), ()):
+                        distance = math.dist((x, y), self.coordinates[candidate])
+                        if distance < best[1]:
+                            best = (candidate, distance)
+            ring += 1
+            if ring > 1000:
+                break
+        return best
+
+    def get_nearest_nodes(self, points: np.ndarray) -> (np.ndarray, np.ndarray):
+        nearest = [self.get_nearest_node(float(x), float(y)) for x, y in points]
+        return (np.array([index for index, _ in nearest], dtype=np.int64),
+                np.array([distance for _, distance in nearest], dtype=float))
+
+    def get_walking_distances(self, x: float, y: float) -> np.ndarray:
+        """
+        Returns the walking distance from the position to every junction, np.inf for unreachable ones. The position
+        enters the graph at its closest junction.
+        """
+        key = (round(x, 2), round(y, 2))
+        if key not in self.trees:
+            source, offset = self.get_nearest_node(x, y)
+            self.trees[key] = self.get_distances_from_nodes({source: offset})
+        return self.trees[key]
+
+    def get_distances_from_nodes(self, sources: dict[int, float]) -> np.ndarray:
+        """
+        Returns the walking distance from the closest of the source junctions to every junction, np.inf for
+        unreachable ones.
+
+        :param sources: initial distance by source junction index
+        """
+        distances = [math.inf] * len(self.node_ids)
+        queue = list()
+        for source, offset in sources.items():
+            distances[source] = min(distances[source], offset)
+            queue.append((distances[source], source))
+        heapq.heapify(queue)
+        neighbors = self.neighbors
+        while queue:
+            distance, node = heapq.heappop(queue)
+            if distance > distances[node]:
+                continue
+            for neighbor, length in neighbors[node]:
+                new_distance = distance + length
+                if new_distance < distances[neighbor]:
+                    distances[neighbor] = new_distance
+                    heapq.heappush(queue, (new_distance, neighbor))
+        return np.array(distances, dtype=float)
+
+    def get_shortest_path_tree(self, sources: dict[int, float]) -> (list[float], list[int], list[str]):
+        """
+        Like get_distances_from_nodes, but also returns the predecessor junction and the edge leading to it for every
+        junction, -1 and "" for the sources and unreachable junctions. Requires arc_edges.
+        """
+        distances = [math.inf] * len(self.node_ids)
+        predecessors = [-1] * len(self.node_ids)
+        predecessor_edges = [""] * len(self.node_ids)
+        queue = list()
+        for source, offset in sources.items():
+            distances[source] = min(distances[source], offset)
+            queue.append((distances[source], source))
+        heapq.heapify(queue)
+        neighbors = self.neighbors
+        arc_edges = self.arc_edges
+        while queue:
+            distance, node = heapq.heappop(queue)
+            if distance > distances[node]:
+                continue
+            for (neighbor, length), edge_id in zip(neighbors[node], arc_edges[node]):
+                new_distance = distance + length
+                if new_distance < distances[neighbor]:
+                    distances[neighbor] = new_distance
+                    predecessors[neighbor] = node
+                    predecessor_edges[neighbor] = edge_id
+                    heapq.heappush(queue, (new_distance, neighbor))
+        return distances, predecessors, predecessor_edges
+
+    def find_path(self, sources: dict[int, float], targets: dict[int, float]) -> (float, list[str]):
+        """
+        Returns the shortest walking distance from any of the source junctions to any of the target junctions and the
+        edges of that path from the source to the target, (np.inf, []) if no target can be reached. An A* search,
+        guided by the beeline distance to the closest target.
+
+        :param sources: initial distance by source junction index
+        :param targets: distance added when arriving at a target junction, by junction index
+        """
+        target_coordinates = [self.coordinates[target] for target in targets]
+
+        def estimate(node):
+            return min(math.dist(self.coordinates[node], coordinates) for coordinates in target_coordinates)
+
+        distances = dict()
+        predecessors = dict()
+        queue = list()
+        for source, offset in sources.items():
+            if offset < distances.get(source, math.inf):
+                distances[source] = offset
+                predecessors[source] = (-1, "")
+                queue.append((offset + estimate(source), offset, source))
+        heapq.heapify(queue)
+        best = (math.inf, -1)
+        while queue:
+            bound, distance, node = heapq.heappop(queue)
+            if bound >= best[0]:
+                break
+            if distance > distances[node]:
+                continue
+            if node in targets and distance + targets[node] < best[0]:
+                best = (distance + targets[node], node)
+            for (neighbor, length), edge_id in zip(self.neighbors[node], self.arc_edges[node]):
+                new_distance = distance + length
+                if new_distance < distances.get(neighbor, math.inf):
+                    distances[neighbor] = new_distance
+                    predecessors[neighbor] = (node, edge_id)
+                    heapq.heappush(queue, (new_distance + estimate(neighbor), new_distance, neighbor))
+        if best[1] < 0:
+            return math.inf, []
+        edges = list()
+        node = best[1]
+        while predecessors[node][0] >= 0:
+            node, edge_id = predecessors[node]
+            edges.append(edge_id)
+        return best[0], edges[::-1]
+
+
+def get_tree_path(predecessors: list[int], predecessor_edges: list[str], node: int) -> list[str]:
+    """
+    Returns the edges from the junction to the source of a shortest path tree of get_shortest_path_tree.
+    """
+    edges = list()
+    while predecessors[node] >= 0:
+        edges.append(predecessor_edges[node])
+        node = predecessors[node]
+    return edges
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+import argparse
+import json
+import os
+import subprocess
+import threading
+from datetime import datetime
+import simConfig as config
+import uamHubConfig
+from cacheUtils import file_digest, value_digest, module_values, get_sumocfg_files, write_json_atomic
+
+completion_file_name = "run-complete.json"
+
+# values which do not influence the results of a single simulation run
+fingerprint_excluded_keys = {"verbosity", "results_folder_path", "results_folder", "scenario_path", "run_index_file",
+                             "use_run_cache", "no_gui", "loop", "parallel_runs", "uam_step_size", "uam_start_density",
+                             "uam_upper_bound", "uam_hub_count", "scenarios", "record_trace", "reuse_sumo_process",
+                             "memory_report_interval", "checkpoint_interval"}
+
+_index_lock = threading.Lock()
+_sumo_versions = dict()
+
+
+def get_sumo_version(sumo_binary: str) -> str:
+    """
+    Returns the first line of "sumo --version". The result is cached per binary, as it does not change during a sweep.
+    """
+    if sumo_binary not in _sumo_versions:
+        try:
+            output = subprocess.run([sumo_binary, "--version"], capture_output=True, text=True).stdout
+            _sumo_versions[sumo_binary] = output.splitlines()[0].strip() if output else "unknown"
+        except OSError:
+            _sumo_versions[sumo_binary] = "unknown"
+    return _sumo_versions[sumo_binary]
+
+
+def compute_run_fingerprint(scenario_path: str, config_values: dict, seed, sumo_version: str) -> str:
+    """
+    Computes a fingerprint over everything that determines the outcome of a simulation run: the sumocfg and all
+    referenced net, route and additional files, the effective simConfig and uamHubConfig values, the seed and the
+    SUMO version.
+
+    :param config_values: effective run config values after all command line overrides have been applied
+    """
+    # files are keyed by their path relative to the sumocfg, so that files with the same name in different
+    # directories are told apart, while moving the whole scenario keeps the fingerprint
+    sumocfg_dir_path = os.path.dirname(scenario_path) or "."
+    file_digests = dict()
+    for path in [scenario_path] + get_sumocfg_files(scenario_path):
+        relative_path = os.path.relpath(path, sumocfg_dir_path).replace(os.sep, "/")
+        file_digests[relative_path] = file_digest(path) if os.path.isfile(path) else "missing"
+
+    fingerprint_values = {
+        "files": file_digests,
+        "simConfig": {key: value for key, value in config_values.items() if key not in fingerprint_excluded_keys},
+        "uamHubConfig": module_values(uamHubConfig),
+        "seed": seed,
+        "sumo_version": sumo_version,
+    }
+    return value_digest(fingerprint_values)
+
+
+def load_index(index_path: str = config.run_index_file) -> dict:
+    if not os.path.isfile(index_path):
+        return dict()
+    with open(index_path, 'r') as index_file:
+        return json.load(index_file)
+
+
+def is_complete(results_folder: str, fingerprint: str) -> bool:
+    completion_path = os.path.join(results_folder, completion_file_name)
+    if not os.path.isfile(completion_path):
+        return False
+    with open(completion_path, 'r') as completion_file:
+        return json.load(completion_file).get("fingerprint") == fingerprint
+
+
+def lookup(fingerprint: str, index_path: str = config.run_index_file) -> str:
+    """
+    Returns the results folder of a complete run with the given fingerprint, or "" if the configuration has not been
+    simulated yet.
+    """
+    entry = load_index(index_path).get(fingerprint)
+    if entry is None or not is_complete(entry["results_folder"], fingerprint):
+        return ""
+    return entry["results_folder"]
+
+
+def mark_complete(results_folder: str, fingerprint: str, metadata: dict, index_path: str = config.run_index_file):
+    """
+    Marks a results folder as complete and registers it in the run index. Only call this after all result files of the
+    run have been written and closed.
+    """
+    entry = dict(metadata)
+    entry["fingerprint"] = fingerprint
+    entry["results_folder"] = results_folder
+    entry["completed"] = datetime.now().isoformat(timespec="seconds")
+    write_json_atomic(os.path.join(results_folder, completion_file_name), entry)
+
+    with _index_lock:
+        index_dir = os.path.dirname(index_path)
+        if index_dir != "" and not os.path.exists(index_dir):
+            os.makedirs(index_dir)
+        index = load_index(index_path)
+        index[fingerprint] = entry
+        write_json_atomic(index_path, index)
+
+
+def prune_index(index_path: str = config.run_index_file) -> int:
+    """
+    Removes all index entries whose results folder was deleted or never completed. Returns the number of removed entries.
+    """
+    with _index_lock:
+        index = load_index(index_path)
+        stale = [fingerprint for fingerprint, entry in index.items()
+                 if not is_complete(entry["results_folder"], fingerprint)]
+        for fingerprint in stale:
+            del index[fingerprint]
+        if stale:
+            write_json_atomic(index_path, index)
+    return len(stale)
+
+
+def get_options():
+    """
+    Command line options using the argparse library
+    """
+    arg_parser = argparse.ArgumentParser(description="Lists and maintains the index of completed simulation runs.")
+    arg_parser.add_argument("--index", dest="index", type=str, default=config.run_index_file,
+                            help="Default = " + config.run_index_file + ". Path to the run index file.")
+    arg_parser.add_argument("--scenario", dest="scenario", type=str,
+                            help="Only list runs of the given scenario.")
+    arg_parser.add_argument("--prune", action="store_true", default=False,
+                            help="Remove index entries whose results folder no longer exists or is incomplete.")
+    return arg_parser.parse_args()
+
+
+if __name__ == '__main__':
+    options = get_options()
+    if options.prune:
+        print("removed " + str(prune_index(options.index)) + " stale entries from " + options.index)
+    for run_fingerprint, run_entry in sorted(load_index(options.index).items(), key=lambda x: x[1]["completed"]):
+        if options.scenario is not None and run_entry.get("scenario") != options.scenario:
+            continue
+        print(run_fingerprint[:12], run_entry["completed"], run_entry.get("scenario"),
+              "uam_density=" + str(run_entry.get("uam_density")), run_entry["results_folder"])
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+import gzip
+import os
+import pickle
+import xml.etree.ElementTree as ET
+
+# increase when the content of the checkpoint changes, older checkpoints cannot be resumed afterward
+checkpoint_version = 1
+checkpoint_file_name = "checkpoint.pickle"
+# the stages of a person plan in a SUMO state file, other child elements like params are ignored
+stage_tags = ("walk", "ride", "stop", "personTrip", "transport", "tranship")
+
+
+def get_checkpoint_path(results_folder: str) -> str:
+    return os.path.join(results_folder, checkpoint_file_name)
+
+
+def get_state_path(results_folder: str, time: float) -> str:
+    return os.path.join(results_folder, "checkpoint-{:.0f}.xml.gz".format(time))
+
+
+def write_checkpoint(results_folder: str, checkpoint: dict):
+    """
+    Writes the controller state of a run next to the SUMO state file it belongs to. The checkpoint is replaced
+    atomically after the new SUMO state was saved, so an interrupted run always leaves a complete pair behind.
+    """
+    checkpoint_path = get_checkpoint_path(results_folder)
+    temp_path = checkpoint_path + ".tmp" + str(os.getpid())
+    with open(temp_path, 'wb') as checkpoint_file:
+        pickle.dump(dict(checkpoint, version=checkpoint_version), checkpoint_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, checkpoint_path)
+
+
+def read_checkpoint(results_folder: str) -> dict:
+    with open(get_checkpoint_path(results_folder), 'rb') as checkpoint_file:
+        checkpoint = pickle.load(checkpoint_file)
+    if checkpoint.get("version") != checkpoint_version:
+        raise ValueError("checkpoint in \"" + results_folder + "\" was written by another version of the controller")
+    return checkpoint
+
+
+def remove_state_files(results_folder: str, keep_state_path: str = ""):
+    """
+    Removes the SUMO state files of earlier checkpoints of a results folder, all of them if keep_state_path is empty.
+    """
+    for file_name in os.listdir(results_folder):
+        path = os.path.join(results_folder, file_name)
+        if file_name.startswith("checkpoint-") and file_name.endswith(".xml.gz") and path != keep_state_path:
+            os.remove(path)
+
+
+def remove_checkpoint(results_folder: str):
+    if os.path.isfile(get_checkpoint_path(results_folder)):
+        os.remove(get_checkpoint_path(results_folder))
+    remove_state_files(results_folder)
+
+
+def prepare_state_file(state_path: str, out_path: str) -> int:
+    """
+    Copies a SUMO state file for --load-state without the stages the persons finished before the state was saved.
+    SUMO checks the plans of loaded persons from their first stage on, which fails for customers that wait at a hub,
+    as their taxi reservation is registered at the start of their first walk, and for customers whose walk to a hub
+    was cut short to walk to their destination instead. Returns the number of removed stages.
+    """
+    with gzip.open(state_path, 'rb') as state_file:
+        tree = ET.parse(state_file)
+    removed_stages = 0
+    for person in tree.getroot().iter("person"):
+        stages = [child for child in person if child.tag in stage_tags]
+        state = person.get("state", "").split()
+        # the second value is the index of the current stage, counting the initial waiting stage SUMO adds to a plan
+        if len(state) < 2 or not 1 < int(state[1]) <= len(stages):
+            continue
+        for stage in stages[:int(state[1]) - 1]:
+            person.remove(stage)
+            removed_stages += 1
+        state[1] = "1"
+        person.set("state", " ".join(state))
+    with gzip.open(out_path, 'wb') as out_file:
+        tree.write(out_file, encoding="UTF-8", xml_declaration=True)
+    return removed_stages
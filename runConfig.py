@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+import dataclasses
+from dataclasses import dataclass
+import simConfig as config
+from cacheUtils import module_values
+
+
+@dataclass(frozen=True)
+class RunConfig:
+    """
+    Immutable configuration of a single simulation run. The defaults are taken from simConfig.py, command line
+    overrides are applied once at startup and values that change per run (e.g. the uam density of a loop iteration)
+    are set by creating a modified copy with dataclasses.replace. See simConfig.py for the meaning of each value.
+    """
+    scenario: str
+    scenario_path: str
+    results_folder_path: str
+    run_index_file: str
+    no_gui: bool
+    step_length: float
+    loop: bool
+    parallel_runs: int
+    reuse_sumo_process: bool
+    exact_distance_calculation: bool
+    seconds_to_simulate: int
+    verbosity: int
+    uam_vehicles_per_hub: int
+    uam_vehicle_capacity: int
+    group_finding_time: int
+    lateral_resolution: float
+    alternative_edge_radius: float
+    conversion_vClasses: tuple[str, ...]
+    seed: int
+    use_run_cache: bool
+    record_trace: bool
+    memory_report_interval: int
+    checkpoint_interval: int
+    stale_entry_max_age: int
+    catchment_prefilter: bool
+    catchment_circuity: float
+    catchment_audit_interval: int
+    intermodal_router: str
+    router_walking_speed: float
+    router_taxi_waiting_time: float
+    mode_choice_backend: str
+    mode_choice_batch_size: int
+    mode_choice_max_concurrency: int
+    mode_choice_timeout: float
+    mode_choice_stub_latency: float
+    uam_step_size: float
+    uam_start_density: float
+    uam_upper_bound: float
+    uam_density: float
+    outputFilesActive: bool
+    statsOutput: bool
+    summaryOutput: bool
+    tripinfoOutput: bool
+    vehroutesOutput: bool
+    personsummaryOutput: bool
+    fullOutput: bool
+    ndumpOutput: bool
+    fcdOutput: bool
+    queueOutput: bool
+    edgedataOutput: bool
+    lanedataOutput: bool
+    lanechangeOutput: bool
+    amitranOutput: bool
+    linkOutput: bool
+    personinfoOutput: bool
+    emissionOutput: bool
+    uam_hub_count: int | str = "NULL"   # determined from the loaded network at the start of each run
+    results_folder: str = ""            # results folder of this particular run
+
+
+def build_run_config(**overrides) -> RunConfig:
+    """
+    Creates a RunConfig from the simConfig.py defaults. Keyword arguments that are not None override the defaults.
+    """
+    field_names = {field.name for field in dataclasses.fields(RunConfig)}
+    values = {key: value for key, value in module_values(config).items() if key in field_names}
+    values.setdefault("scenario_path", config.scenarios.get(config.scenario, ""))
+    for key, value in overrides.items():
+        if value is not None:
+            values[key] = value
+    values["conversion_vClasses"] = tuple(values["conversion_vClasses"])
+    return RunConfig(**values)
+
+
+def get_density_sweep(run_config: RunConfig) -> list[RunConfig]:
+    """
+    Returns one RunConfig per uam density of a loop, from uam_start_density up to uam_upper_bound in steps of
+    uam_step_size. Without the loop option, only the configured uam_density is simulated.
+    """
+    if not run_config.loop:
+        return [run_config]
+    run_configs = list()
+    uam_density = run_config.uam_start_density
+    while uam_density <= run_config.uam_upper_bound:
+        if uam_density > 1.0:  # we can't convert over 100% of vehicles to alternatives
+            break
+        run_configs.append(dataclasses.replace(run_config, uam_density=uam_density))
+        if run_config.uam_step_size == 0.0:
+            break
+        uam_density += run_config.uam_step_size
+    return run_configs
@@ -2,6 +2,8 @@
 import os
 
 results_folder_path = os.path.join("results")   # path where simulation results are stored
+run_index_file = os.path.join("results", "run-index.json")  # index of completed runs, used to skip already simulated configurations
+cache_folder_path = os.path.join(".uam_cache")    # cached network indices, keyed by the content of the net file
 
 scenarios = {
     "test": os.path.join("scenarios", "taxiTesting2", "taxiTesting2.sumocfg"),
@@ -15,6 +17,8 @@ scenario = "Ingolstadt"
 no_gui = False                  # whether sumo should be run using sumo-gui or on command line
 step_length = 1                 # granularity of simulation. Defines the step length in seconds
 loop = False                    # whether the simulation should be run multiple times in a row, looping through densities
+parallel_runs = 1               # how many simulations of a loop are run at the same time, each with its own sumo instance
+reuse_sumo_process = False      # whether the simulations of a loop reload the sumo instance of the previous simulation with traci.load instead of starting a new one
 exact_distance_calculation = False   # whether the exact distance should be calculated when determining the distance between an escooter to all other pedestrians on the same lane
 seconds_to_simulate = 7200      # maximum amount of seconds simulated
 verbosity = 2                   # verbosity of command line output: 0 = NONE, 1 = SPARSE, 2 = NORMAL, 3 = VERBOSE
@@ -25,6 +29,23 @@ lateral_resolution = 0.7        # divides the lanes into x meter wide strips, ne
 alternative_edge_radius = 300   # radius in meter around the from-junction when looking for an alternative edge for vehicle to uam pedestrian conversion
 uam_hub_count = "NULL"
 conversion_vClasses = ['passenger', 'private', 'motorcycle', 'moped', 'evehicle', 'hov']  # list of vClasses eligible for conversion to uam/mm users
+seed = 23                       # seed for the random number generators of sumo and the uam customer conversion
+use_run_cache = True            # whether runs whose fingerprint already has a complete results folder are skipped
+record_trace = False            # whether all TraCI requests and responses of a run are recorded for replaying them with traciReplay.py
+memory_report_interval = 0      # every x simulated seconds, traced memory and the size of the uam state containers are written to uam-memory-log.csv. 0 disables the instrumentation
+checkpoint_interval = 0         # every x simulated seconds, the sumo state and the controller state are saved to the results folder, so an interrupted run can be continued with --resume. 0 disables the checkpoints
+stale_entry_max_age = 0         # seconds after which customers and reservations of persons that left the simulation unnoticed are evicted, e.g. 14400. 0 disables the eviction
+catchment_prefilter = False     # whether trips whose walks to and from the closest hubs are longer than the trip itself are not routed intermodally, see hubCatchment.py
+catchment_circuity = 1.2        # factor on the straight-line trip distance that the walks to and from the closest hubs are compared with, higher values skip fewer trips
+catchment_audit_interval = 20   # every x-th trip skipped by the catchment prefilter is still routed to count wrongly skipped trips. 0 disables the audit
+intermodal_router = "sumo"      # "sumo" asks SUMO's findIntermodalRoute for every conversion, "python" uses the precomputed hub distances of uamRouter.py
+router_walking_speed = 1.04     # walking speed in m/s of the python router, SUMO's default pedestrian speed of 1.39 m/s times its default persontrip.walkfactor of 0.75
+router_taxi_waiting_time = 300  # estimated waiting time in seconds for an Air Taxi of the python router, like SUMO's persontrip.taxi.waiting-time
+mode_choice_backend = ""         # decides for every new uam customer whether to fly or walk, see modeChoice.py. "" disables the mode choice, "stub" uses the deterministic test backend, "module:ClassName" a ModeChoiceBackend subclass
+mode_choice_batch_size = 16     # max amount of decision requests sent to the mode choice backend at once
+mode_choice_max_concurrency = 4 # max amount of batches the mode choice backend decides at the same time
+mode_choice_timeout = 10.0      # seconds of wall clock time after which an unanswered batch is dropped, its customers keep their planned uam trip
+mode_choice_stub_latency = 0.05 # seconds of wall clock time the stub backend takes to answer a batch
 
 
 #--- loop and density settings ---#
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+import argparse
+import cProfile
+import dataclasses
+import gzip
+import importlib.util
+import json
+import os
+import pstats
+import struct
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+# we need to import some python modules from the $SUMO_HOME/tools directory
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+elif importlib.util.find_spec("traci") is None:  # the pip packages traci and sumolib work without SUMO
+    sys.exit("please declare environment variable 'SUMO_HOME'")
+
+import traci.constants as tc
+from traci.connection import Connection
+from traci.domain import DOMAINS
+from traci.exceptions import FatalTraCIError
+from traci.storage import Storage
+from traci.step import StepManager
+import simConfig as config
+from networkCache import load_edge_index
+
+trace_file_name = "traci-trace.bin.gz"
+trace_magic = b"UAMTRACE"
+trace_format_version = 1
+_record_header = struct.Struct("!II")
+
+
+def get_command_id(request: bytes) -> int:
+    """
+    Returns the id of the first TraCI command in a request. Short commands store their length in one byte,
+    long commands have a zero byte followed by a four byte length.
+    """
+    if request[0] == 0:
+        return request[5]
+    return request[1]
+
+
+class TraceRecorder:
+    """
+    Records every request sent over a TraCI connection together with SUMO's raw response into a gzip compressed
+    trace file. Attach it right after traci.start and close it after the connection was closed.
+    """
+
+    def __init__(self, conn: Connection, trace_path: str, metadata: dict):
+        self.conn = conn
+        self.trace_file = gzip.open(trace_path, 'wb')
+        header = json.dumps(metadata, default=str).encode("utf-8")
+        self.trace_file.write(trace_magic + struct.pack("!BI", trace_format_version, len(header)) + header)
+        self.record_count = 0
+        self._recv_exact = conn._recvExact
+        # instance attribute shadows the method, the request is still stored in conn._string while receiving
+        conn._recvExact = self._recording_recv_exact
+
+    def _recording_recv_exact(self):
+        result = self._recv_exact()
+        if result is not None:
+            request = self.conn._string
+            self.trace_file.write(_record_header.pack(len(request), len(result._content)) + request + result._content)
+            self.record_count += 1
+        return result
+
+    def close(self):
+        self.trace_file.close()
+
+
+def get_trace_metadata(run_config, net_path: str, sumo_version: str) -> dict:
+    return {"run_config": dataclasses.asdict(run_config), "net_path": net_path, "sumo_version": sumo_version,
+            "created": datetime.now().isoformat(timespec="seconds")}
+
+
+def read_trace(trace_path: str) -> (dict, list[(bytes, bytes)]):
+    """
+    Returns the metadata and all (request, response) records of a trace file.
+    """
+    with gzip.open(trace_path, 'rb') as trace_file:
+        data = trace_file.read()
+    if data[:len(trace_magic)] != trace_magic:
+        raise ValueError("\"" + trace_path + "\" is not a TraCI trace file.")
+    version, header_length = struct.unpack_from("!BI", data, len(trace_magic))
+    if version != trace_format_version:
+        raise ValueError("\"" + trace_path + "\" has trace format version " + str(version) + ", expected "
+                         + str(trace_format_version))
+    pos = len(trace_magic) + 5
+    metadata = json.loads(data[pos:pos + header_length])
+    pos += header_length
+    records = list()
+    while pos < len(data):
+        request_length, response_length = _record_header.unpack_from(data, pos)
+        pos += _record_header.size
+        request = data[pos:pos + request_length]
+        pos += request_length
+        records.append((request, data[pos:pos + response_length]))
+        pos += response_length
+    return metadata, records
+
+
+class _ReplaySocket:
+    def send(self, data):
+        pass
+
+    def close(self):
+        pass
+
+
+class ReplayConnection(Connection):
+    """
+    Stand-in for a TraCI connection that serves SUMO's responses from a trace file instead of a running SUMO.
+    It offers the same domains (simulation, vehicle, person, parkingarea, lane, edge, junction, ...) as a real
+    connection, so the controller can be run without SUMO.
+
+    Responses are looked up per simulation step by the exact request. If the controller asks the same question more
+    often in a step than during the recording, the last recorded answer of that step is repeated, so optimizations
+    that remove redundant calls can be replayed as well. Requests that were never sent in a step raise an error.
+    """
+
+    def __init__(self, trace_path: str):
+        StepManager.__init__(self)
+        self._socket = _ReplaySocket()
+        self._process = None
+        self._string = bytes()
+        self._queue = []
+        self._subscriptionMapping = {}
+        self._lock = threading.Lock()
+        for domain in DOMAINS:
+            domain._register(self, self._subscriptionMapping)
+        self._label = None
+
+        self.metadata, records = read_trace(trace_path)
+        self._steps = [dict()]
+        for request, response in records:
+            self._steps[-1].setdefault(request, deque()).append(response)
+            if get_command_id(request) == tc.CMD_SIMSTEP:
+                self._steps.append(dict())
+        self._step_index = 0
+        self._last_responses = dict()
+
+    def _recvExact(self):
+        request = self._string
+        if self._step_index >= len(self._steps):
+            raise FatalTraCIError("Trace exhausted, the controller simulated more steps than recorded.")
+        responses = self._steps[self._step_index].get(request)
+        if responses:
+            response = responses.popleft()
+            self._last_responses[request] = response
+        elif request in self._last_responses:
+            response = self._last_responses[request]
+        else:
+            raise FatalTraCIError("Request was not recorded in step " + str(self._step_index) + " of the trace.")
+        if get_command_id(request) == tc.CMD_SIMSTEP:
+            self._step_index += 1
+            self._last_responses = dict()
+        return Storage(response)
+
+
+def get_options():
+    """
+    Command line options using the argparse library
+    """
+    arg_parser = argparse.ArgumentParser(description="Replays a TraCI trace recorded with uamTraCI.py --record_trace "
+                                                     "against the controller, without running SUMO.")
+    arg_parser.add_argument("trace_path", type=str, help="Path to the " + trace_file_name + " file.")
+    arg_parser.add_argument("--net", dest="net", type=str,
+                            help="Path to the network of the recorded scenario. Defaults to the recorded path.")
+    arg_parser.add_argument("--cache_folder", dest="cache_folder", type=str, default=config.cache_folder_path,
+                            help="Default = " + config.cache_folder_path + ". Folder of the cached network indices.")
+    arg_parser.add_argument("--repeat", dest="repeat", type=int, default=3,
+                            help="Default = 3. Number of replays, the fastest one is reported.")
+    arg_parser.add_argument("--profile", action="store_true", default=False,
+                            help="Profile one replay with cProfile and print the most expensive functions.")
+    return arg_parser.parse_args()
+
+
+def replay(trace_path: str, run_config, edge_index) -> (int, float):
+    """
+    Runs the controller against a trace. Returns the number of simulated steps and the wall time in seconds.
+    """
+    import uamTraCI
+    conn = ReplayConnection(trace_path)
+    uam_run = uamTraCI.UamRun(run_config, edge_index, conn)
+    steps = 0
+    start_time = time.perf_counter()
+    uam_run.start()
+    while uam_run.is_running():
+        uam_run.simulation_step()
+        steps += 1
+    uam_run.close()
+    return steps, time.perf_counter() - start_time
+
+
+if __name__ == '__main__':
+    from runConfig import RunConfig, build_run_config
+    options = get_options()
+    trace_metadata, _ = read_trace(options.trace_path)
+    # options added after the trace was recorded keep their simConfig.py defaults
+    recorded_config = dataclasses.asdict(build_run_config())
+    recorded_config.update(trace_metadata["run_config"])
+    recorded_config["conversion_vClasses"] = tuple(recorded_config["conversion_vClasses"])
+    replay_edge_index = load_edge_index(options.net if options.net else trace_metadata["net_path"],
+                                        options.cache_folder)
+    print("replaying trace recorded " + trace_metadata["created"] + " with " + trace_metadata["sumo_version"])
+
+    with tempfile.TemporaryDirectory() as replay_results_folder:
+        replay_run_config = dataclasses.replace(RunConfig(**recorded_config), verbosity=0, no_gui=True,
+                                                results_folder=replay_results_folder)
+        if options.profile:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            replay(options.trace_path, replay_run_config, replay_edge_index)
+            profiler.disable()
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+        best_time = None
+        replay_steps = 0
+        for _ in range(options.repeat):
+            replay_steps, replay_time = replay(options.trace_path, replay_run_config, replay_edge_index)
+            best_time = replay_time if best_time is None else min(best_time, replay_time)
+        print("replayed " + str(replay_steps) + " steps in " + str(round(best_time, 3)) + " s ("
+              + str(round(replay_steps / best_time, 1)) + " steps/s, best of " + str(options.repeat) + ")")
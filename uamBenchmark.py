@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+import argparse
+import contextlib
+import dataclasses
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+# we need to import some python modules from the $SUMO_HOME/tools directory
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+else:
+    sys.exit("please declare environment variable 'SUMO_HOME'")
+
+import sumolib
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+benchmark_format_version = 1
+
+# metric name -> True if higher values are better
+compared_metrics = {
+    "hub_generation_s": False,
+    "controller_startup_s": False,
+    "controller_run_s": False,
+    "steps_per_s": True,
+    "traci_calls_per_step": False,
+    "peak_rss_mb": False,
+}
+
+
+def get_options():
+    """
+    Command line options using the argparse library
+    """
+    arg_parser = argparse.ArgumentParser(description="Scaling benchmark for createUamHubs.py and uamTraCI.py on "
+                                                     "synthetic networks.")
+    arg_parser.add_argument("--network", dest="network", type=str, default="grid", choices=("grid", "spider"),
+                            help="Default = grid. Type of the synthetic network generated with netgenerate.")
+    arg_parser.add_argument("--sizes", dest="sizes", type=int, nargs='+', default=[5, 10, 20],
+                            help="Default = 5 10 20. Network sizes: junctions per side for grid networks, "
+                                 "arms (with the same number of circles) for spider networks.")
+    arg_parser.add_argument("--vehicles", dest="vehicles", type=int, nargs='+', default=[200, 1000, 5000],
+                            help="Default = 200 1000 5000. Number of random trips, one value per network size.")
+    arg_parser.add_argument("--hub_counts", dest="hub_counts", type=int, nargs='+', default=[2, 5, 20, 50, 200],
+                            help="Default = 2 5 20 50 200. Number of uam hubs generated on every network.")
+    arg_parser.add_argument("--steps", dest="steps", type=int, default=600,
+                            help="Default = 600. Number of simulated seconds of each controller run.")
+    arg_parser.add_argument("--uam_density", dest="uam_density", type=float, default=0.3,
+                            help="Default = 0.3. Share of vehicles converted to uam customers in the controller runs.")
+    arg_parser.add_argument("--work_dir", dest="work_dir", type=str, default=os.path.join("benchmarks", "work"),
+                            help="Default = benchmarks/work. Directory for the generated scenarios and results.")
+    arg_parser.add_argument("-o", "--output", dest="output", type=str,
+                            help="Write the benchmark results to the given json file, e.g. to store a new baseline.")
+    arg_parser.add_argument("--baseline", dest="baseline", type=str,
+                            help="Compare the results against the given json file and exit with 1 on regressions.")
+    arg_parser.add_argument("--threshold", dest="threshold", type=float, default=0.1,
+                            help="Default = 0.1. Relative change of a metric compared to the baseline which is "
+                                 "reported as a regression.")
+    arg_parser.add_argument("--run_case", dest="run_case", type=str, help=argparse.SUPPRESS)
+    arg_parser.add_argument("--result_file", dest="result_file", type=str, help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+    if len(args.sizes) != len(args.vehicles):
+        arg_parser.error("--sizes and --vehicles need the same number of values")
+    return args
+
+
+def get_case_id(case: dict) -> str:
+    return "{}{}_veh{}_hubs{}".format(case["network"], case["size"], case["vehicles"], case["hub_count"])
+
+
+def generate_scenario(case: dict, scenario_dir: str) -> str:
+    """
+    Generates a synthetic network with sidewalks, random vehicle trips, an empty additionals file and a sumocfg
+    referencing all of them. Returns the path of the sumocfg.
+    """
+    if not os.path.exists(scenario_dir):
+        os.makedirs(scenario_dir)
+    net_file = os.path.join(scenario_dir, "bench.net.xml")
+    route_file = os.path.join(scenario_dir, "bench.rou.xml")
+    add_file = os.path.join(scenario_dir, "bench.add.xml")
+    sumocfg_file = os.path.join(scenario_dir, "bench.sumocfg")
+
+    netgenerate_call = [sumolib.checkBinary('netgenerate'), "--sidewalks.guess", "--default.lanenumber", "1",
+                        "--no-turnarounds", "-o", net_file]
+    if case["network"] == "grid":
+        netgenerate_call += ["--grid", "--grid.number", str(case["size"]), "--grid.length", "200"]
+    else:
+        netgenerate_call += ["--spider", "--spider.arm-number", str(case["size"]),
+                             "--spider.circle-number", str(case["size"]), "--spider.space-radius", "200"]
+    subprocess.run(netgenerate_call, check=True, stdout=subprocess.DEVNULL)
+
+    period = case["steps"] / case["vehicles"]
+    # --validate routes the trips with duarouter, whose routes are written to the working directory without -r
+    subprocess.run([sys.executable, os.path.join(os.environ['SUMO_HOME'], "tools", "randomTrips.py"),
+                    "-n", net_file, "-o", route_file, "-e", str(case["steps"]), "-p", str(period),
+                    "-r", os.path.join(scenario_dir, "bench.validated.rou.xml"), "--seed", "42", "--validate"],
+                   check=True, stdout=subprocess.DEVNULL)
+
+    with open(add_file, 'w') as outf:
+        outf.write("<additional>\n</additional>\n")
+    with open(sumocfg_file, 'w') as outf:
+        outf.write('<configuration>\n'
+                   '    <input>\n'
+                   '        <net-file value="bench.net.xml"/>\n'
+                   '        <route-files value="bench.rou.xml"/>\n'
+                   '        <additional-files value="bench.add.xml"/>\n'
+                   '    </input>\n'
+                   '</configuration>\n')
+    return sumocfg_file
+
+
+def get_hub_coordinates(net_file: str, hub_count: int) -> list[(float, float)]:
+    """
+    Spreads the hubs evenly over the network on a sunflower spiral, so that every hub count is deterministic.
+    """
+    x_min, y_min, x_max, y_max = sumolib.net.readNet(net_file).getBoundary()
+    centre = ((x_min + x_max) / 2, (y_min + y_max) / 2)
+    radius = 0.4 * min(x_max - x_min, y_max - y_min)
+    golden_angle = math.pi * (3 - math.sqrt(5))
+    coordinates = list()
+    for index in range(hub_count):
+        distance = radius * math.sqrt((index + 0.5) / hub_count)
+        angle = index * golden_angle
+        coordinates.append((round(centre[0] + distance * math.cos(angle), 2),
+                            round(centre[1] + distance * math.sin(angle), 2)))
+    return coordinates
+
+
+def get_peak_rss_mb(who) -> float | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is given in bytes on macOS and in kilobytes on Linux
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def run_case(case: dict) -> dict:
+    """
+    Runs a single benchmark case. Called in a fresh process for every case, so that the peak memory usage is not
+    influenced by previous cases.
+    """
+    import createUamHubs
+    import uamTraCI
+    import traci
+    from runConfig import build_run_config
+    from networkCache import load_edge_index
+
+    case_dir = os.path.join(case["work_dir"], get_case_id(case))
+    sumocfg_file = generate_scenario(case, case_dir)
+    coordinates = get_hub_coordinates(os.path.join(case_dir, "bench.net.xml"), case["hub_count"])
+    result = dict()
+
+    # caches are bypassed, so that every run measures the same work instead of the cache hits of earlier runs
+    start_time = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        createUamHubs.generate_hubs(sumocfg_file, coordinates, use_cache=False)
+    result["hub_generation_s"] = round(time.perf_counter() - start_time, 3)
+
+    uam_sumocfg_file = os.path.join(case_dir, str(case["hub_count"]) + "_uam_hubs_bench.sumocfg")
+    uam_net_file = os.path.join(case_dir, str(case["hub_count"]) + "_uam_hubs_bench.net.xml")
+    results_folder = os.path.join(case_dir, "results")
+    if not os.path.exists(results_folder):
+        os.makedirs(results_folder)
+    run_config = build_run_config(scenario="bench", scenario_path=uam_sumocfg_file, no_gui=True, loop=True,
+                                  verbosity=0, seconds_to_simulate=case["steps"], uam_density=case["uam_density"],
+                                  use_run_cache=False, results_folder_path=results_folder)
+    run_config = dataclasses.replace(run_config, results_folder=results_folder)
+
+    start_time = time.perf_counter()
+    edge_index = load_edge_index(uam_net_file, use_cache=False)
+    traci.start(uamTraCI.generate_start_config(sumolib.checkBinary('sumo'), run_config) + ["--no-step-log"],
+                label="benchmark")
+    conn = traci.getConnection("benchmark")
+
+    traci_calls = [0]
+    send_cmd = conn._sendCmd
+
+    def counting_send_cmd(*args, **kwargs):
+        traci_calls[0] += 1
+        return send_cmd(*args, **kwargs)
+
+    # instance attribute shadows the method, so every domain call of this connection is counted
+    conn._sendCmd = counting_send_cmd
+    uam_run = uamTraCI.UamRun(run_config, edge_index, conn)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        uam_run.start()
+    result["controller_startup_s"] = round(time.perf_counter() - start_time, 3)
+
+    traci_calls[0] = 0
+    steps = 0
+    start_time = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        while uam_run.is_running():
+            uam_run.simulation_step()
+            steps += 1
+    run_time = time.perf_counter() - start_time
+    uam_run.close()
+
+    result["controller_run_s"] = round(run_time, 3)
+    result["steps"] = steps
+    result["steps_per_s"] = round(steps / run_time, 2) if run_time > 0 else None
+    result["traci_calls_per_step"] = round(traci_calls[0] / steps, 2) if steps > 0 else None
+    result["edge_count"] = edge_index.get_edge_count()
+    result["peak_rss_mb"] = get_peak_rss_mb(resource.RUSAGE_SELF) if resource is not None else None
+    result["peak_children_rss_mb"] = get_peak_rss_mb(resource.RUSAGE_CHILDREN) if resource is not None else None
+    return result
+
+
+def get_git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return "unknown"
+
+
+def compare_to_baseline(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Returns a description of every metric that got worse than the baseline by more than the relative threshold.
+    """
+    regressions = list()
+    for case_id, case_result in results["cases"].items():
+        if case_id not in baseline["cases"]:
+            print("no baseline for case \"" + case_id + "\", skipping comparison.")
+            continue
+        for metric, higher_is_better in compared_metrics.items():
+            old_value = baseline["cases"][case_id].get(metric)
+            new_value = case_result.get(metric)
+            if old_value is None or new_value is None or old_value == 0:
+                continue
+            change = (new_value - old_value) / old_value
+            if higher_is_better:
+                change = -change
+            if change > threshold:
+                regressions.append("{}: {} {} -> {} ({:+.1%})".format(case_id, metric, old_value, new_value, change))
+    return regressions
+
+
+def main(options):
+    cases = list()
+    for size, vehicles in zip(options.sizes, options.vehicles):
+        for hub_count in options.hub_counts:
+            cases.append({"network": options.network, "size": size, "vehicles": vehicles, "hub_count": hub_count,
+                          "steps": options.steps, "uam_density": options.uam_density,
+                          "work_dir": os.path.abspath(options.work_dir)})
+
+    results = {"format_version": benchmark_format_version,
+               "created": datetime.now().isoformat(timespec="seconds"),
+               "git_revision": get_git_revision(),
+               "sumo_version": subprocess.run([sumolib.checkBinary('sumo'), "--version"], capture_output=True,
+                                              text=True).stdout.splitlines()[0],
+               "python_version": platform.python_version(),
+               "platform": platform.platform(),
+               "cases": dict()}
+
+    for case in cases:
+        case_id = get_case_id(case)
+        print("running benchmark case \"" + case_id + "\"")
+        result_file = os.path.join(os.path.abspath(options.work_dir), case_id + ".result.json")
+        if not os.path.exists(os.path.dirname(result_file)):
+            os.makedirs(os.path.dirname(result_file))
+        completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--run_case", json.dumps(case),
+                                    "--result_file", result_file],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                   cwd=os.path.dirname(os.path.abspath(__file__)))
+        if completed.returncode != 0 or not os.path.isfile(result_file):
+            print("Error: benchmark case \"" + case_id + "\" failed.")
+            results["cases"][case_id] = {"failed": True}
+            continue
+        with open(result_file, 'r') as inf:
+            results["cases"][case_id] = json.load(inf)
+        print("  " + ", ".join(key + "=" + str(value) for key, value in results["cases"][case_id].items()))
+
+    if options.output:
+        with open(options.output, 'w') as outf:
+            json.dump(results, outf, indent=2)
+        print("written benchmark results to \"" + options.output + "\"")
+
+    if options.baseline:
+        with open(options.baseline, 'r') as inf:
+            baseline = json.load(inf)
+        if baseline.get("format_version") != benchmark_format_version:
+            sys.exit("baseline \"" + options.baseline + "\" has format version " + str(baseline.get("format_version"))
+                     + ", expected " + str(benchmark_format_version))
+        regressions = compare_to_baseline(results, baseline, options.threshold)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        if regressions:
+            sys.exit(1)
+        print("no regressions compared to \"" + options.baseline + "\"")
+
+
+if __name__ == "__main__":
+    options = get_options()
+    if options.run_case is not None:
+        case_result = run_case(json.loads(options.run_case))
+        with open(options.result_file, 'w') as outfile:
+            json.dump(case_result, outfile)
+    else:
+        main(options)
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+import argparse
+import csv
+import os
+import sys
+import time
+import importlib.util
+import numpy as np
+import simConfig as config
+import uamHubConfig
+import hubTopology
+from cacheUtils import get_sumocfg_files
+from networkCache import load_edge_index
+from pedestrianGraph import PedestrianGraph
+from uamHubPlacement import TripSample, read_trips, get_candidates
+
+# we need to import some python modules from the $SUMO_HOME/tools directory
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+elif importlib.util.find_spec("sumolib") is None:  # the pip package sumolib works without SUMO
+    sys.exit("please declare environment variable 'SUMO_HOME'")
+
+import sumolib
+
+default_walking_speed = 1.39    # desired walking speed of SUMO's default pedestrian type in m/s
+trip_chunk_size = 2000          # trips evaluated at once, limits the size of the trips x hubs x hubs travel times
+
+
+def get_options():
+    """
+    Command line options using the argparse library
+    """
+    arg_parser = argparse.ArgumentParser(description="Estimates the uam demand of hub layouts from the network and the "
+                                                     "route files of a scenario, without simulating it.")
+    arg_parser.add_argument("sumocfg_path", type=str, help="Path to the sumocfg of the scenario without uam hubs.")
+    arg_parser.add_argument("coordinates", type=float, nargs='*',
+                            help="Hub coordinates of one layout, x first, followed by y, like for createUamHubs.py.")
+    arg_parser.add_argument("--layout", dest="layouts", type=str, nargs='+',
+                            help="Names of layouts in the layout file to estimate.")
+    arg_parser.add_argument("--all_layouts", action="store_true", default=False,
+                            help="Estimate all layouts of the layout file.")
+    arg_parser.add_argument("--layout_file", dest="layout_file", type=str, default="uam_hub_locations.txt",
+                            help="Default = uam_hub_locations.txt. File with one hub layout per line.")
+    arg_parser.add_argument("--random_layouts", dest="random_layouts", type=int, default=0,
+                            help="Default = 0. Number of random layouts of --hub_count hubs to screen, the hubs are "
+                                 "drawn from --candidates trip ends.")
+    arg_parser.add_argument("--hub_count", dest="hub_count", type=int, default=5,
+                            help="Default = 5. Number of hubs of the random layouts.")
+    arg_parser.add_argument("--candidates", dest="candidates", type=int, default=100,
+                            help="Default = 100. Number of trip ends random layouts are drawn from.")
+    arg_parser.add_argument("--max_trips", dest="max_trips", type=int, default=20000,
+                            help="Default = 20000. Maximum number of trips sampled from the route files.")
+    arg_parser.add_argument("--walking_speed", dest="walking_speed", type=float, default=default_walking_speed,
+                            help="Default = " + str(default_walking_speed) + ". Walking speed in m/s.")
+    arg_parser.add_argument("--seed", dest="seed", type=int, default=config.seed,
+                            help="Default = " + str(config.seed) + ". Seed for sampling trips and random layouts.")
+    arg_parser.add_argument("--output", dest="output", type=str,
+                            help="Write the estimates of all layouts to this csv file, best layout first.")
+    return arg_parser.parse_args()
+
+
+def get_flight_times(hubs: np.ndarray) -> np.ndarray:
+    """
+    Returns the hubs x hubs matrix of flight times in seconds including pick up and drop off, along the connections
+    of the configured uam_hub_topology. Flights between hubs without a direct connection stop over at other hubs.
+    """
+    locations = {index: (float(x), float(y)) for index, (x, y) in enumerate(hubs)}
+    neighbors = hubTopology.get_hub_neighbors(locations, uamHubConfig.uam_hub_topology,
+                                              uamHubConfig.uam_hub_connection_radius,
+                                              uamHubConfig.uam_hub_topology_neighbors)
+    distances = np.hypot(hubs[:, None, 0] - hubs[None, :, 0], hubs[:, None, 1] - hubs[None, :, 1])
+    times = np.full((len(hubs), len(hubs)), np.inf)
+    for index, others in neighbors.items():
+        for other in others:
+            times[index, other] = distances[index, other] / uamHubConfig.uam_con_edge_speed
+    np.fill_diagonal(times, 0)
+    for via in range(len(hubs)):
+        times = np.minimum(times, times[:, via, None] + times[None, via, :])
+    times += uamHubConfig.uam_pick_up_duration + uamHubConfig.uam_drop_off_duration
+    np.fill_diagonal(times, np.inf)     # a flight to the same hub is never faster than walking
+    return times
+
+
+class DemandEstimator:
+    """
+    Estimates for hub layouts how many trips would be faster with uam than walking. A uam trip walks from its origin
+    to a hub, flies to another hub and walks to its destination. The walking distances come from one pedestrian
+    shortest path tree per hub location, which is reused by every layout containing the hub. Walking the whole trip
+    is estimated from its beeline distance and the circuity of the pedestrian network.
+    """
+
+    def __init__(self, graph: PedestrianGraph, origins: np.ndarray, destinations: np.ndarray, counts: np.ndarray,
+                 walking_speed: float = default_walking_speed):
+        self.graph = graph
+        self.counts = counts
+        self.walking_speed = walking_speed
+        self.origin_nodes, self.origin_offsets = graph.get_nearest_nodes(origins)
+        self.destination_nodes, self.destination_offsets = graph.get_nearest_nodes(destinations)
+        self.circuity = self.estimate_circuity(origins)
+        self.walking_times = np.hypot(*(destinations - origins).T) * self.circuity / walking_speed
+
+    def estimate_circuity(self, points: np.ndarray, samples: int = 5, min_distance: float = 200) -> float:
+        """
+        Median ratio of walking distance to beeline distance from a few trip origins to all junctions.
+        """
+        ratios = list()
+        for x, y in points[np.linspace(0, len(points) - 1, min(samples, len(points))).astype(int)]:
+            walking_distances = self.graph.get_walking_distances(float(x), float(y))
+            beeline = np.hypot(self.graph.positions[:, 0] - x, self.graph.positions[:, 1] - y)
+            valid = (beeline >= min_distance) & np.isfinite(walking_distances)
+            ratios.append(walking_distances[valid] / beeline[valid])
+        ratios = np.concatenate(ratios) if ratios else np.array([])
+        return float(np.median(ratios)) if len(ratios) > 0 else 1.0
+
+    def get_walking_times(self, hubs: np.ndarray, nodes: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+        """
+        Returns the trips x hubs matrix of walking times between the trip ends and the hubs.
+        """
+        return np.stack([self.graph.get_walking_distances(float(x), float(y))[nodes] + offsets for x, y in hubs],
+                        axis=1) / self.walking_speed
+
+    def estimate(self, hubs: np.ndarray) -> dict:
+        """
+        Returns the share of trips that are faster with uam, the mean time saved by them and the hub-pair OD matrix of
+        the expected uam trips.
+        """
+        hub_count = len(hubs)
+        access_times = self.get_walking_times(hubs, self.origin_nodes, self.origin_offsets)
+        egress_times = self.get_walking_times(hubs, self.destination_nodes, self.destination_offsets)
+        flight_times = get_flight_times(hubs)
+        best_times = np.empty(len(self.counts))
+        best_pairs = np.empty(len(self.counts), dtype=np.int64)
+        for start in range(0, len(self.counts), trip_chunk_size):
+            end = start + trip_chunk_size
+            times = (access_times[start:end, :, None] + flight_times[None, :, :] + egress_times[start:end, None, :])
+            times = times.reshape(len(times), hub_count * hub_count)
+            best_pairs[start:end] = np.argmin(times, axis=1)
+            best_times[start:end] = times[np.arange(len(times)), best_pairs[start:end]]
+        uam_faster = best_times < self.walking_times
+        od_matrix = np.zeros((hub_count, hub_count))
+        np.add.at(od_matrix, (best_pairs[uam_faster] // hub_count, best_pairs[uam_faster] % hub_count),
+                  self.counts[uam_faster])
+        uam_trips = float(self.counts[uam_faster].sum())
+        time_saved = float((self.counts * (self.walking_times - best_times))[uam_faster].sum())
+        return {"uam_share": uam_trips / float(self.counts.sum()), "uam_trips": uam_trips,
+                "mean_time_saved": time_saved / uam_trips if uam_trips > 0 else 0.0, "od_matrix": od_matrix}
+
+
+def print_estimate(name: str, hubs: np.ndarray, estimate: dict):
+    print(name + ": " + str(round(100 * estimate["uam_share"], 1)) + " % of trips faster with uam ("
+          + str(round(estimate["uam_trips"])) + " trips, " + str(round(estimate["mean_time_saved"])) + " s saved each)")
+    print("    expected uam trips from hub (rows) to hub (columns):")
+    for index, row in enumerate(estimate["od_matrix"]):
+        print("    " + str(index) + " (" + "%g %g" % tuple(hubs[index]) + "): "
+              + " ".join("%6d" % round(value) for value in row))
+
+
+def write_estimates(output_path: str, results: list[(str, np.ndarray, dict)]):
+    with open(output_path, 'w', newline='') as output_file:
+        writer = csv.writer(output_file, delimiter=';')
+        writer.writerow(["layout", "hubCount", "uamShare", "uamTrips", "meanTimeSaved", "coordinates"])
+        for name, hubs, estimate in results:
+            writer.writerow([name, len(hubs), round(estimate["uam_share"], 5), round(estimate["uam_trips"], 1),
+                             round(estimate["mean_time_saved"], 1), " ".join("%g %g" % tuple(hub) for hub in hubs)])
+
+
+def get_layouts(options, origins: np.ndarray, destinations: np.ndarray) -> list[(str, np.ndarray)]:
+    layouts = list()
+    if len(options.coordinates) > 0:
+        if len(options.coordinates) % 2 != 0:
+            sys.exit("Please provide an even number of coordinates.")
+        layouts.append(("coordinates", np.array(options.coordinates, dtype=float).reshape(-1, 2)))
+    if options.layouts is not None or options.all_layouts:
+        from createUamHubs import read_hub_layouts
+        file_layouts = read_hub_layouts(options.layout_file)
+        layout_names = {name.lower(): name for name in file_layouts}
+        for name in (file_layouts if options.all_layouts else options.layouts):
+            if name.lower() not in layout_names:
+                sys.exit("Unknown layout \"" + name + "\". Available layouts: " + ", ".join(file_layouts))
+            layouts.append((layout_names[name.lower()], np.array(file_layouts[layout_names[name.lower()]], dtype=float)))
+    if options.random_layouts > 0:
+        candidates = get_candidates(origins, destinations, options.candidates, options.seed)
+        rng = np.random.default_rng(options.seed)
+        for index in range(options.random_layouts):
+            chosen = rng.choice(len(candidates), min(options.hub_count, len(candidates)), replace=False)
+            layouts.append(("random_" + str(index), candidates[np.sort(chosen)]))
+    return layouts
+
+
+if __name__ == '__main__':
+    options = get_options()
+    start_time = time.perf_counter()
+    net_path = get_sumocfg_files(options.sumocfg_path, ("net-file",))[0]
+    sample = TripSample(options.max_trips, options.seed)
+    read_trips(get_sumocfg_files(options.sumocfg_path, ("additional-files", "route-files")), load_edge_index(net_path),
+               set(config.conversion_vClasses), sample, 0)
+    trip_origins, trip_destinations, trip_counts = sample.get_arrays()
+    if len(trip_counts) == 0:
+        sys.exit("No eligible trips found.")
+    pedestrian_graph = PedestrianGraph.from_net(sumolib.net.readNet(net_path))
+    estimator = DemandEstimator(pedestrian_graph, trip_origins, trip_destinations, trip_counts, options.walking_speed)
+    print("sampled " + str(len(trip_counts)) + " of " + str(sample.eligible_count) + " eligible trips, pedestrian "
+          + "network with " + str(pedestrian_graph.get_node_count()) + " junctions and circuity "
+          + str(round(estimator.circuity, 2)) + " in " + str(round(time.perf_counter() - start_time, 1)) + " s")
+
+    hub_layouts = get_layouts(options, trip_origins, trip_destinations)
+    if len(hub_layouts) == 0:
+        sys.exit("Please provide coordinates, --layout, --all_layouts or --random_layouts.")
+    start_time = time.perf_counter()
+    estimates = sorted(((name, hubs, estimator.estimate(hubs)) for name, hubs in hub_layouts),
+                       key=lambda x: -x[2]["uam_share"])
+    print("estimated " + str(len(estimates)) + " layouts in " + str(round(time.perf_counter() - start_time, 1))
+          + " s with " + str(len(pedestrian_graph.trees)) + " shortest path trees")
+    for layout_name, layout_hubs, layout_estimate in estimates[:5]:
+        print_estimate(layout_name, layout_hubs, layout_estimate)
+    if options.output is not None:
+        write_estimates(options.output, estimates)
+        print("wrote " + options.output)
@@ -11,6 +11,8 @@ bus_stop_length = 10                # length of uam hub bus stop in meters
 uam_pa_capacity = 10                # number of parking spaces on each uam hub parking area
 sidewalk_search_radius = 300        # initial sidewalk search radius in meters around uam hub. Up to 10x this range is searched before aborting the search
 uam_hub_connection_radius = 20000   # maximum distance in meters each pair of uam hubs can be apart from one another to create a direct connection between them
+uam_hub_topology = "mesh"           # which pairs of uam hubs within uam_hub_connection_radius are connected: "mesh" (all pairs), "knn" (uam_hub_topology_neighbors nearest hubs), "delaunay" (delaunay triangulation, requires scipy) or "rng" (relative neighborhood graph)
+uam_hub_topology_neighbors = 4      # number of nearest hubs each uam hub is connected with in the "knn" topology
 
 #--- Air Taxi parameters ---#
 uam_taxi_person_capacity = 4        # maximum number of passengers in the Air Taxi
@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+import argparse
+import os
+import random
+import sys
+import time
+import xml.etree.ElementTree as ET
+import numpy as np
+import simConfig as config
+import uamHubConfig
+from cacheUtils import get_sumocfg_files
+from networkCache import load_edge_index
+from xmlRewriter import open_xml
+
+placement_methods = ("coverage", "kmedoids")
+default_v_class = "passenger"   # vClass of vehicles without a vType, as in SUMO's DEFAULT_VEHTYPE
+
+
+def get_options():
+    """
+    Command line options using the argparse library
+    """
+    arg_parser = argparse.ArgumentParser(description="Places uam hubs where the trips of a scenario start and end. The "
+                                                     "coordinates can be passed to createUamHubs.py.")
+    arg_parser.add_argument("sumocfg_path", type=str, help="Path to the sumocfg of the scenario without uam hubs.")
+    arg_parser.add_argument("hub_count", type=int, help="Number of uam hubs to place.")
+    arg_parser.add_argument("--method", dest="method", type=str, default="coverage", choices=placement_methods,
+                            help="Default = coverage. coverage adds the hub that serves the most trip kilometers with "
+                                 "both ends within the coverage radius one at a time, kmedoids minimizes the distance "
+                                 "of all trip ends to their closest hub, weighted by trip length.")
+    arg_parser.add_argument("--coverage_radius", dest="coverage_radius", type=float, default=1000,
+                            help="Default = 1000. Distance in meters a customer walks to or from a hub.")
+    arg_parser.add_argument("--min_trip_length", dest="min_trip_length", type=float, default=2000,
+                            help="Default = 2000. Trips with a shorter beeline distance in meters are ignored, they "
+                                 "are not worth a flight.")
+    arg_parser.add_argument("--max_trips", dest="max_trips", type=int, default=20000,
+                            help="Default = 20000. Maximum number of trips sampled from the route files.")
+    arg_parser.add_argument("--candidates", dest="candidates", type=int, default=500,
+                            help="Default = 500. Number of trip ends considered as hub locations.")
+    arg_parser.add_argument("--seed", dest="seed", type=int, default=config.seed,
+                            help="Default = " + str(config.seed) + ". Seed for sampling trips and candidates.")
+    arg_parser.add_argument("--layout_name", dest="layout_name", type=str,
+                            help="Append the coordinates to the layout file under this name, for createUamHubs.py "
+                                 "--layout.")
+    arg_parser.add_argument("--layout_file", dest="layout_file", type=str, default="uam_hub_locations.txt",
+                            help="Default = uam_hub_locations.txt. Layout file the coordinates are appended to.")
+    arg_parser.add_argument("--generate", action="store_true", default=False,
+                            help="Generate the uam scenario with createUamHubs.py afterward.")
+    return arg_parser.parse_args()
+
+
+class TripSample:
+    """
+    Origins, destinations and weights of a uniform random sample of the eligible trips in route files.
+    The route files are read one element at a time and only the sampled trips are kept.
+    """
+
+    def __init__(self, max_trips: int, seed: int):
+        self.max_trips = max_trips
+        self.rng = random.Random(seed)
+        self.trips = list()     # (origin, destination, count)
+        self.eligible_count = 0
+        self.skipped_count = 0
+
+    def add(self, origin: (float, float), destination: (float, float), count: float):
+        # reservoir sampling, every eligible trip has the same chance to be kept
+        self.eligible_count += 1
+        if len(self.trips) < self.max_trips:
+            self.trips.append((origin, destination, count))
+            return
+        index = self.rng.randrange(self.eligible_count)
+        if index < self.max_trips:
+            self.trips[index] = (origin, destination, count)
+
+    def get_arrays(self) -> (np.ndarray, np.ndarray, np.ndarray):
+        origins = np.array([trip[0] for trip in self.trips], dtype=float).reshape(-1, 2)
+        destinations = np.array([trip[1] for trip in self.trips], dtype=float).reshape(-1, 2)
+        counts = np.array([trip[2] for trip in self.trips], dtype=float)
+        return origins, destinations, counts
+
+
+def get_flow_count(element: ET.Element) -> float:
+    """
+    Returns the expected number of vehicles of a flow.
+    """
+    begin = float(element.get('begin', 0))
+    end = float(element.get('end', 3600))
+    if element.get('number') is not None:
+        return float(element.get('number'))
+    if element.get('period') is not None:
+        return (end - begin) / float(element.get('period').split("(")[-1].rstrip(")"))
+    if element.get('vehsPerHour') is not None:
+        return float(element.get('vehsPerHour')) * (end - begin) / 3600
+    if element.get('probability') is not None:
+        return float(element.get('probability')) * (end - begin)
+    return 1
+
+
+def read_trips(route_paths: list[str], edge_index, v_classes, sample: TripSample, min_trip_length: float):
+    """
+    Adds the trips, vehicles and flows with an eligible vClass of the route files to the sample.
+    """
+    type_classes = {"DEFAULT_VEHTYPE": default_v_class}
+    route_ends = dict()
+
+    def get_position(edge_id, xy):
+        if xy is not None:
+            return tuple(float(value) for value in xy.split(",")[:2])
+        if edge_id is not None and edge_index.has_edge(edge_id):
+            return edge_index.get_from_junction_position(edge_id)
+        return None
+
+    for route_path in route_paths:
+        with open_xml(route_path) as route_file:
+            depth = 0
+            root = None
+            for event, element in ET.iterparse(route_file, events=("start", "end")):
+                if event == "start":
+                    depth += 1
+                    if root is None:
+                        root = element
+                    continue
+                depth -= 1
+                if element.tag == 'vType':
+                    type_classes[element.get('id')] = element.get('vClass', default_v_class)
+                if depth != 1:
+                    continue
+                if element.tag == 'vTypeDistribution':
+                    member_classes = [type_classes.get(member) for member in element.get('vTypes', "").split()]
+                    member_classes += [child.get('vClass', default_v_class) for child in element.findall('vType')]
+                    # a distribution is eligible if any of its types is
+                    eligible = [v_class for v_class in member_classes if v_class in v_classes]
+                    type_classes[element.get('id')] = eligible[0] if eligible else None
+                elif element.tag == 'route':
+                    edges = element.get('edges').split()
+                    route_ends[element.get('id')] = (edges[0], edges[-1])
+                elif element.tag in ('trip', 'vehicle', 'flow'):
+                    if type_classes.get(element.get('type', "DEFAULT_VEHTYPE")) not in v_classes:
+                        root.clear()
+                        continue
+                    from_edge, to_edge = element.get('from'), element.get('to')
+                    route = element.find('route')
+                    if route is not None:
+                        edges = route.get('edges').split()
+                        from_edge, to_edge = edges[0], edges[-1]
+                    elif element.get('route') in route_ends:
+                        from_edge, to_edge = route_ends[element.get('route')]
+                    origin = get_position(from_edge, element.get('fromXY'))
+                    destination = get_position(to_edge, element.get('toXY'))
+                    if origin is None or destination is None:
+                        sample.skipped_count += 1
+                    elif np.hypot(destination[0] - origin[0], destination[1] - origin[1]) >= min_trip_length:
+                        sample.add(origin, destination, get_flow_count(element) if element.tag == 'flow' else 1)
+                root.clear()
+
+
+def get_distances(points: np.ndarray, locations: np.ndarray) -> np.ndarray:
+    """
+    Returns the len(points) x len(locations) matrix of euclidean distances.
+    """
+    points = points.astype(np.float32)
+    locations = locations.astype(np.float32)
+    return np.hypot(points[:, None, 0] - locations[None, :, 0], points[:, None, 1] - locations[None, :, 1])
+
+
+def get_candidates(origins: np.ndarray, destinations: np.ndarray, max_candidates: int, seed: int) -> np.ndarray:
+    ends = np.unique(np.concatenate((origins, destinations)), axis=0)
+    if len(ends) > max_candidates:
+        ends = ends[np.random.default_rng(seed).choice(len(ends), max_candidates, replace=False)]
+    return ends
+
+
+def get_allowed(candidate_distances: np.ndarray, chosen: list[int], connection_radius: float) -> np.ndarray:
+    """
+    Candidates a new hub can be placed at: after the first hub, only those within the connection radius of a hub.
+    """
+    allowed = np.ones(len(candidate_distances), dtype=bool)
+    if len(chosen) > 0:
+        allowed = (candidate_distances[:, chosen] <= connection_radius).any(axis=1)
+    allowed[chosen] = False
+    return allowed
+
+
+def place_by_coverage(origins, destinations, weights, candidates, hub_count, coverage_radius, connection_radius) -> list[int]:
+    """
+    Greedy maximum coverage: adds the candidate which serves the most additional trip weight one at a time. A trip is
+    served if both its origin and destination are within the coverage radius of a hub. Ties, e.g. for the first hub,
+    are broken by the weight of newly covered trip ends.
+    """
+    origin_covered_by = get_distances(candidates, origins) <= coverage_radius
+    destination_covered_by = get_distances(candidates, destinations) <= coverage_radius
+    candidate_distances = get_distances(candidates, candidates)
+    origin_covered = np.zeros(len(origins), dtype=bool)
+    destination_covered = np.zeros(len(destinations), dtype=bool)
+    chosen = list()
+    while len(chosen) < hub_count:
+        allowed = get_allowed(candidate_distances, chosen, connection_radius)
+        if not allowed.any():
+            print("Only " + str(len(chosen)) + " hubs could be placed within uam_hub_connection_radius of each other.")
+            break
+        served = ((origin_covered | origin_covered_by) & (destination_covered | destination_covered_by)) @ weights
+        new_ends = (origin_covered_by & ~origin_covered) @ weights + (destination_covered_by & ~destination_covered) @ weights
+        served[~allowed] = -1
+        best = int(np.lexsort((new_ends, served))[-1])
+        chosen.append(best)
+        origin_covered |= origin_covered_by[best]
+        destination_covered |= destination_covered_by[best]
+    return chosen
+
+
+def place_by_kmedoids(origins, destinations, weights, candidates, hub_count, connection_radius,
+                      max_iterations=100) -> list[int]:
+    """
+    Weighted k-medoids over all trip ends: the hubs are first added greedily where they reduce the weighted distance
+    of the trip ends to their closest hub the most, then each hub is moved to the best candidate for the trip ends
+    assigned to it until no hub moves anymore. Hubs only move to candidates within the connection radius of another hub.
+    """
+    ends = np.concatenate((origins, destinations))
+    end_weights = np.concatenate((weights, weights)).astype(np.float32)
+    distances = get_distances(ends, candidates)
+    candidate_distances = get_distances(candidates, candidates)
+    chosen = list()
+    closest = np.full(len(ends), np.inf, dtype=np.float32)
+    while len(chosen) < hub_count:
+        allowed = get_allowed(candidate_distances, chosen, connection_radius)
+        if not allowed.any():
+            print("Only " + str(len(chosen)) + " hubs could be placed within uam_hub_connection_radius of each other.")
+            break
+        costs = end_weights @ np.minimum(closest[:, None], distances)
+        costs[~allowed] = np.inf
+        chosen.append(int(np.argmin(costs)))
+        closest = np.minimum(closest, distances[:, chosen[-1]])
+
+    for _ in range(max_iterations):
+        assignment = np.argmin(distances[:, chosen], axis=1)
+        moved = False
+        for index in range(len(chosen)):
+            members = assignment == index
+            if not members.any():
+                continue
+            costs = end_weights[members] @ distances[members]
+            others = chosen[:index] + chosen[index + 1:]
+            if len(others) > 0:
+                costs[~(candidate_distances[:, others] <= connection_radius).any(axis=1)] = np.inf
+            costs[others] = np.inf
+            best = int(np.argmin(costs))
+            if costs[best] < costs[chosen[index]]:
+                chosen[index] = best
+                moved = True
+        if not moved:
+            break
+    return chosen
+
+
+def get_hub_components(hubs: np.ndarray, connection_radius: float) -> int:
+    """
+    Returns the number of groups of hubs which are connected with each other within the connection radius.
+    """
+    distances = get_distances(hubs, hubs)
+    component = list(range(len(hubs)))
+
+    def find(index):
+        while component[index] != index:
+            index = component[index]
+        return index
+    for i in range(len(hubs)):
+        for j in range(i + 1, len(hubs)):
+            if distances[i, j] <= connection_radius:
+                component[find(i)] = find(j)
+    return len({find(index) for index in range(len(hubs))})
+
+
+def report(origins, destinations, weights, hubs: np.ndarray, coverage_radius: float):
+    origin_distances = get_distances(origins, hubs).min(axis=1)
+    destination_distances = get_distances(destinations, hubs).min(axis=1)
+    served = (origin_distances <= coverage_radius) & (destination_distances <= coverage_radius)
+    print("trips served within " + str(coverage_radius) + " m: " + str(round(100 * weights[served].sum() / weights.sum(), 1))
+          + " % of trip kilometers, " + str(round(100 * served.mean(), 1)) + " % of trips")
+    print("mean distance of trip ends to the closest hub: "
+          + str(round(float(np.concatenate((origin_distances, destination_distances)).mean()))) + " m")
+
+
+def place_hubs(sumocfg_path: str, hub_count: int, method: str = "coverage", coverage_radius: float = 1000,
+               min_trip_length: float = 2000, max_trips: int = 20000, max_candidates: int = 500,
+               seed: int = config.seed) -> list[(float, float)]:
+    """
+    Returns hub coordinates for a scenario, ready to be passed to createUamHubs.generate_hubs. Only trips with one of
+    the conversion_vClasses from simConfig.py are taken into account, weighted by their beeline length.
+    """
+    net_path = get_sumocfg_files(sumocfg_path, ("net-file",))[0]
+    edge_index = load_edge_index(net_path)
+    sample = TripSample(max_trips, seed)
+    start_time = time.perf_counter()
+    read_trips(get_sumocfg_files(sumocfg_path, ("additional-files", "route-files")), edge_index,
+               set(config.conversion_vClasses), sample, min_trip_length)
+    print("read " + str(sample.eligible_count) + " eligible trips (" + str(sample.skipped_count) + " without known "
+          + "edges) in " + str(round(time.perf_counter() - start_time, 1)) + " s, sampled " + str(len(sample.trips)))
+    if len(sample.trips) == 0:
+        print("No eligible trips of at least " + str(min_trip_length) + " m found.")
+        return []
+
+    origins, destinations, counts = sample.get_arrays()
+    weights = counts * np.hypot(*(destinations - origins).T)
+    candidates = get_candidates(origins, destinations, max_candidates, seed)
+    connection_radius = uamHubConfig.uam_hub_connection_radius
+    if method == "coverage":
+        chosen = place_by_coverage(origins, destinations, weights, candidates, hub_count, coverage_radius, connection_radius)
+    elif method == "kmedoids":
+        chosen = place_by_kmedoids(origins, destinations, weights, candidates, hub_count, connection_radius)
+    else:
+        raise ValueError("Unknown placement method \"" + method + "\", use one of " + ", ".join(placement_methods))
+    hubs = candidates[chosen]
+    report(origins, destinations, weights, hubs, coverage_radius)
+    components = get_hub_components(hubs, connection_radius)
+    if components > 1:
+        print("Warning: the hubs form " + str(components) + " groups that are not connected within "
+              "uam_hub_connection_radius.")
+    return [(round(float(x), 2), round(float(y), 2)) for x, y in hubs]
+
+
+def append_layout(layout_file: str, layout_name: str, coordinates: list[(float, float)]):
+    line = " ".join("%g %g" % coordinate for coordinate in coordinates) + " -----------" + layout_name
+    if os.path.isfile(layout_file):
+        with open(layout_file, 'rb') as file:
+            content = file.read()
+        if len(content) > 0 and not content.endswith(b"\n"):
+            line = "\n" + line
+    with open(layout_file, 'a') as file:
+        file.write(line + "\n")
+
+
+if __name__ == '__main__':
+    options = get_options()
+    hub_coordinates = place_hubs(options.sumocfg_path, options.hub_count, options.method, options.coverage_radius,
+                                 options.min_trip_length, options.max_trips, options.candidates, options.seed)
+    if len(hub_coordinates) == 0:
+        sys.exit(1)
+    coordinate_arguments = " ".join("%g %g" % coordinate for coordinate in hub_coordinates)
+    print("Coordinates: " + coordinate_arguments)
+    print("py createUamHubs.py " + options.sumocfg_path + " " + coordinate_arguments)
+    if options.layout_name is not None:
+        append_layout(options.layout_file, options.layout_name, hub_coordinates)
+        print("added layout \"" + options.layout_name + "\" to " + options.layout_file)
+    if options.generate:
+        import createUamHubs
+        print("Created " + createUamHubs.generate_hubs(options.sumocfg_path, hub_coordinates))
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+import argparse
+import heapq
+import math
+import os
+import sys
+import time
+import importlib.util
+import simConfig as config
+import uamHubConfig
+from cacheUtils import load_cached_pickle
+from createUamHubs import hub_edge_pattern
+from pedestrianGraph import PedestrianGraph, get_tree_path
+
+# we need to import some python modules from the $SUMO_HOME/tools directory
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+elif importlib.util.find_spec("traci") is None:  # the pip packages traci and sumolib work without SUMO
+    sys.exit("please declare environment variable 'SUMO_HOME'")
+
+import sumolib
+import traci
+
+# increase when the content of the cached router changes, old cache files are rebuilt afterward
+router_version = 1
+router_kind = "uam-router"
+
+
+class UamRouter:
+    """
+    In-process replacement for findIntermodalRoute(modes="taxi") in uam scenarios. The walking distances from every
+    hub bus stop to all junctions are computed once per run and the flight times between hubs once per network, so a
+    trip only needs one A* search for walking the whole way and a comparison of all hub pairs for walk, fly, walk.
+    Returns the stages SUMO's router would return: none without any route, a single walking stage if flying is not
+    faster and walking, taxi and walking stages otherwise.
+    """
+
+    def __init__(self, graph: PedestrianGraph, edge_nodes: dict[str, (int, int, float)],
+                 flight_times: dict[(str, str), float], walking_speed: float = config.router_walking_speed,
+                 taxi_waiting_time: float = config.router_taxi_waiting_time):
+        self.graph = graph
+        self.edge_nodes = edge_nodes
+        self.flight_times = flight_times
+        self.walking_speed = walking_speed
+        self.taxi_waiting_time = taxi_waiting_time
+        # (edge id, position, distances, predecessors, predecessor edges) of each hub bus stop
+        self.hub_stops = list()
+
+    @classmethod
+    def from_net(cls, net, walking_speed: float = config.router_walking_speed,
+                 taxi_waiting_time: float = config.router_taxi_waiting_time):
+        graph = PedestrianGraph.from_net(net)
+        node_indices = {node_id: index for index, node_id in enumerate(graph.node_ids)}
+        edge_nodes = dict()
+        for edge in net.getEdges():
+            if edge.getFunction() != "" or not edge.allows("pedestrian"):
+                continue
+            edge_nodes[edge.getID()] = (node_indices[edge.getFromNode().getID()],
+                                        node_indices[edge.getToNode().getID()], edge.getLength())
+        hub_edges = [edge.getID() for edge in net.getEdges() if hub_edge_pattern.match(edge.getID())]
+        return cls(graph, edge_nodes, get_flight_times(net, hub_edges), walking_speed, taxi_waiting_time)
+
+    def set_hub_stops(self, hub_stops: list[(str, float)]):
+        """
+        Computes the walking distances from each hub bus stop, given by its edge and position, to every junction.
+        """
+        self.hub_stops = list()
+        for edge_id, position in hub_stops:
+            if edge_id not in self.edge_nodes:
+                continue
+            from_node, to_node, length = self.edge_nodes[edge_id]
+            sources = {from_node: position}
+            sources[to_node] = min(sources.get(to_node, math.inf), length - position)
+            self.hub_stops.append((edge_id, position) + self.graph.get_shortest_path_tree(sources))
+
+    def find_route(self, start_edge: str, dest_edge: str) -> list:
+        """
+        Returns the stages from the start of start_edge to the middle of dest_edge as traci Stage objects.
+        """
+        if start_edge not in self.edge_nodes or dest_edge not in self.edge_nodes:
+            return []
+        start_node = self.edge_nodes[start_edge][0]
+        dest_from_node, dest_to_node, dest_length = self.edge_nodes[dest_edge]
+        walking_distance, walking_path = self.find_walking_path(start_edge, dest_edge)
+
+        # walking times to and from each hub
+        access_times = [distances[start_node] / self.walking_speed for _, _, distances, _, _ in self.hub_stops]
+        egress = list()
+        for _, _, distances, _, _ in self.hub_stops:
+            dest_node = dest_from_node if distances[dest_from_node] <= distances[dest_to_node] else dest_to_node
+            egress.append((dest_node, (distances[dest_node] + dest_length / 2) / self.walking_speed))
+        best = (walking_distance / self.walking_speed, -1, -1)
+        for access_index, access_time in enumerate(access_times):
+            if access_time + self.taxi_waiting_time >= best[0]:
+                continue
+            access_edge = self.hub_stops[access_index][0]
+            for egress_index, (_, egress_time) in enumerate(egress):
+                flight_time = self.flight_times.get((access_edge, self.hub_stops[egress_index][0]))
+                if flight_time is None:
+                    continue
+                travel_time = access_time + self.taxi_waiting_time + flight_time + egress_time
+                if travel_time < best[0]:
+                    best = (travel_time, access_index, egress_index)
+
+        if best[1] < 0:
+            if walking_distance == math.inf:
+                return []
+            return [get_walking_stage([start_edge] + walking_path + [dest_edge], 0.0, dest_length / 2,
+                                      walking_distance, self.walking_speed)]
+
+        access_edge, access_position, _, predecessors, predecessor_edges = self.hub_stops[best[1]]
+        egress_edge, egress_position, _, egress_predecessors, egress_predecessor_edges = self.hub_stops[best[2]]
+        dest_node = egress[best[2]][0]
+        access_path = get_tree_path(predecessors, predecessor_edges, start_node)
+        egress_path = get_tree_path(egress_predecessors, egress_predecessor_edges, dest_node)[::-1]
+        flight_time = self.flight_times[access_edge, egress_edge]
+        return [get_walking_stage([start_edge] + access_path + [access_edge], 0.0, access_position,
+                                  access_times[best[1]] * self.walking_speed, self.walking_speed),
+                traci.simulation.Stage(type=traci.constants.STAGE_DRIVING, line="taxi", intended="taxi",
+                                       edges=[access_edge, egress_edge],
+                                       travelTime=self.taxi_waiting_time + flight_time,
+                                       cost=self.taxi_waiting_time + flight_time, departPos=access_position,
+                                       arrivalPos=egress_position),
+                get_walking_stage([egress_edge] + egress_path + [dest_edge], egress_position, dest_length / 2,
+                                  egress[best[2]][1] * self.walking_speed, self.walking_speed)]
+
+    def find_walking_route(self, start_edge: str, dest_edge: str) -> list:
+        """
+        Returns the single walking stage from the start of start_edge to the middle of dest_edge, without comparing it
+        with flying. Returns no stages without a route.
+        """
+        if start_edge not in self.edge_nodes or dest_edge not in self.edge_nodes:
+            return []
+        walking_distance, walking_path = self.find_walking_path(start_edge, dest_edge)
+        if walking_distance == math.inf:
+            return []
+        return [get_walking_stage([start_edge] + walking_path + [dest_edge], 0.0, self.edge_nodes[dest_edge][2] / 2,
+                                  walking_distance, self.walking_speed)]
+
+    def find_walking_path(self, start_edge: str, dest_edge: str) -> (float, list[str]):
+        """
+        Returns the walking distance from the start of start_edge to the middle of dest_edge and the edges in between.
+        """
+        start_node = self.edge_nodes[start_edge][0]
+        dest_from_node, dest_to_node, dest_length = self.edge_nodes[dest_edge]
+        targets = {dest_from_node: dest_length / 2, dest_to_node: dest_length / 2}
+        return self.graph.find_path({start_node: 0.0}, targets)
+
+
+def get_walking_stage(edges: list[str], depart_position: float, arrival_position: float, length: float,
+                      walking_speed: float):
+    # paths can start with the edge the pedestrian is on or end with its destination edge
+    route = [edge for index, edge in enumerate(edges) if index == 0 or edge != edges[index - 1]]
+    return traci.simulation.Stage(type=traci.constants.STAGE_WALKING, edges=route,
+                                  travelTime=length / walking_speed, cost=length / walking_speed, length=length,
+                                  departPos=depart_position, arrivalPos=arrival_position)
+
+
+def get_flight_times(net, hub_edges: list[str]) -> dict[(str, str), float]:
+    """
+    Returns the fastest time of an Air Taxi from every hub edge to every other reachable hub edge. Like in SUMO's
+    intermodal router, pick-up and drop-off durations are not included.
+    """
+    flight_times = dict()
+    for hub_edge in hub_edges:
+        times = {hub_edge: 0.0}
+        queue = [(0.0, hub_edge)]
+        while queue:
+            travel_time, edge_id = heapq.heappop(queue)
+            if travel_time > times[edge_id]:
+                continue
+            edge = net.getEdge(edge_id)
+            if edge_id != hub_edge:
+                if hub_edge_pattern.match(edge_id):
+                    flight_times[hub_edge, edge_id] = travel_time
+                travel_time += edge.getLength() / min(edge.getSpeed(), uamHubConfig.uam_taxi_max_speed)
+            for next_edge in edge.getOutgoing():
+                if next_edge.allows("taxi") and travel_time < times.get(next_edge.getID(), math.inf):
+                    times[next_edge.getID()] = travel_time
+                    heapq.heappush(queue, (travel_time, next_edge.getID()))
+    return flight_times
+
+
+def load_uam_router(net_path: str, walking_speed: float = config.router_walking_speed,
+                    taxi_waiting_time: float = config.router_taxi_waiting_time,
+                    cache_folder: str = config.cache_folder_path, use_cache: bool = True) -> UamRouter:
+    """
+    Returns the UamRouter of a uam network, without hub bus stops. The pedestrian graph and the flight times are read
+    from the cache folder if they were built for a network file with the same content and the same Air Taxi settings,
+    otherwise the network is parsed with sumolib and the new router is cached.
+    """
+    def build() -> dict:
+        router = UamRouter.from_net(sumolib.net.readNet(net_path), walking_speed, taxi_waiting_time)
+        graph = router.graph
+        return {"edge_nodes": router.edge_nodes, "flight_times": router.flight_times,
+                "graph": {"node_ids": graph.node_ids, "positions": graph.positions, "neighbors": graph.neighbors,
+                          "arc_edges": graph.arc_edges, "cell_size": graph.cell_size}}
+
+    content = load_cached_pickle(net_path, router_kind, router_version, build, cache_folder, use_cache,
+                                 (uamHubConfig.uam_taxi_max_speed,))
+    return UamRouter(PedestrianGraph(**content["graph"]), content["edge_nodes"], content["flight_times"],
+                     walking_speed, taxi_waiting_time)
+
+
+def get_options():
+    """
+    Command line options using the argparse library
+    """
+    arg_parser = argparse.ArgumentParser(description="Builds the cached uam router of uam networks ahead of a "
+                                                     "simulation with --intermodal_router python.")
+    arg_parser.add_argument("net_paths", type=str, nargs="+", help="Paths to .net.xml(.gz) files with uam hubs.")
+    arg_parser.add_argument("--cache_folder", dest="cache_folder", type=str, default=config.cache_folder_path,
+                            help="Default = " + config.cache_folder_path + ". Folder of the cached routers.")
+    return arg_parser.parse_args()
+
+
+if __name__ == '__main__':
+    options = get_options()
+    for path in options.net_paths:
+        start_time = time.perf_counter()
+        uam_router = load_uam_router(path, cache_folder=options.cache_folder)
+        print(path + ": " + str(uam_router.graph.get_node_count()) + " junctions, "
+              + str(len(uam_router.flight_times)) + " hub connections, "
+              + str(round(time.perf_counter() - start_time, 2)) + " s")
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+import argparse
+import os
+import sys
+import time
+import importlib.util
+import xml.etree.ElementTree as ET
+import uamHubConfig as config
+from cacheUtils import get_sumocfg_files
+from createUamHubs import hub_edge_pattern
+from xmlRewriter import open_xml
+
+# we need to import some python modules from the $SUMO_HOME/tools directory
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+elif importlib.util.find_spec("sumolib") is None:  # the pip package sumolib works without SUMO
+    sys.exit("please declare environment variable 'SUMO_HOME'")
+
+import sumolib
+
+
+def get_options():
+    """
+    Command line options using the argparse library
+    """
+    arg_parser = argparse.ArgumentParser(description="Checks a uam scenario created by createUamHubs.py before it is "
+                                                     "simulated. Exits with 1 if a problem is found.")
+    arg_parser.add_argument("sumocfg_path", type=str, help="Path to the sumocfg of the uam scenario, e.g. "
+                                                           "3_uam_hubs_sim.sumocfg.")
+    return arg_parser.parse_args()
+
+
+class ScenarioAdditionals:
+    """
+    The parking areas, bus stops and rerouters of the additional files, read with a single streaming pass.
+    """
+
+    def __init__(self, add_paths: list[str]):
+        self.parking_areas = dict()
+        self.bus_stops = dict()
+        self.rerouters = dict()
+        for add_path in add_paths:
+            with open_xml(add_path) as add_file:
+                for _, element in ET.iterparse(add_file):
+                    if element.tag == 'parkingArea':
+                        self.parking_areas[element.get('id')] = element
+                    elif element.tag == 'busStop':
+                        self.bus_stops[element.get('id')] = element
+                    elif element.tag == 'rerouter':
+                        self.rerouters[element.get('id')] = element
+
+
+class UnionFind:
+    def __init__(self):
+        self.parents = dict()
+
+    def find(self, item):
+        root = item
+        while self.parents.get(root, root) != root:
+            root = self.parents[root]
+        while item != root:
+            self.parents[item], item = root, self.parents.get(item, item)
+        return root
+
+    def union(self, item, other):
+        self.parents[self.find(item)] = self.find(other)
+
+
+def is_hub_edge(edge_id: str) -> bool:
+    return "uam" in edge_id or edge_id.startswith("hub_con_")
+
+
+def check_stop(problems: list[str], net, element: ET.Element, name: str, expected_lane: str):
+    if element is None:
+        problems.append(name + " is missing")
+        return
+    lane_id = element.get('lane')
+    if lane_id != expected_lane:
+        problems.append(name + " \"" + element.get('id') + "\" is on lane \"" + lane_id + "\" instead of \""
+                        + expected_lane + "\"")
+    if not net.hasEdge(lane_id.rsplit("_", 1)[0]):
+        problems.append(name + " \"" + element.get('id') + "\" is on the unknown lane \"" + lane_id + "\"")
+    elif float(element.get('endPos')) > net.getLane(lane_id).getLength():
+        problems.append(name + " \"" + element.get('id') + "\" ends at " + element.get('endPos') + " behind the end "
+                        + "of lane \"" + lane_id + "\" (" + str(round(net.getLane(lane_id).getLength(), 2)) + " m)")
+
+
+def check_hubs(net, additionals: ScenarioAdditionals, hubs: dict[int, str]) -> list[str]:
+    """
+    Checks that every hub edge has its reverse edge, its parking area on the reverse edge and its bus stop.
+    """
+    problems = list()
+    for hub_index, edge_id in sorted(hubs.items()):
+        if not net.hasEdge("-" + edge_id):
+            problems.append("hub " + str(hub_index) + ": reverse edge \"-" + edge_id + "\" is missing")
+        check_stop(problems, net, additionals.parking_areas.get("uam_parking_area" + str(hub_index)),
+                   "hub " + str(hub_index) + ": parking area", "-" + edge_id + "_0")
+        check_stop(problems, net, additionals.bus_stops.get("uam_hub_stop_" + str(hub_index)),
+                   "hub " + str(hub_index) + ": bus stop", edge_id + "_0")
+    return problems
+
+
+def get_reachable_edges(start_edge, forward: bool) -> set:
+    """
+    Returns all edges taxis can reach from the start edge (forward) or that can reach it (not forward) along
+    connections between lanes that allow taxis.
+    """
+    reachable = {start_edge}
+    stack = [start_edge]
+    while stack:
+        edge = stack.pop()
+        neighbors = edge.getOutgoing() if forward else edge.getIncoming()
+        for neighbor, connections in neighbors.items():
+            if neighbor in reachable:
+                continue
+            if any(connection.getFromLane().allows("taxi") and connection.getToLane().allows("taxi")
+                   for connection in connections):
+                reachable.add(neighbor)
+                stack.append(neighbor)
+    return reachable
+
+
+def check_taxi_connectivity(net, hubs: dict[int, str]) -> list[str]:
+    """
+    Checks that the hub graph is strongly connected for taxis, i.e. a uam taxi can drive from every hub edge and its
+    reverse edge to every other one.
+    """
+    hub_edges = [net.getEdge(prefix + edge_id) for _, edge_id in sorted(hubs.items()) for prefix in ("", "-")
+                 if net.hasEdge(prefix + edge_id)]
+    if len(hub_edges) == 0:
+        return []
+    problems = list()
+    start_edge = hub_edges[0]
+    for forward, description in ((True, "cannot be reached from"), (False, "cannot reach")):
+        reachable = get_reachable_edges(start_edge, forward)
+        unreachable = [edge.getID() for edge in hub_edges if edge not in reachable]
+        if len(unreachable) > 0:
+            problems.append("hub graph is not strongly connected for taxis: " + ", ".join(unreachable) + " "
+                            + description + " \"" + start_edge.getID() + "\"")
+    return problems
+
+
+def check_pedestrian_access(net, additionals: ScenarioAdditionals, hubs: dict[int, str]) -> list[str]:
+    """
+    Checks that the access lane of every hub bus stop allows pedestrians and lies in the largest pedestrian component
+    of the road network, and that the hub edge itself can be walked to from there. Pedestrians may walk edges in both
+    directions and change edges at every junction.
+    """
+    road = UnionFind()
+    everything = UnionFind()
+    road_edge_counts = dict()
+    for edge in net.getEdges():
+        if edge.getFunction() != "" or not edge.allows("pedestrian"):
+            continue
+        everything.union(edge.getFromNode().getID(), edge.getToNode().getID())
+        if not is_hub_edge(edge.getID()):
+            road.union(edge.getFromNode().getID(), edge.getToNode().getID())
+    for edge in net.getEdges():
+        if edge.getFunction() == "" and edge.allows("pedestrian") and not is_hub_edge(edge.getID()):
+            root = road.find(edge.getFromNode().getID())
+            road_edge_counts[root] = road_edge_counts.get(root, 0) + 1
+    if len(road_edge_counts) == 0:
+        return ["the road network has no edges that allow pedestrians"]
+    main_component = max(road_edge_counts, key=road_edge_counts.get)
+
+    problems = list()
+    for hub_index, edge_id in sorted(hubs.items()):
+        bus_stop = additionals.bus_stops.get("uam_hub_stop_" + str(hub_index))
+        if bus_stop is None:
+            continue
+        accesses = bus_stop.findall('access')
+        if len(accesses) == 0:
+            problems.append("hub " + str(hub_index) + ": bus stop has no access")
+        for access in accesses:
+            lane_id = access.get('lane')
+            if not net.hasEdge(lane_id.rsplit("_", 1)[0]):
+                problems.append("hub " + str(hub_index) + ": access lane \"" + lane_id + "\" does not exist")
+                continue
+            lane = net.getLane(lane_id)
+            if not lane.allows("pedestrian"):
+                problems.append("hub " + str(hub_index) + ": access lane \"" + lane_id + "\" does not allow pedestrians")
+            elif is_hub_edge(lane.getEdge().getID()):
+                problems.append("hub " + str(hub_index) + ": access lane \"" + lane_id + "\" is not part of the road "
+                                "network")
+            elif road.find(lane.getEdge().getFromNode().getID()) != main_component:
+                problems.append("hub " + str(hub_index) + ": access lane \"" + lane_id + "\" cannot be reached from "
+                                "the road network")
+            if float(access.get('pos', 0)) > lane.getLength():
+                problems.append("hub " + str(hub_index) + ": access position " + access.get('pos') + " is behind "
+                                "the end of lane \"" + lane_id + "\"")
+        if net.hasEdge(edge_id) and (everything.find(net.getEdge(edge_id).getFromNode().getID())
+                                     != everything.find(main_component)):
+            problems.append("hub " + str(hub_index) + ": hub edge \"" + edge_id + "\" cannot be walked to from the "
+                            "road network")
+    return problems
+
+
+def check_rerouter(net, additionals: ScenarioAdditionals, hubs: dict[int, str]) -> list[str]:
+    """
+    Checks that the uam taxi rerouter covers all parking areas and all hub edges.
+    """
+    rerouter = additionals.rerouters.get(config.rerouter_id)
+    if rerouter is None:
+        return ["rerouter \"" + config.rerouter_id + "\" is missing"]
+    problems = list()
+    fake_parking_area = additionals.parking_areas.get(config.fake_parking_area_id)
+    if fake_parking_area is None:
+        problems.append("parking area \"" + config.fake_parking_area_id + "\" is missing")
+    elif hub_edge_pattern.match(fake_parking_area.get('lane').rsplit("_", 1)[0]) is None:
+        problems.append("parking area \"" + config.fake_parking_area_id + "\" is not on a hub edge")
+    reroute_ids = {reroute.get('id') for reroute in rerouter.iter('parkingAreaReroute')}
+    missing_ids = sorted(set(additionals.parking_areas) - reroute_ids)
+    if len(missing_ids) > 0:
+        problems.append("rerouter \"" + config.rerouter_id + "\" does not cover the parking areas " + ", ".join(missing_ids))
+    unknown_ids = sorted(reroute_ids - set(additionals.parking_areas))
+    if len(unknown_ids) > 0:
+        problems.append("rerouter \"" + config.rerouter_id + "\" references the unknown parking areas "
+                        + ", ".join(unknown_ids))
+    rerouter_edges = set(rerouter.get('edges', "").split())
+    missing_edges = [prefix + edge_id for _, edge_id in sorted(hubs.items()) for prefix in ("-", "")
+                     if prefix + edge_id not in rerouter_edges]
+    if len(missing_edges) > 0:
+        problems.append("rerouter \"" + config.rerouter_id + "\" does not cover the hub edges " + ", ".join(missing_edges))
+    unknown_edges = sorted(edge_id for edge_id in rerouter_edges if not net.hasEdge(edge_id))
+    if len(unknown_edges) > 0:
+        problems.append("rerouter \"" + config.rerouter_id + "\" references the unknown edges " + ", ".join(unknown_edges))
+    return problems
+
+
+def check_uam_taxi_type(route_paths: list[str]) -> list[str]:
+    """
+    Checks that the uamtaxi vType exists. createUamHubs.py inserts it as the first element, so only the vTypes at
+    the start of each route file are read.
+    """
+    for route_path in route_paths:
+        with open_xml(route_path) as route_file:
+            depth = 0
+            for event, element in ET.iterparse(route_file, events=("start", "end")):
+                if event == "start":
+                    depth += 1
+                    continue
+                depth -= 1
+                if depth == 1:
+                    if element.tag == 'vType' and element.get('id') == "uamtaxi":
+                        return []
+                    if element.tag not in ('vType', 'vTypeDistribution'):
+                        break
+    return ["vType \"uamtaxi\" is missing in the route files"]
+
+
+def validate_scenario(sumocfg_path: str) -> list[str]:
+    """
+    Returns the problems of a uam scenario created by createUamHubs.py, an empty list if there are none.
+    """
+    files = {option: get_sumocfg_files(sumocfg_path, (option,)) for option in ("net-file", "route-files", "additional-files")}
+    problems = [option + " \"" + path + "\" does not exist" for option, paths in files.items() for path in paths
+                if not os.path.isfile(path)]
+    if len(files["net-file"]) == 0:
+        problems.append("no net-file given")
+    if len(problems) > 0:
+        return problems
+    net = sumolib.net.readNet(files["net-file"][0])
+    additionals = ScenarioAdditionals(files["additional-files"])
+    hubs = dict()
+    for edge in net.getEdges():
+        match = hub_edge_pattern.match(edge.getID())
+        if match is not None:
+            hubs[int(match.group("from_index")) // 2] = edge.getID()
+    if len(hubs) == 0:
+        return ["the network contains no uam hubs"]
+    hub_count = os.path.basename(sumocfg_path).split("_uam_hubs_", 1)[0]
+    if hub_count.isdigit() and int(hub_count) != len(hubs):
+        problems.append("the network contains " + str(len(hubs)) + " uam hubs instead of " + hub_count)
+    problems += check_hubs(net, additionals, hubs)
+    problems += check_taxi_connectivity(net, hubs)
+    problems += check_pedestrian_access(net, additionals, hubs)
+    problems += check_rerouter(net, additionals, hubs)
+    problems += check_uam_taxi_type(files["route-files"])
+    return problems
+
+
+if __name__ == '__main__':
+    options = get_options()
+    start_time = time.perf_counter()
+    scenario_problems = validate_scenario(options.sumocfg_path)
+    for problem in scenario_problems:
+        print("Error: " + problem)
+    print("validated \"" + options.sumocfg_path + "\" in " + str(round(time.perf_counter() - start_time, 1)) + " s: "
+          + (str(len(scenario_problems)) + " problems" if len(scenario_problems) > 0 else "ok"))
+    sys.exit(1 if len(scenario_problems) > 0 else 0)
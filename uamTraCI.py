@@ -6,22 +6,40 @@ import re
 import sys
 import argparse
 import random
+import dataclasses
+import threading
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from enum import IntEnum
+import importlib.util
 import xml.etree.ElementTree as ET
 import simConfig as config
 import uamHubConfig
+import runCache
+import runCheckpoint
+from runConfig import RunConfig, build_run_config, get_density_sweep
 
 # we need to import some python modules from the $SUMO_HOME/tools directory
 if 'SUMO_HOME' in os.environ:
     tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
     sys.path.append(tools)
-else:
+elif importlib.util.find_spec("traci") is None:  # the pip packages traci and sumolib work without SUMO
     sys.exit("please declare environment variable 'SUMO_HOME'")
 
 from sumolib import checkBinary  # Checks for the binary in environ vars
 import traci
-import sumolib
+import traciReplay
+from networkCache import EdgeIndex, load_edge_index
+from hubCatchment import CatchmentPrefilter, load_hub_catchment
+from uamRouter import UamRouter, load_uam_router
+from modeChoice import ModeChoiceEngine, load_backend
+
+
+traci_start_lock = threading.Lock()
+# tracemalloc traces the whole process, it is stopped when the last run with memory instrumentation closes
+tracemalloc_lock = threading.Lock()
+tracemalloc_users = 0
 
 
 class FloatRange(object):
@@ -74,6 +92,93 @@ def get_options():
                                                       "Setting this to 1 equals one step per simulated second. 0.25 equals four steps. "
                                                       "This setting heavily impacts simulation time and complexity.")
 
+    arg_parser.add_argument("--seed", dest="seed", type=int,
+                            help="Default = " + str(config.seed) + ". Seed for the random number generators of sumo and "
+                                                                   "the uam customer conversion.")
+
+    arg_parser.add_argument("--no_cache", action="store_true", default=False,
+                            help="Always simulate, even if a complete results folder for the same configuration "
+                                 "already exists in the run index (" + config.run_index_file + ").")
+
+    arg_parser.add_argument("--record_trace", action="store_true", default=False,
+                            help="Record all TraCI requests and responses of each run to " + traciReplay.trace_file_name
+                                 + " in its results folder. The trace can be replayed with traciReplay.py to benchmark "
+                                 "the controller without SUMO. Runs are always simulated when recording.")
+
+    arg_parser.add_argument("--parallel_runs", dest="parallel_runs", type=int,
+                            help="Default = " + str(config.parallel_runs) + ". Only useful when the --loop option is set. "
+                                 "Defines how many simulations of the loop are run at the same time, each with its own "
+                                 "SUMO instance.")
+
+    arg_parser.add_argument("--reuse_sumo", action="store_true", default=False,
+                            help="Default = " + str(config.reuse_sumo_process) + ". Only useful when the --loop option "
+                                 "is set. Keeps the SUMO instance of the first simulation and reloads it with "
+                                 "traci.load for every further density instead of starting a new one. With "
+                                 "--parallel_runs, each thread keeps its own instance.")
+
+    arg_parser.add_argument("--memory_report_interval", dest="memory_report_interval", type=int,
+                            help="Default = " + str(config.memory_report_interval) + ". Every x simulated seconds, the "
+                                 "memory traced by tracemalloc and the size of each uam state container are written to "
+                                 "uam-memory-log.csv in the results folder. 0 disables the instrumentation. Memory is "
+                                 "traced for the whole process, so parallel runs report their combined usage.")
+
+    arg_parser.add_argument("--checkpoint_interval", dest="checkpoint_interval", type=int,
+                            help="Default = " + str(config.checkpoint_interval) + ". Every x simulated seconds, the "
+                                 "sumo state and the state of the uam controller are saved to the results folder of "
+                                 "each run, so an interrupted run can be continued with --resume. Only the latest "
+                                 "checkpoint is kept and it is removed when the run completes. 0 disables the "
+                                 "checkpoints.")
+
+    arg_parser.add_argument("--resume", dest="resume", type=str,
+                            help="Continues the interrupted run of the given results folder from its last checkpoint, "
+                                 "with the configuration the run was started with. The uam logs are continued, sumo's "
+                                 "output files of the rest of the run are written to a resume-<time> subfolder.")
+
+    arg_parser.add_argument("--stale_entry_max_age", dest="stale_entry_max_age", type=int,
+                            help="Default = " + str(config.stale_entry_max_age) + ". Age in simulated seconds after "
+                                 "which uam customers and reservations of persons that left the simulation without "
+                                 "their termination being noticed are removed from the controller state. Reservations "
+                                 "of persons still in the simulation are kept. 0 disables the eviction.")
+
+    arg_parser.add_argument("--catchment_prefilter", action="store_true", default=False,
+                            help="Default = " + str(config.catchment_prefilter) + ". Do not route trips intermodally "
+                                 "whose walks to and from the closest uam hubs are longer than the trip itself. They "
+                                 "are only routed for walking and walk the whole way, logged as \"onlyWalking\".")
+
+    arg_parser.add_argument("--catchment_circuity", dest="catchment_circuity", type=float,
+                            help="Default = " + str(config.catchment_circuity) + ". Factor on the straight-line "
+                                 "distance of a trip that the walks to and from the closest hubs are compared with by "
+                                 "the catchment prefilter. Higher values skip fewer trips.")
+
+    arg_parser.add_argument("--catchment_audit_interval", dest="catchment_audit_interval", type=int,
+                            help="Default = " + str(config.catchment_audit_interval) + ". Every x-th trip skipped by "
+                                 "the catchment prefilter is routed anyway to report how many uam trips it missed. "
+                                 "0 disables the audit.")
+
+    arg_parser.add_argument("--intermodal_router", dest="intermodal_router", type=str, choices=["sumo", "python"],
+                            help="Default = " + config.intermodal_router + ". \"sumo\" routes every converted trip "
+                                 "with SUMO's intermodal router. \"python\" compares walking with walking to a hub, "
+                                 "flying and walking from a hub using walking distances from every hub that are "
+                                 "computed once per run, see uamRouter.py.")
+
+    arg_parser.add_argument("--mode_choice_backend", dest="mode_choice_backend", type=str,
+                            help="Default = \"" + config.mode_choice_backend + "\". Lets a backend decide for every new "
+                                 "uam customer whether to fly or to walk, see modeChoice.py. \"stub\" uses the "
+                                 "deterministic test backend, \"module:ClassName\" a ModeChoiceBackend subclass. "
+                                 "Customers follow their uam trip until the answer arrives.")
+    arg_parser.add_argument("--mode_choice_batch_size", dest="mode_choice_batch_size", type=int,
+                            help="Default = " + str(config.mode_choice_batch_size) + ". Max amount of decision "
+                                 "requests sent to the mode choice backend at once.")
+    arg_parser.add_argument("--mode_choice_max_concurrency", dest="mode_choice_max_concurrency", type=int,
+                            help="Default = " + str(config.mode_choice_max_concurrency) + ". Max amount of batches the "
+                                 "mode choice backend decides at the same time.")
+    arg_parser.add_argument("--mode_choice_timeout", dest="mode_choice_timeout", type=float,
+                            help="Default = " + str(config.mode_choice_timeout) + ". Seconds after which an unanswered "
+                                 "batch is dropped, its customers keep their uam trip.")
+    arg_parser.add_argument("--mode_choice_stub_latency", dest="mode_choice_stub_latency", type=float,
+                            help="Default = " + str(config.mode_choice_stub_latency) + ". Seconds the stub mode "
+                                 "choice backend takes to answer a batch.")
+
     uam_group.add_argument("--uam_vehicles_per_hub", dest="uam_vehicles_per_hub", type=int,
                            help="Default = " + str(
                                config.uam_vehicles_per_hub) + ". Defines the amount of uam vehicles generated per uam hub. "
@@ -122,14 +227,56 @@ class Verbosity(IntEnum):
     NORMAL = 2
     VERBOSE = 3
 
+
+class CustomerRecord:
+    """
+    Route of a uam customer as written to each of its uam log rows. Slots keep the per customer memory small, as
+    hundreds of thousands of customers can be created during a long run.
+    """
+    __slots__ = ('route_start_x', 'route_start_y', 'route_dest_x', 'route_dest_y', 'original_vehicle_id',
+                 'created_step')
+
+    def __init__(self, start_coords, dest_coords, original_vehicle_id: str, created_step):
+        self.route_start_x = round(start_coords[0])
+        self.route_start_y = round(start_coords[1])
+        self.route_dest_x = round(dest_coords[0])
+        self.route_dest_y = round(dest_coords[1])
+        self.original_vehicle_id = original_vehicle_id
+        self.created_step = created_step
+
+
+class UamLogWriter:
+    """
+    Writes the rows of the uam log. The values that are the same for every row of a run (scenario and uam settings)
+    are prepared once when the writer is created.
+    """
+    header = ['timestamp', 'step', 'scenario', 'pedestrianID', 'vehicleID', 'state', 'x', 'y',
+              'routeStartX', 'routeStartY', 'routeDestX', 'routeDestY', 'originalVehicleId', 'uamDensity',
+              'uam_vehicles_per_hub', 'uam_vehicle_capacity', 'group_finding_time',
+              'uam_hub_count']
+
+    def __init__(self, log_file, run_config: RunConfig):
+        self.writer = csv.writer(log_file, delimiter=';')
+        self.scenario = run_config.scenario
+        self.run_values = (run_config.uam_density, run_config.uam_vehicles_per_hub, run_config.uam_vehicle_capacity,
+                           run_config.group_finding_time, run_config.uam_hub_count)
+
+    def write_header(self):
+        self.writer.writerow(self.header)
+
+    def write(self, step, person_id: str, vehicle_id: str, state: str, x, y, record: CustomerRecord):
+        self.writer.writerow((datetime.now(), step, self.scenario, person_id, vehicle_id, state, x, y,
+                              record.route_start_x, record.route_start_y, record.route_dest_x, record.route_dest_y,
+                              record.original_vehicle_id) + self.run_values)
+
 # UAM
-def check_for_new_reservations(reservation_dict, step, uam_log_writer, waiting_peds, uam_log_dict):
-    new_reservations = traci.person.getTaxiReservations(1)
+def check_for_new_reservations(conn, run_config: RunConfig, reservation_dict, step, uam_log_writer, waiting_peds, uam_log_dict):
+    new_reservations = conn.person.getTaxiReservations(1)
     for new_reservation in new_reservations:
-        plan_dispatch(new_reservation, reservation_dict, step, uam_log_writer, waiting_peds, uam_log_dict)
+        plan_dispatch(conn, run_config, new_reservation, reservation_dict, step, uam_log_writer, waiting_peds, uam_log_dict)
 
 # UAM
-def plan_dispatch(new_reservation, reservation_dict, step, uam_log_writer, waiting_peds: set[str], uam_log_dict):
+def plan_dispatch(conn, run_config: RunConfig, new_reservation, reservation_dict, step, uam_log_writer, waiting_peds: set[str], uam_log_dict):
     from_edge = new_reservation.fromEdge
     to_edge = new_reservation.toEdge
     person_id = new_reservation.persons[0]
@@ -142,67 +289,62 @@ def plan_dispatch(new_reservation, reservation_dict, step, uam_log_writer, waiti
         reservation_dict[from_edge, to_edge]["waiting_ped_count"] += 1
         reservation_dict[from_edge, to_edge]["id_list"].append(person_id)
         reservation_dict[from_edge, to_edge]["reservation_id_list"].append(new_reservation.id)
-    if config.verbosity >= Verbosity.VERBOSE:
+    if run_config.verbosity >= Verbosity.VERBOSE:
         print("The following pedestrians issued a UAM taxi reservation in the current step: " + str(person_id))
 
     try:
         waiting_peds.add(person_id)
-        entry = [datetime.now(), step, config.scenario, person_id, "NULL", "waiting",
-                 round(traci.person.getPosition(person_id)[0]), round(traci.person.getPosition(person_id)[1]),
-                 uam_log_dict[person_id]['routeStartX'], uam_log_dict[person_id]['routeStartY'],
-                 uam_log_dict[person_id]['routeDestX'], uam_log_dict[person_id]['routeDestY'],
-                 uam_log_dict[person_id]['originalVehicleId'], config.uam_density,
-                 config.uam_vehicles_per_hub, config.uam_vehicle_capacity, config.group_finding_time,
-                 config.uam_hub_count]
-        uam_log_writer.writerow(entry)
+        position = conn.person.getPosition(person_id)
+        uam_log_writer.write(step, person_id, "NULL", "waiting", round(position[0]), round(position[1]),
+                             uam_log_dict[person_id])
     except:
         print("Error: uam_log.csv row not written. Problem with person \"" + person_id + "\".")
 
 # UAM
-def increment_reservation_waiting_time(reservation_dict):
+def increment_reservation_waiting_time(run_config: RunConfig, reservation_dict):
     for entry in reservation_dict:
-        reservation_dict[entry]["total_waiting_time"] += config.step_length
+        reservation_dict[entry]["total_waiting_time"] += run_config.step_length
 
 # UAM
-def dispatch_uam_vehicles(reservation_dict, parking_area_edges):
+def dispatch_uam_vehicles(conn, run_config: RunConfig, reservation_dict, parking_area_edges):
     to_delete_entries = []
     for entry in reservation_dict:
-        if (reservation_dict[entry]["total_waiting_time"] >= config.group_finding_time
-                or reservation_dict[entry]["waiting_ped_count"] >= config.uam_vehicle_capacity):
+        if (reservation_dict[entry]["total_waiting_time"] >= run_config.group_finding_time
+                or reservation_dict[entry]["waiting_ped_count"] >= run_config.uam_vehicle_capacity):
             reservations = (reservation_dict[entry]["reservation_id_list"]
                             + reservation_dict[entry]["reservation_id_list"])
             # TODO: limit to veh capacity
-            starting_coordinate = traci.person.getPosition(reservation_dict[entry]["id_list"][0])
-            closest_taxi = get_best_uam_vehicle(entry[0], parking_area_edges, starting_coordinate)
+            starting_coordinate = conn.person.getPosition(reservation_dict[entry]["id_list"][0])
+            closest_taxi = get_best_uam_vehicle(conn, entry[0], parking_area_edges, starting_coordinate)
             if closest_taxi == "error":
                 continue
-            traci.vehicle.dispatchTaxi(closest_taxi, reservations)
+            conn.vehicle.dispatchTaxi(closest_taxi, reservations)
             to_delete_entries.append(entry)
     for to_delete_entry in to_delete_entries:
         del reservation_dict[to_delete_entry]
 
 # UAM
-def get_best_uam_vehicle(from_edge, parking_area_edges, starting_coordinate):
+def get_best_uam_vehicle(conn, from_edge, parking_area_edges, starting_coordinate):
     # iterate over parking areas on departure edge
     # for parking_area in (parking_area_edges[from_edge]):
     for parking_area in (parking_area_edges["-" + from_edge]):
         # get taxis currently parked at the current parking area
-        parking_taxis = traci.parkingarea.getVehicleIDs(parking_area)
+        parking_taxis = conn.parkingarea.getVehicleIDs(parking_area)
         if len(parking_taxis) != 0:
             for taxi in parking_taxis:
                 # check if taxi has no pending reservation
-                if taxi in traci.vehicle.getTaxiFleet(0):
+                if taxi in conn.vehicle.getTaxiFleet(0):
                     return taxi
 
     # no taxi is available at a parking area at the departure edge, search for alternative taxi
     closest_distance = 100000000
     closest_taxi = "none"
-    for parking_area in traci.parkingarea.getIDList():
+    for parking_area in conn.parkingarea.getIDList():
         # only look at taxi parking areas
         if "uam" not in parking_area:
             continue
-        for taxi in traci.parkingarea.getVehicleIDs(parking_area):
-            distance = math.dist(starting_coordinate, traci.vehicle.getPosition(taxi))
+        for taxi in conn.parkingarea.getVehicleIDs(parking_area):
+            distance = math.dist(starting_coordinate, conn.vehicle.getPosition(taxi))
             if distance < closest_distance:
                 closest_distance = distance
                 closest_taxi = taxi
@@ -215,135 +357,128 @@ def get_best_uam_vehicle(from_edge, parking_area_edges, starting_coordinate):
 
 
 # UAM
-def create_uam_taxis(parking_area_edges):
-    parking_areas = traci.parkingarea.getIDList()
+def create_uam_taxis(conn, run_config: RunConfig, parking_area_edges):
+    parking_areas = conn.parkingarea.getIDList()
     for parking_area in parking_areas:
         if (parking_area == uamHubConfig.fake_parking_area_id) or "uam" not in parking_area:
             continue
-        edge_id = traci.lane.getEdgeID(traci.parkingarea.getLaneID(parking_area))
+        edge_id = conn.lane.getEdgeID(conn.parkingarea.getLaneID(parking_area))
         parking_area_edges.setdefault(edge_id, set()).add(parking_area)
         route_id = parking_area + "_route"
-        traci.route.add(route_id, [edge_id])
-        traci.route.setParameter(parking_area + "_route", "stop", parking_area)
-        for x in range(config.uam_vehicles_per_hub):
-            traci.vehicle.add("uam_taxi_" + parking_area + "_" + str(x), route_id, "uamtaxi")
+        conn.route.add(route_id, [edge_id])
+        conn.route.setParameter(parking_area + "_route", "stop", parking_area)
+        for x in range(run_config.uam_vehicles_per_hub):
+            conn.vehicle.add("uam_taxi_" + parking_area + "_" + str(x), route_id, "uamtaxi")
 
 # UAM
-def recolour_uam_taxis():
-    for idle_taxi in traci.vehicle.getTaxiFleet(0):
-        traci.vehicle.setColor(idle_taxi, (0, 255, 0, 255))
-    for on_route_taxi in traci.vehicle.getTaxiFleet(1):
-        traci.vehicle.setColor(on_route_taxi, (0, 255, 255, 255))
-    for active_taxi in traci.vehicle.getTaxiFleet(2):
-        traci.vehicle.setColor(active_taxi, (255, 0, 0, 255))
+def recolour_uam_taxis(conn):
+    for idle_taxi in conn.vehicle.getTaxiFleet(0):
+        conn.vehicle.setColor(idle_taxi, (0, 255, 0, 255))
+    for on_route_taxi in conn.vehicle.getTaxiFleet(1):
+        conn.vehicle.setColor(on_route_taxi, (0, 255, 255, 255))
+    for active_taxi in conn.vehicle.getTaxiFleet(2):
+        conn.vehicle.setColor(active_taxi, (255, 0, 0, 255))
 
 # UAM
-def create_uam_customers(new_vehicles: set[str], step, uam_log_writer, uam_customers: set[str], uam_log_dict) -> set[
-    str]:
-    current_time = traci.simulation.getTime()
+def create_uam_customers(conn, run_config: RunConfig, edge_index: EdgeIndex, rng: random.Random, new_vehicles: set[str], step, uam_log_writer, uam_customers: set[str], uam_log_dict,
+                         catchment_prefilter: CatchmentPrefilter = None, uam_router: UamRouter = None,
+                         mode_choice: ModeChoiceEngine = None) -> set[str]:
+    current_time = conn.simulation.getTime()
     removed_vehicles = set()
-    for vehicle in new_vehicles:  # adjust all newly added vehicles
-        if (traci.vehicletype.getVehicleClass(traci.vehicle.getTypeID(
-                vehicle)) in config.conversion_vClasses) and random.random() <= config.uam_density:  # with a chance of <uam_density>
+    for vehicle in sorted(new_vehicles):  # adjust all newly added vehicles, sorted to make the conversion reproducible
+        if (conn.vehicletype.getVehicleClass(conn.vehicle.getTypeID(
+                vehicle)) in run_config.conversion_vClasses) and rng.random() <= run_config.uam_density:  # with a chance of <uam_density>
             new_id = vehicle + "_uam_ped"
-            route = traci.vehicle.getRoute(vehicle)  # get route of vehicle. We need 1st and last edge
+            route = conn.vehicle.getRoute(vehicle)  # get route of vehicle. We need 1st and last edge
             start_edge = route[0]
-            if not allowed_on_edge("pedestrian", start_edge):
-                start_edge = find_alternative_edge("pedestrian", start_edge)
-                if start_edge == "":  # no alternative found in config.alternative_edge_radius
-                    if config.verbosity >= Verbosity.SPARSE:
+            if not allowed_on_edge(edge_index, "pedestrian", start_edge):
+                start_edge = find_alternative_edge(run_config, edge_index, "pedestrian", start_edge)
+                if start_edge == "":  # no alternative found in run_config.alternative_edge_radius
+                    if run_config.verbosity >= Verbosity.SPARSE:
                         print("Could not find an alternative start edge for " + vehicle + ". Skipping.")
                         continue
             dest_edge = route[-1]
-            if not allowed_on_edge("pedestrian", dest_edge):
-                dest_edge = find_alternative_edge("pedestrian", dest_edge)
-                if dest_edge == "":  # no alternative found in config.alternative_edge_radius
-                    if config.verbosity >= Verbosity.SPARSE:
+            if not allowed_on_edge(edge_index, "pedestrian", dest_edge):
+                dest_edge = find_alternative_edge(run_config, edge_index, "pedestrian", dest_edge)
+                if dest_edge == "":  # no alternative found in run_config.alternative_edge_radius
+                    if run_config.verbosity >= Verbosity.SPARSE:
                         print("Could not find an alternative destination edge for " + vehicle + ". Skipping.")
                         continue
 
-            start_coords = traci.junction.getPosition(traci.edge.getFromJunction(start_edge))
-            dest_coords = traci.junction.getPosition(traci.edge.getFromJunction(dest_edge))
-
-
-            # this makes it either walking or Taxi - as UAM is the only allowed taxi in this simulation
-            # a taxi MUST be present
-            #
-            # TODO: to allow for other combinations, we should add "car"
-            # see https://sumo.dlr.de/docs/TraCI/Simulation_Value_Retrieval.html
-            # "car", "public", "bicycle" or space separated combination -> add "car" to make
-            stages = traci.simulation.findIntermodalRoute(start_edge, dest_edge,
-                                                          modes="taxi")  # calculate best route (using taxis) from 1st to last edge
+            start_coords = edge_index.get_from_junction_position(start_edge)
+            dest_coords = edge_index.get_from_junction_position(dest_edge)
+            customer_record = CustomerRecord(start_coords, dest_coords, vehicle, step)
+
+            # trips that cannot benefit from uam are only routed for walking, which is cheaper than the intermodal
+            # search, and walk the whole way like trips for which flying is not faster. A sample of them is routed
+            # intermodally anyway to measure how many uam trips the prefilter misses
+            if catchment_prefilter is not None and catchment_prefilter.should_skip(start_edge, dest_edge, start_coords,
+                                                                                   dest_coords):
+                if catchment_prefilter.should_audit():
+                    stages = find_intermodal_route(conn, uam_router, start_edge, dest_edge)
+                    catchment_prefilter.record_audit(len(stages) >= 2)
+                else:
+                    if run_config.verbosity >= Verbosity.VERBOSE:
+                        print("No hub close enough for a uam trip from \"" + start_edge + "\" to \"" + dest_edge + "\".")
+                    stages = find_walking_route(conn, uam_router, start_edge, dest_edge)
+            else:
+                # this makes it either walking or Taxi - as UAM is the only allowed taxi in this simulation
+                # a taxi MUST be present
+                #
+                # TODO: to allow for other combinations, we should add "car"
+                # see https://sumo.dlr.de/docs/TraCI/Simulation_Value_Retrieval.html
+                # "car", "public", "bicycle" or space separated combination -> add "car" to make
+                stages = find_intermodal_route(conn, uam_router, start_edge,
+                                               dest_edge)  # calculate best route (using taxis) from 1st to last edge
             if len(stages) == 0:  # no route possible
-                if config.verbosity >= Verbosity.VERBOSE:
+                if run_config.verbosity >= Verbosity.VERBOSE:
                     print("Could not find a route from \"" + start_edge + "\" to \"" + dest_edge + "\". Skipping.")
                 try:
-                    entry = [datetime.now(), step, config.scenario, new_id, "NULL", "noRoute",
-                             "NULL", "NULL", round(start_coords[0]), round(start_coords[1]), round(dest_coords[0]),
-                             round(dest_coords[1]), vehicle, config.uam_density,
-                             config.uam_vehicles_per_hub, config.uam_vehicle_capacity, config.group_finding_time,
-                             config.uam_hub_count]
-                    uam_log_writer.writerow(entry)
+                    uam_log_writer.write(step, new_id, "NULL", "noRoute", "NULL", "NULL", customer_record)
                     continue
                 except:
                     print("Error: uam_log.csv row not written at \"Could not find a route\"")
                     continue
             if len(stages) == 1:  # route possible, but uam not faster than walking         TODO: clean up duplicate code
-                if config.verbosity >= Verbosity.VERBOSE:
+                if run_config.verbosity >= Verbosity.VERBOSE:
                     print(
                         "Intermodal route with UAM taxi not faster on route from \"" + start_edge + "\" to \"" + dest_edge + "\". Walking the entire route.")
-                traci.person.add(new_id, start_edge, pos=0, depart=current_time)  # adds new person to simulation
-                traci.person.appendStage(new_id, stages[0])
-                traci.vehicle.remove(vehicle)
+                conn.person.add(new_id, start_edge, pos=0, depart=current_time)  # adds new person to simulation
+                conn.person.appendStage(new_id, stages[0])
+                conn.vehicle.remove(vehicle)
                 removed_vehicles.add(vehicle)
                 uam_customers.add(new_id)
 
-                uam_log_dict[new_id] = {'routeStartX': round(start_coords[0]),
-                                        'routeStartY': round(start_coords[1]),
-                                        'routeDestX': round(dest_coords[0]),
-                                        'routeDestY': round(dest_coords[1]),
-                                        'originalVehicleId': vehicle}
-                if not config.no_gui:
-                    traci.person.setColor(new_id, (255, 123, 0, 255))  # recolor new pedestrian for visual effect
+                uam_log_dict[new_id] = customer_record
+                if not run_config.no_gui:
+                    conn.person.setColor(new_id, (255, 123, 0, 255))  # recolor new pedestrian for visual effect
                 try:
-                    entry = [datetime.now(), step, config.scenario, new_id, "NULL", "onlyWalking",
-                             round(traci.person.getPosition(new_id)[0]), round(traci.person.getPosition(new_id)[1]),
-                             round(start_coords[0]), round(start_coords[1]), round(dest_coords[0]),
-                             round(dest_coords[1]),
-                             vehicle, config.uam_density,
-                             config.uam_vehicles_per_hub, config.uam_vehicle_capacity, config.group_finding_time,
-                             config.uam_hub_count]
-                    uam_log_writer.writerow(entry)
+                    position = conn.person.getPosition(new_id)
+                    uam_log_writer.write(step, new_id, "NULL", "onlyWalking", round(position[0]), round(position[1]),
+                                         customer_record)
                     continue
                 except:
                     print("Error: uam_log.csv row not written at \"only walking\"")
                     continue
             if len(stages) >= 2:  # intermodal route with uam
-                if config.verbosity >= Verbosity.SPARSE:
+                if run_config.verbosity >= Verbosity.SPARSE:
                     print("Removed \"" + vehicle + "\" and added \"" + new_id + "\" as a new UAM customer.\n"
                                                                                 "Traveling from \"" + start_edge + "\" to \"" + dest_edge + "\".")
-                traci.person.add(new_id, start_edge, pos=0, depart=current_time)  # adds new person to simulation
+                conn.person.add(new_id, start_edge, pos=0, depart=current_time)  # adds new person to simulation
                 for stage in stages:
-                    traci.person.appendStage(new_id, stage)  # append all walking and driving stages to person
-                traci.vehicle.remove(vehicle)
+                    conn.person.appendStage(new_id, stage)  # append all walking and driving stages to person
+                conn.vehicle.remove(vehicle)
                 removed_vehicles.add(vehicle)
                 uam_customers.add(new_id)
-                uam_log_dict[new_id] = {'routeStartX': round(start_coords[0]),
-                                        'routeStartY': round(start_coords[1]),
-                                        'routeDestX': round(dest_coords[0]),
-                                        'routeDestY': round(dest_coords[1]),
-                                        'originalVehicleId': vehicle}
-                if not config.no_gui:
-                    traci.person.setColor(new_id, (255, 0, 0, 255))  # recolor new pedestrian for visual effect
+                uam_log_dict[new_id] = customer_record
+                if not run_config.no_gui:
+                    conn.person.setColor(new_id, (255, 0, 0, 255))  # recolor new pedestrian for visual effect
+                if mode_choice is not None:  # the customer follows the uam trip until the answer arrives
+                    mode_choice.request(new_id, get_mode_choice_features(stages, start_coords, dest_coords, step))
                 try:
-                    entry = [datetime.now(), step, config.scenario, new_id, "NULL", "walking",
-                             round(traci.person.getPosition(new_id)[0]), round(traci.person.getPosition(new_id)[1]),
-                             round(start_coords[0]), round(start_coords[1]), round(dest_coords[0]),
-                             round(dest_coords[1]),
-                             vehicle, config.uam_density,
-                             config.uam_vehicles_per_hub, config.uam_vehicle_capacity, config.group_finding_time,
-                             config.uam_hub_count]
-                    uam_log_writer.writerow(entry)
+                    position = conn.person.getPosition(new_id)
+                    uam_log_writer.write(step, new_id, "NULL", "walking", round(position[0]), round(position[1]),
+                                         customer_record)
                     continue
                 except:
                     print("Error: uam_log.csv row not written at \"intermodal route with uam\"")
@@ -351,49 +486,88 @@ def create_uam_customers(new_vehicles: set[str], step, uam_log_writer, uam_custo
 
     return removed_vehicles
 
+# UAM
+def find_intermodal_route(conn, uam_router: UamRouter, start_edge: str, dest_edge: str) -> list:
+    if uam_router is not None:
+        return uam_router.find_route(start_edge, dest_edge)
+    return conn.simulation.findIntermodalRoute(start_edge, dest_edge, modes="taxi")
+
+# UAM
+def find_walking_route(conn, uam_router: UamRouter, start_edge: str, dest_edge: str) -> list:
+    if uam_router is not None:
+        return uam_router.find_walking_route(start_edge, dest_edge)
+    return conn.simulation.findIntermodalRoute(start_edge, dest_edge)
+
+# UAM
+def get_hub_stops(conn) -> list[(str, float)]:
+    """
+    Returns the edge and the start position of each uam hub bus stop.
+    """
+    return [(conn.lane.getEdgeID(conn.busstop.getLaneID(bus_stop)), conn.busstop.getStartPos(bus_stop))
+            for bus_stop in sorted(conn.busstop.getIDList()) if "uam" in bus_stop]
+
+# UAM
+def get_mode_choice_features(stages, start_coords, dest_coords, step) -> dict:
+    """
+    Describes a planned uam trip to the mode choice backend. The values are rounded, so that similar trips share their
+    cached decision.
+    """
+    return {"distance": round(math.dist(start_coords, dest_coords), -2),
+            "travel_time": round(sum(stage.travelTime for stage in stages), -1),
+            "walking_time": round(sum(stage.travelTime for stage in stages
+                                      if stage.type == traci.constants.STAGE_WALKING), -1),
+            "hour": int(step // 3600)}
+
+# UAM
+def switch_to_walking(conn, person_id: str) -> bool:
+    """
+    Replaces the remaining stages of a uam customer that is still walking to its hub by walking to its destination.
+    Returns False if the customer is not walking on a normal edge or cannot walk to its destination.
+    """
+    if conn.person.getStage(person_id).type != traci.constants.STAGE_WALKING:
+        return False
+    current_edge = conn.person.getRoadID(person_id)
+    if current_edge == "" or current_edge.startswith(":"):
+        return False
+    remaining_stages = conn.person.getRemainingStages(person_id)
+    last_stage = conn.person.getStage(person_id, remaining_stages - 1)
+    stages = conn.simulation.findIntermodalRoute(current_edge, last_stage.edges[-1],
+                                                  departPos=conn.person.getLanePosition(person_id),
+                                                  arrivalPos=last_stage.arrivalPos)
+    if len(stages) != 1:
+        return False
+    conn.person.appendStage(person_id, stages[0])
+    for _ in range(remaining_stages - 1):
+        conn.person.removeStage(person_id, 1)
+    conn.person.removeStage(person_id, 0)  # aborts the current stage, the customer continues with the new one
+    return True
+
 # both
-def allowed_on_edge(v_class: str, edge_id: str) -> bool:
-    lane_count = traci.edge.getLaneNumber(edge_id)
-    for lane_index in range(lane_count):
-        lane_id = edge_id + '_' + str(lane_index)
-        if v_class in traci.lane.getAllowed(lane_id):
-            return True
-    return False
+def allowed_on_edge(edge_index: EdgeIndex, v_class: str, edge_id: str) -> bool:
+    return edge_index.allows(edge_id, v_class)
 
 # both
-def find_alternative_edge(v_class: str, edge_id: str) -> str:
-    from_junction_coordinates = traci.junction.getPosition(traci.edge.getFromJunction(edge_id))
-    nearby_edges = net.getNeighboringEdges(from_junction_coordinates[0], from_junction_coordinates[1],
-                                           config.alternative_edge_radius, includeJunctions=False)
-    if len(nearby_edges) > 0:
-        nearby_edges_sorted = sorted([(dist, edge) for edge, dist in nearby_edges], key=lambda x: x[0])
-    else:
-        nearby_edges_sorted = nearby_edges
-    for nearby_edge in nearby_edges_sorted:
-        edge_id = nearby_edge[1].getID()
-        if allowed_on_edge(v_class, edge_id):
-            return edge_id
+def find_alternative_edge(run_config: RunConfig, edge_index: EdgeIndex, v_class: str, edge_id: str) -> str:
+    from_junction_coordinates = edge_index.get_from_junction_position(edge_id)
+    nearby_edges = edge_index.iter_nearest_edges(from_junction_coordinates[0], from_junction_coordinates[1],
+                                                 run_config.alternative_edge_radius)
+    for nearby_edge_id, _ in nearby_edges:  # sorted by distance, only searched up to the first allowed edge
+        if allowed_on_edge(edge_index, v_class, nearby_edge_id):
+            return nearby_edge_id
     return ""
 
 
 # UAM
-def log_started_flights(uam_log_writer, step, waiting_peds: set[str], flying_peds: set[str], uam_log_dict) -> set[str]:
+def log_started_flights(conn, run_config: RunConfig, uam_log_writer, step, waiting_peds: set[str], flying_peds: set[str], uam_log_dict) -> set[str]:
     to_remove_peds = set()
     for waiting_customer in waiting_peds:
-        if traci.person.getVehicle(waiting_customer) != "":
+        if conn.person.getVehicle(waiting_customer) != "":
             to_remove_peds.add(waiting_customer)
             flying_peds.add(waiting_customer)
             try:
-                entry = [datetime.now(), step, config.scenario, waiting_customer,
-                         traci.person.getVehicle(waiting_customer), "flying",
-                         round(traci.person.getPosition(waiting_customer)[0]),
-                         round(traci.person.getPosition(waiting_customer)[1]),
-                         uam_log_dict[waiting_customer]['routeStartX'], uam_log_dict[waiting_customer]['routeStartY'],
-                         uam_log_dict[waiting_customer]['routeDestX'], uam_log_dict[waiting_customer]['routeDestY'],
-                         uam_log_dict[waiting_customer]['originalVehicleId'], config.uam_density,
-                         config.uam_vehicles_per_hub, config.uam_vehicle_capacity, config.group_finding_time,
-                         config.uam_hub_count]
-                uam_log_writer.writerow(entry)
+                position = conn.person.getPosition(waiting_customer)
+                uam_log_writer.write(step, waiting_customer, conn.person.getVehicle(waiting_customer), "flying",
+                                     round(position[0]), round(position[1]), uam_log_dict[waiting_customer])
                 continue
             except:
                 print("Error: uam_log.csv row not written when trying to log a started flight.")
@@ -401,21 +575,15 @@ def log_started_flights(uam_log_writer, step, waiting_peds: set[str], flying_ped
 
 
 # UAM
-def log_finished_flights(uam_log_writer, step, flying_peds: set[str], uam_log_dict) -> set[str]:
+def log_finished_flights(conn, run_config: RunConfig, uam_log_writer, step, flying_peds: set[str], uam_log_dict) -> set[str]:
     to_remove_peds = set()
     for flying_customer in flying_peds:
-        if traci.person.getVehicle(flying_customer) == "":
+        if conn.person.getVehicle(flying_customer) == "":
             to_remove_peds.add(flying_customer)
             try:
-                entry = [datetime.now(), step, config.scenario, flying_customer, "NULL", "walking",
-                         round(traci.person.getPosition(flying_customer)[0]),
-                         round(traci.person.getPosition(flying_customer)[1]),
-                         uam_log_dict[flying_customer]['routeStartX'], uam_log_dict[flying_customer]['routeStartY'],
-                         uam_log_dict[flying_customer]['routeDestX'], uam_log_dict[flying_customer]['routeDestY'],
-                         uam_log_dict[flying_customer]['originalVehicleId'], config.uam_density,
-                         config.uam_vehicles_per_hub, config.uam_vehicle_capacity, config.group_finding_time,
-                         config.uam_hub_count]
-                uam_log_writer.writerow(entry)
+                position = conn.person.getPosition(flying_customer)
+                uam_log_writer.write(step, flying_customer, "NULL", "walking", round(position[0]), round(position[1]),
+                                     uam_log_dict[flying_customer])
                 continue
             except:
                 print("Error: uam_log.csv row not written when logging finished flight")
@@ -423,26 +591,20 @@ def log_finished_flights(uam_log_writer, step, flying_peds: set[str], uam_log_di
 
 
 # UAM
-def log_terminated_customers(uam_log_writer, step, terminated_peds: set[str], uam_log_dict):
+def log_terminated_customers(run_config: RunConfig, uam_log_writer, step, terminated_peds: set[str], uam_log_dict,
+                             state: str = "terminated"):
     for terminated_ped in terminated_peds:
         try:
-            entry = [datetime.now(), step, config.scenario, terminated_ped, "NULL", "terminated",
-                     "NULL", "NULL",
-                     uam_log_dict[terminated_ped]['routeStartX'], uam_log_dict[terminated_ped]['routeStartY'],
-                     uam_log_dict[terminated_ped]['routeDestX'], uam_log_dict[terminated_ped]['routeDestY'],
-                     uam_log_dict[terminated_ped]['originalVehicleId'], config.uam_density,
-                     config.uam_vehicles_per_hub, config.uam_vehicle_capacity, config.group_finding_time,
-                     config.uam_hub_count]
-            uam_log_writer.writerow(entry)
+            uam_log_writer.write(step, terminated_ped, "NULL", state, "NULL", "NULL", uam_log_dict[terminated_ped])
             continue
         except:
             print("Error: uam_log.csv row not written for terminated customer.")
 
 # UAM
-def log_taxis(uam_taxi_log_writer, step):
-    idle_taxis = traci.vehicle.getTaxiFleet(0)
-    on_route_taxis = traci.vehicle.getTaxiFleet(1)
-    active_taxis = traci.vehicle.getTaxiFleet(2)
+def log_taxis(conn, run_config: RunConfig, uam_taxi_log_writer, step):
+    idle_taxis = conn.vehicle.getTaxiFleet(0)
+    on_route_taxis = conn.vehicle.getTaxiFleet(1)
+    active_taxis = conn.vehicle.getTaxiFleet(2)
     all_taxis = idle_taxis + on_route_taxis + active_taxis
     state = "error"
     ped_count = 0
@@ -455,11 +617,11 @@ def log_taxis(uam_taxi_log_writer, step):
             state = "onRoute"
         if taxi in active_taxis:
             state = "active"
-            ped_count = traci.vehicle.getPersonNumber(taxi)
-            customers = "-".join(traci.vehicle.getPersonIDList(taxi))
+            ped_count = conn.vehicle.getPersonNumber(taxi)
+            customers = "-".join(conn.vehicle.getPersonIDList(taxi))
         try:
-            entry = [datetime.now(), step, config.scenario, taxi, state, round(traci.vehicle.getPosition(taxi)[0]),
-                     round(traci.vehicle.getPosition(taxi)[1]), str(ped_count), customers, config.uam_hub_count]
+            entry = [datetime.now(), step, run_config.scenario, taxi, state, round(conn.vehicle.getPosition(taxi)[0]),
+                     round(conn.vehicle.getPosition(taxi)[1]), str(ped_count), customers, run_config.uam_hub_count]
             uam_taxi_log_writer.writerow(entry)
             continue
         except:
@@ -467,122 +629,485 @@ def log_taxis(uam_taxi_log_writer, step):
 
 
 # UAM
-def count_uam_hubs():
-    parking_areas = traci.parkingarea.getIDList()
+def count_uam_hubs(conn) -> int:
+    parking_areas = conn.parkingarea.getIDList()
     uam_hub_count = 0
     for parking_area in parking_areas:
         if (parking_area == uamHubConfig.fake_parking_area_id) or "uam" not in parking_area:
             continue
         uam_hub_count += 1
-    config.uam_hub_count = uam_hub_count
+    return uam_hub_count
 
 
-# contains TraCI control loop
-def run():
-    parking_area_edges = {}
-
-    count_uam_hubs()
-    create_uam_taxis(parking_area_edges)
-
-    step = 0
-    reservation_dict = {}
-    uam_customers = set()
-    last_step_vehicles = set()
-    last_step_peds = set()
-    waiting_peds = set()
-    flying_peds = set()
-    uam_log_dict = {}
-
-    uam_ped_log_file_name = "uam-log-{}.csv".format(os.path.basename(results_folder))
-    uam_ped_log_file_path = os.path.join(results_folder, uam_ped_log_file_name)
-    uam_ped_log_file = open(uam_ped_log_file_path, 'w', newline='')
-
-    uam_ped_log_writer = csv.writer(uam_ped_log_file, delimiter=';')
-    uam_ped_log_header = ['timestamp', 'step', 'scenario', 'pedestrianID', 'vehicleID', 'state', 'x', 'y',
-                          'routeStartX', 'routeStartY', 'routeDestX', 'routeDestY', 'originalVehicleId', 'uamDensity',
-                          'uam_vehicles_per_hub', 'uam_vehicle_capacity', 'group_finding_time',
-                          'uam_hub_count']
-    uam_ped_log_writer.writerow(uam_ped_log_header)
-
-    uam_taxi_log_file_name = "uam-taxi-log-{}.csv".format(os.path.basename(results_folder))
-    uam_taxi_log_file_path = os.path.join(results_folder, uam_taxi_log_file_name)
-    uam_taxi_log_file = open(uam_taxi_log_file_path, 'w', newline='')
-
-    uam_taxi_log_writer = csv.writer(uam_taxi_log_file, delimiter=';')
-    uam_taxi_log_header = ['timestamp', 'step', 'scenario', 'vehicleID', 'state', 'x', 'y', 'pedCount', 'customerIds',
-                           'uam_hub_count']
-    uam_taxi_log_writer.writerow(uam_taxi_log_header)
+# both
+def get_container_size(container, depth: int = 3) -> int:
+    """
+    Approximates the memory used by a container in bytes, including its keys, values and up to depth levels of nested
+    containers. Strings and numbers shared with other objects are counted for each container.
+    """
+    size = sys.getsizeof(container)
+    if depth == 0:
+        return size
+    if isinstance(container, dict):
+        for key, value in container.items():
+            size += get_container_size(key, depth - 1) + get_container_size(value, depth - 1)
+    elif isinstance(container, (list, tuple, set, frozenset)):
+        for item in container:
+            size += get_container_size(item, depth - 1)
+    elif hasattr(container, '__slots__'):
+        for slot in container.__slots__:
+            size += get_container_size(getattr(container, slot), depth - 1)
+    return size
 
 
-    # start of the main simulation loop
-    while traci.simulation.getTime() <= config.seconds_to_simulate:
-        traci.simulationStep()
+# both
+def get_memory_changes(snapshot, last_snapshot, limit: int = 3) -> str:
+    """
+    Returns the source lines whose allocations changed the most since the last snapshot, e.g. "uamTraCI.py:123 +42.0 KB".
+    """
+    if last_snapshot is None:
+        return "NULL"
+    changes = list()
+    for stat in snapshot.compare_to(last_snapshot, 'lineno')[:limit]:
+        frame = stat.traceback[0]
+        changes.append("{}:{} {:+.1f} KB".format(os.path.basename(frame.filename), frame.lineno, stat.size_diff / 1024))
+    return " | ".join(changes)
+
+
+class ControllerCache:
+    """
+    Hub catchments and uam routers of the scenarios simulated by a process, loaded on first use.
+    """
+
+    def __init__(self):
+        self.hub_catchments = dict()
+        self.uam_routers = dict()
+
+    def get_hub_catchment(self, run_config: RunConfig):
+        net_path = get_net_path(run_config.scenario_path)
+        if net_path not in self.hub_catchments:
+            self.hub_catchments[net_path] = load_hub_catchment(net_path)
+        return self.hub_catchments[net_path]
 
-        if config.verbosity >= Verbosity.NORMAL:
+    def get_uam_router(self, run_config: RunConfig) -> UamRouter:
+        key = (get_net_path(run_config.scenario_path), run_config.router_walking_speed,
+               run_config.router_taxi_waiting_time)
+        if key not in self.uam_routers:
+            self.uam_routers[key] = load_uam_router(*key)
+        return self.uam_routers[key]
+
+
+class SumoSession(ControllerCache):
+    """
+    Keeps one SUMO process and its TraCI connection alive for the runs of a sweep. The first run starts SUMO, every
+    following run reloads the simulation with traci.load and its own start arguments, which saves starting the binary
+    and connecting. SUMO writes the output files of a run when the next one is loaded, so the completion of a run is
+    only registered afterward.
+    """
+
+    def __init__(self, label: str = "session"):
+        super().__init__()
+        self.label = label
+        self.conn = None
+        self.pending_completion = None
+
+    def connect(self, start_config: list[str]):
+        if self.conn is None:
+            with traci_start_lock:
+                traci.start(start_config, label=self.label)
+                self.conn = traci.getConnection(self.label)
+        else:
+            self.conn.load(start_config[1:])
+            self.complete_previous_run()
+        return self.conn
+
+    def complete_previous_run(self):
+        if self.pending_completion is not None:
+            self.pending_completion()
+            self.pending_completion = None
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        self.complete_previous_run()
+
+
+class UamRun:
+    """
+    State of the UAM controller for one SUMO instance: the TraCI connection, customer and reservation bookkeeping
+    and the log sinks. Several instances can be driven from the same process, as nothing is shared between them.
+    """
+
+    # state containers whose size is written to the memory log
+    memory_report_containers = ('uam_log_dict', 'uam_customers', 'waiting_peds', 'flying_peds', 'reservation_dict')
+    # attributes saved in a checkpoint and restored when the run is resumed
+    checkpoint_attributes = ('step', 'parking_area_edges', 'reservation_dict', 'uam_customers', 'last_step_vehicles',
+                             'last_step_peds', 'waiting_peds', 'flying_peds', 'uam_log_dict', 'evicted_reservations',
+                             'evicted_customers', 'next_memory_report', 'next_checkpoint', 'declined_uam',
+                             'late_decisions')
+    # log file attribute by log name, the logs are continued after the row written last before a checkpoint
+    checkpoint_logs = {'uam-log': 'uam_ped_log_file', 'uam-taxi-log': 'uam_taxi_log_file',
+                       'uam-memory-log': 'uam_memory_log_file'}
+
+    def __init__(self, run_config: RunConfig, edge_index: EdgeIndex, conn, session=None):
+        self.run_config = run_config
+        self.edge_index = edge_index
+        self.conn = conn
+        self.rng = random.Random(run_config.seed)
+        self.parking_area_edges = {}
+        self.step = 0
+        self.reservation_dict = {}
+        self.uam_customers = set()
+        self.last_step_vehicles = set()
+        self.last_step_peds = set()
+        self.waiting_peds = set()
+        self.flying_peds = set()
+        self.uam_log_dict = {}
+        self.uam_ped_log_file = None
+        self.uam_ped_log_writer = None
+        self.uam_taxi_log_file = None
+        self.uam_taxi_log_writer = None
+        self.evicted_reservations = 0
+        self.evicted_customers = 0
+        self.uam_memory_log_file = None
+        self.uam_memory_log_writer = None
+        self.next_memory_report = 0
+        self.last_memory_snapshot = None
+        self.next_checkpoint = run_config.checkpoint_interval
+        self.catchment_prefilter = None
+        # a SumoSession keeps the catchment and the router of its scenario across the runs of a sweep
+        if session is None:
+            session = ControllerCache()
+        if run_config.catchment_prefilter:
+            self.catchment_prefilter = CatchmentPrefilter(session.get_hub_catchment(run_config),
+                                                          run_config.catchment_circuity,
+                                                          run_config.catchment_audit_interval)
+        self.uam_router = None
+        if run_config.intermodal_router == "python":
+            self.uam_router = session.get_uam_router(run_config)
+        self.mode_choice = None
+        if run_config.mode_choice_backend != "":
+            self.mode_choice = ModeChoiceEngine(load_backend(run_config.mode_choice_backend,
+                                                             run_config.mode_choice_stub_latency),
+                                                run_config.mode_choice_batch_size,
+                                                run_config.mode_choice_max_concurrency, run_config.mode_choice_timeout)
+        self.declined_uam = 0
+        self.late_decisions = 0
+
+    def start(self):
+        self.run_config = dataclasses.replace(self.run_config, uam_hub_count=count_uam_hubs(self.conn))
+        create_uam_taxis(self.conn, self.run_config, self.parking_area_edges)
+        if self.uam_router is not None:
+            self.uam_router.set_hub_stops(get_hub_stops(self.conn))
+        self.open_logs(dict())
+
+    def resume(self, checkpoint: dict):
+        """
+        Continues the run from a checkpoint instead of starting it. SUMO has to be started with the state file of the
+        checkpoint, which already contains the Air Taxis.
+        """
+        for attribute in self.checkpoint_attributes:
+            setattr(self, attribute, checkpoint[attribute])
+        self.rng.setstate(checkpoint["rng_state"])
+        if self.catchment_prefilter is not None:
+            (self.catchment_prefilter.candidates, self.catchment_prefilter.skipped, self.catchment_prefilter.audited,
+             self.catchment_prefilter.false_negatives) = checkpoint["catchment_prefilter_counts"]
+        if self.mode_choice is not None:
+            self.mode_choice.cache = checkpoint["mode_choice_cache"]
+        # reservations still waiting for an Air Taxi are reported as new again after loading the state, but they are
+        # already part of the restored reservation_dict
+        self.conn.person.getTaxiReservations(1)
+        if self.uam_router is not None:
+            self.uam_router.set_hub_stops(get_hub_stops(self.conn))
+        self.open_logs(checkpoint["log_offsets"])
+
+    def open_log(self, log_name: str, offsets: dict):
+        """
+        Opens a log file of the run. If the run is resumed, the file is continued after the last row written before
+        the checkpoint, otherwise a new file is created.
+        """
+        log_file_name = "{}-{}.csv".format(log_name, os.path.basename(self.run_config.results_folder))
+        log_file_path = os.path.join(self.run_config.results_folder, log_file_name)
+        if log_name not in offsets:
+            return open(log_file_path, 'w', newline='')
+        log_file = open(log_file_path, 'r+', newline='')
+        log_file.seek(offsets[log_name])
+        log_file.truncate()
+        return log_file
+
+    def open_logs(self, offsets: dict):
+        self.uam_ped_log_file = self.open_log("uam-log", offsets)
+        self.uam_ped_log_writer = UamLogWriter(self.uam_ped_log_file, self.run_config)
+        if not offsets:
+            self.uam_ped_log_writer.write_header()
+
+        self.uam_taxi_log_file = self.open_log("uam-taxi-log", offsets)
+        self.uam_taxi_log_writer = csv.writer(self.uam_taxi_log_file, delimiter=';')
+        if not offsets:
+            uam_taxi_log_header = ['timestamp', 'step', 'scenario', 'vehicleID', 'state', 'x', 'y', 'pedCount',
+                                   'customerIds', 'uam_hub_count']
+            self.uam_taxi_log_writer.writerow(uam_taxi_log_header)
+
+        if self.run_config.memory_report_interval > 0:
+            self.start_memory_report(offsets)
+
+    def start_memory_report(self, offsets: dict):
+        global tracemalloc_users
+        with tracemalloc_lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc_users += 1
+
+        self.uam_memory_log_file = self.open_log("uam-memory-log", offsets)
+        self.uam_memory_log_writer = csv.writer(self.uam_memory_log_file, delimiter=';')
+        if not offsets:
+            uam_memory_log_header = ['timestamp', 'step', 'scenario', 'tracedKB', 'tracedPeakKB']
+            for container_name in self.memory_report_containers:
+                uam_memory_log_header += [container_name + 'Count', container_name + 'KB']
+            uam_memory_log_header += ['evictedReservations', 'evictedCustomers', 'largestChanges']
+            self.uam_memory_log_writer.writerow(uam_memory_log_header)
+
+    def write_checkpoint(self):
+        """
+        Saves the SUMO state and the controller state needed to continue the run after the current step. The logs are
+        flushed first, so that their offsets cover every row written so far.
+        """
+        log_offsets = dict()
+        for log_name, attribute in self.checkpoint_logs.items():
+            log_file = getattr(self, attribute)
+            if log_file is not None:
+                log_file.flush()
+                log_offsets[log_name] = log_file.tell()
+        time = self.conn.simulation.getTime()
+        state_path = runCheckpoint.get_state_path(self.run_config.results_folder, time)
+        self.conn.simulation.saveState(state_path)
+
+        checkpoint = {attribute: getattr(self, attribute) for attribute in self.checkpoint_attributes}
+        checkpoint.update(run_config=self.run_config, time=time, state_file=os.path.basename(state_path),
+                          rng_state=self.rng.getstate(), log_offsets=log_offsets)
+        checkpoint["catchment_prefilter_counts"] = None
+        if self.catchment_prefilter is not None:
+            checkpoint["catchment_prefilter_counts"] = (self.catchment_prefilter.candidates,
+                                                        self.catchment_prefilter.skipped,
+                                                        self.catchment_prefilter.audited,
+                                                        self.catchment_prefilter.false_negatives)
+        checkpoint["mode_choice_cache"] = self.mode_choice.cache if self.mode_choice is not None else None
+        runCheckpoint.write_checkpoint(self.run_config.results_folder, checkpoint)
+        runCheckpoint.remove_state_files(self.run_config.results_folder, state_path)
+        if self.run_config.verbosity >= Verbosity.NORMAL:
+            print("Saved checkpoint at time " + str(time) + " to \"" + self.run_config.results_folder + "\".")
+
+    def log_memory(self):
+        traced, traced_peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+        largest_changes = get_memory_changes(snapshot, self.last_memory_snapshot)
+        self.last_memory_snapshot = snapshot
+        entry = [datetime.now(), self.step, self.run_config.scenario, round(traced / 1024), round(traced_peak / 1024)]
+        for container_name in self.memory_report_containers:
+            container = getattr(self, container_name)
+            entry += [len(container), round(get_container_size(container) / 1024, 1)]
+        entry += [self.evicted_reservations, self.evicted_customers, largest_changes]
+        self.uam_memory_log_writer.writerow(entry)
+        self.uam_memory_log_file.flush()
+        if self.run_config.verbosity >= Verbosity.NORMAL:
+            print("Traced memory: " + str(round(traced / 1024)) + " KB, largest changes: " + largest_changes)
+
+    def evict_stale_entries(self, peds: set[str]):
+        """
+        Removes the state of uam customers that left the simulation without their termination being noticed, once
+        they were created stale_entry_max_age seconds ago. Reservations waiting that long lose the persons who left the
+        simulation, the reservations of the others stay queued until a taxi is free. Evicted customers are logged with
+        the state "evicted".
+
+        :param peds: ids of the persons currently in the simulation
+        """
+        max_age = self.run_config.stale_entry_max_age
+        for entry in list(self.reservation_dict):
+            reservation = self.reservation_dict[entry]
+            if reservation["total_waiting_time"] < max_age:
+                continue
+            kept = [index for index, person_id in enumerate(reservation["id_list"]) if person_id in peds]
+            if len(kept) == len(reservation["id_list"]):
+                continue
+            if self.run_config.verbosity >= Verbosity.SPARSE:
+                print("Evicted reservations from \"" + entry[0] + "\" to \"" + entry[1] + "\" of "
+                      + str([person_id for person_id in reservation["id_list"] if person_id not in peds])
+                      + ": left the simulation without being dispatched.")
+            self.evicted_reservations += len(reservation["id_list"]) - len(kept)
+            if not kept:
+                del self.reservation_dict[entry]
+                continue
+            reservation["id_list"] = [reservation["id_list"][index] for index in kept]
+            reservation["reservation_id_list"] = [reservation["reservation_id_list"][index] for index in kept]
+            reservation["waiting_ped_count"] = len(kept)
+
+        # uam_log_dict keeps its insertion order, so only customers before the first young one are old enough
+        evicted_customers = set()
+        for customer in self.uam_log_dict:
+            if self.step - self.uam_log_dict[customer].created_step < max_age:
+                break
+            if customer not in peds:
+                evicted_customers.add(customer)
+        if not evicted_customers:
+            return
+        if self.run_config.verbosity >= Verbosity.SPARSE:
+            print("Evicted uam customers " + str(sorted(evicted_customers)) + ": left the simulation without being "
+                  "noticed.")
+        log_terminated_customers(self.run_config, self.uam_ped_log_writer, self.step, evicted_customers,
+                                 self.uam_log_dict, "evicted")
+        for evicted_customer in evicted_customers:
+            del self.uam_log_dict[evicted_customer]
+        self.uam_customers -= evicted_customers
+        self.waiting_peds -= evicted_customers
+        self.flying_peds -= evicted_customers
+        self.evicted_customers += len(evicted_customers)
+
+    def apply_mode_choices(self, decisions: list[(str, str)]):
+        """
+        Lets the customers that decided against uam walk to their destination, if they have not reached their hub yet.
+        """
+        for customer, mode in decisions:
+            if mode != "walk" or customer not in self.uam_customers:
+                continue
+            if customer in self.waiting_peds or customer in self.flying_peds or not switch_to_walking(self.conn,
+                                                                                                     customer):
+                self.late_decisions += 1
+                continue
+            self.declined_uam += 1
+            if not self.run_config.no_gui:
+                self.conn.person.setColor(customer, (255, 123, 0, 255))
+            position = self.conn.person.getPosition(customer)
+            self.uam_ped_log_writer.write(self.step, customer, "NULL", "declinedUam", round(position[0]),
+                                          round(position[1]), self.uam_log_dict[customer])
+
+    def is_running(self) -> bool:
+        return self.conn.simulation.getTime() <= self.run_config.seconds_to_simulate
+
+    def simulation_step(self):
+        conn = self.conn
+        run_config = self.run_config
+        step = self.step
+        conn.simulationStep()
+
+        if run_config.verbosity >= Verbosity.NORMAL:
             print("-----------------------------------------------")
             print("Simulation step: " + str(step))
 
-        peds = set(traci.person.getIDList())
-        vehicles = set(traci.vehicle.getIDList())
+        peds = set(conn.person.getIDList())
+        vehicles = set(conn.vehicle.getIDList())
 
         # determine terminated vehicles and pedestrians
-        terminated_vehicles = last_step_vehicles - vehicles
-        terminated_peds = last_step_peds - peds
+        terminated_vehicles = self.last_step_vehicles - vehicles
+        terminated_peds = self.last_step_peds - peds
 
-        terminated_uam_customers = set.intersection(terminated_peds, uam_customers)
+        terminated_uam_customers = set.intersection(terminated_peds, self.uam_customers)
 
-        log_terminated_customers(uam_ped_log_writer, step, terminated_uam_customers, uam_log_dict)
+        log_terminated_customers(run_config, self.uam_ped_log_writer, step, terminated_uam_customers, self.uam_log_dict)
 
         # clean up uam log dict
         for terminated_uam_customer in terminated_uam_customers:
-            if terminated_uam_customer in uam_log_dict:
-                del uam_log_dict[terminated_uam_customer]
+            if terminated_uam_customer in self.uam_log_dict:
+                del self.uam_log_dict[terminated_uam_customer]
 
 
         # clean up flying peds to remove rare crash
-        flying_peds -= terminated_peds
+        self.flying_peds -= terminated_peds
+
+        self.uam_customers = self.uam_customers - terminated_uam_customers
 
-        uam_customers = uam_customers - terminated_uam_customers
+        if self.mode_choice is not None:
+            self.apply_mode_choices(self.mode_choice.poll())
 
-        new_vehicles = vehicles - last_step_vehicles
-        new_pedestrians = peds - last_step_peds
+        new_vehicles = vehicles - self.last_step_vehicles
+        new_pedestrians = peds - self.last_step_peds
 
-        new_vehicles -= create_uam_customers(new_vehicles, step, uam_ped_log_writer, uam_customers, uam_log_dict)
+        new_vehicles -= create_uam_customers(conn, run_config, self.edge_index, self.rng, new_vehicles, step,
+                                             self.uam_ped_log_writer, self.uam_customers, self.uam_log_dict,
+                                             self.catchment_prefilter, self.uam_router, self.mode_choice)
+        if self.mode_choice is not None:
+            self.mode_choice.flush()
 
-        increment_reservation_waiting_time(reservation_dict)
-        check_for_new_reservations(reservation_dict, step, uam_ped_log_writer, waiting_peds, uam_log_dict)
-        dispatch_uam_vehicles(reservation_dict, parking_area_edges)
+        increment_reservation_waiting_time(run_config, self.reservation_dict)
+        check_for_new_reservations(conn, run_config, self.reservation_dict, step, self.uam_ped_log_writer,
+                                   self.waiting_peds, self.uam_log_dict)
+        dispatch_uam_vehicles(conn, run_config, self.reservation_dict, self.parking_area_edges)
 
-        if not config.no_gui:
+        if not run_config.no_gui:
             if step % 1 == 0:
-                recolour_uam_taxis()
+                recolour_uam_taxis(conn)
+
+        log_taxis(conn, run_config, self.uam_taxi_log_writer, step)
+
+        self.waiting_peds -= log_started_flights(conn, run_config, self.uam_ped_log_writer, step, self.waiting_peds,
+                                                 self.flying_peds, self.uam_log_dict)
+        self.flying_peds -= log_finished_flights(conn, run_config, self.uam_ped_log_writer, step, self.flying_peds,
+                                                 self.uam_log_dict)
+
+        self.last_step_vehicles = set(conn.vehicle.getIDList())  # save current vehicles for the next simulation step
+        self.last_step_peds = set(conn.person.getIDList())  # save current vehicles for the next simulation step
+
+        if run_config.stale_entry_max_age > 0:
+            self.evict_stale_entries(self.last_step_peds)
+        if run_config.memory_report_interval > 0 and step >= self.next_memory_report:
+            self.log_memory()
+            self.next_memory_report += run_config.memory_report_interval
+        self.step += run_config.step_length
+        if run_config.checkpoint_interval > 0 and self.step >= self.next_checkpoint:
+            self.next_checkpoint += run_config.checkpoint_interval
+            self.write_checkpoint()
+
+    def close(self, close_connection: bool = True):
+        if close_connection:
+            self.conn.close()
+        if self.catchment_prefilter is not None and self.run_config.verbosity >= Verbosity.SPARSE:
+            print(self.catchment_prefilter.get_summary() + " at uam_density " + str(self.run_config.uam_density) + ".")
+        if self.mode_choice is not None:
+            self.mode_choice.close()
+            if self.run_config.verbosity >= Verbosity.SPARSE:
+                print(self.mode_choice.get_summary() + ", " + str(self.declined_uam) + " customers walked instead, "
+                      + str(self.late_decisions) + " answers arrived too late at uam_density "
+                      + str(self.run_config.uam_density) + ".")
+        self.uam_ped_log_file.close()
+        self.uam_taxi_log_file.close()
+        if self.uam_memory_log_file is not None:
+            self.uam_memory_log_file.close()
+            self.last_memory_snapshot = None
+            global tracemalloc_users
+            with tracemalloc_lock:
+                tracemalloc_users -= 1
+                if tracemalloc_users == 0:
+                    tracemalloc.stop()
+        sys.stdout.flush()
 
-        log_taxis(uam_taxi_log_writer, step)
 
-        waiting_peds -= log_started_flights(uam_ped_log_writer, step, waiting_peds, flying_peds, uam_log_dict)
-        flying_peds -= log_finished_flights(uam_ped_log_writer, step, flying_peds, uam_log_dict)
+# contains TraCI control loop
+def run(run_config: RunConfig, edge_index: EdgeIndex, conn, session=None, checkpoint: dict = None):
+    uam_run = UamRun(run_config, edge_index, conn, session)
+    if checkpoint is None:
+        uam_run.start()
+    else:
+        uam_run.resume(checkpoint)
 
-        last_step_vehicles = set(traci.vehicle.getIDList())  # save current vehicles for the next simulation step
-        last_step_peds = set(traci.person.getIDList())  # save current vehicles for the next simulation step
-        step += config.step_length
-    traci.close()
-    uam_ped_log_file.close()
-    uam_taxi_log_file.close()
-    sys.stdout.flush()
+    # start of the main simulation loop
+    while uam_run.is_running():
+        uam_run.simulation_step()
+    # the SUMO process of a session is reused by the next run
+    uam_run.close(close_connection=session is None)
+    if run_config.checkpoint_interval > 0:
+        runCheckpoint.remove_checkpoint(run_config.results_folder)
 
 # both
-def generate_start_config(sumo_binary: str, results_folder) -> list[str]:
+def generate_start_config(sumo_binary: str, run_config: RunConfig) -> list[str]:
     """
-    Appends all start arguments as defined in simConfig.py and their respective file locations to a list of strings.
+    Appends all start arguments as defined in the run config and their respective file locations to a list of strings.
     This list is then returned and used to start traci with the appropriate start arguments.
 
     :param sumo_binary: string with information about the binary (sumo or sumo-gui)
     """
-    if options.scenario_path:
-        start_config = [sumo_binary, "-c", options.scenario_path]
-    else:
-        start_config = [sumo_binary, "-c", config.scenarios[config.scenario]]
-    if config.loop:
+    results_folder = run_config.results_folder
+    start_config = [sumo_binary, "-c", run_config.scenario_path]
+    if run_config.loop:
         start_config.append("--start")
         start_config.append("--quit-on-end")
     start_config.append("--device.taxi.dispatch-algorithm") # UAM
@@ -590,92 +1115,98 @@ def generate_start_config(sumo_binary: str, results_folder) -> list[str]:
     start_config.append("--device.taxi.idle-algorithm") # UAM
     start_config.append("taxistand")
     start_config.append("--lateral-resolution")
-    start_config.append(str(config.lateral_resolution))
+    start_config.append(str(run_config.lateral_resolution))
     start_config.append("--step-length")
-    start_config.append(str(config.step_length))
+    start_config.append(str(run_config.step_length))
+    start_config.append("--seed")
+    start_config.append(str(run_config.seed))
     start_config.append("--gui-settings-file")
     start_config.append(os.path.join("defaultView.xml"))
+    if run_config.checkpoint_interval > 0:
+        # persons and random number generators are only part of saved states on request
+        start_config.append("--save-state.transportables")
+        start_config.append("--save-state.rng")
 
-    if config.outputFilesActive:
-        if config.statsOutput:
+    if run_config.outputFilesActive:
+        if run_config.statsOutput:
             start_config.append("--statistic-output")
             start_config.append(os.path.join(results_folder, "stats.xml"))
 
-        if config.tripinfoOutput:
+        if run_config.tripinfoOutput:
             start_config.append("--tripinfo-output")
             start_config.append(os.path.join(results_folder, "tripinfo.xml"))
 
-        if config.personsummaryOutput:
+        if run_config.personsummaryOutput:
             start_config.append("--person-summary-output")
             start_config.append(os.path.join(results_folder, "personsummary.xml"))
 
-        if config.summaryOutput:
+        if run_config.summaryOutput:
             start_config.append("--summary")
             start_config.append(os.path.join(results_folder, "summary.xml"))
 
-        if config.vehroutesOutput:
+        if run_config.vehroutesOutput:
             start_config.append("--vehroute-output")
             start_config.append(os.path.join(results_folder, "vehroutes.xml"))
 
-        if config.fcdOutput:
+        if run_config.fcdOutput:
             start_config.append("--fcd-output")
             start_config.append(os.path.join(results_folder, "fcd.xml"))
 
-        if config.fullOutput:
+        if run_config.fullOutput:
             start_config.append("--full-output")
             start_config.append(os.path.join(results_folder, "full.xml"))
 
-        if config.queueOutput:
+        if run_config.queueOutput:
             start_config.append("--queue-output")
             start_config.append(os.path.join(results_folder, "queue.xml"))
 
-        if config.edgedataOutput:
+        if run_config.edgedataOutput:
             start_config.append("--edgedata-output")
             start_config.append(os.path.join(results_folder, "edgedata.xml"))
 
-        if config.lanedataOutput:
+        if run_config.lanedataOutput:
             start_config.append("--lanedata-output")
             start_config.append(os.path.join(results_folder, "lanedata.xml"))
 
-        if config.lanechangeOutput:
+        if run_config.lanechangeOutput:
             start_config.append("--lanechange-output")
             start_config.append(os.path.join(results_folder, "lanechange.xml"))
 
-        if config.amitranOutput:
+        if run_config.amitranOutput:
             start_config.append("--amitran-output")
             start_config.append(os.path.join(results_folder, "amitran.xml"))
 
-        if config.ndumpOutput:
+        if run_config.ndumpOutput:
             start_config.append("--ndump")
             start_config.append(os.path.join(results_folder, "ndump.xml"))
 
-        if config.linkOutput:
+        if run_config.linkOutput:
             start_config.append("--link-output")
             start_config.append(os.path.join(results_folder, "link.xml"))
 
-        if config.personinfoOutput:
+        if run_config.personinfoOutput:
             start_config.append("--personinfo-output")
             start_config.append(os.path.join(results_folder, "personinfo.xml"))
 
-        if config.emissionOutput:
+        if run_config.emissionOutput:
             start_config.append("--emission-output")
             start_config.append(os.path.join(results_folder, "emission.xml"))
 
     return start_config
 
 # both
-def generate_base_results_folder(path: str):
-    hubs_and_name = extract_info(path)
+def generate_base_results_folder(run_config: RunConfig) -> RunConfig:
+    hubs_and_name = extract_info(run_config.scenario_path)
     timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
-    folder_name = hubs_and_name[0] + "_hubs_" + config.scenario + "_" + str(timestamp)
-    config.results_folder_path = os.path.join(config.results_folder_path, folder_name)
+    folder_name = hubs_and_name[0] + "_hubs_" + run_config.scenario + "_" + str(timestamp)
+    return dataclasses.replace(run_config, results_folder_path=os.path.join(run_config.results_folder_path, folder_name))
 
 
 # creates new folder for results in next simulation
 # both
-def get_new_results_folder():
-    data_output_path = os.path.join(config.results_folder_path,
-                                    "{}-uam{:.3f}-{}".format(config.scenario, config.uam_density,
+def get_new_results_folder(run_config: RunConfig):
+    data_output_path = os.path.join(run_config.results_folder_path,
+                                    "{}-uam{:.3f}-{}".format(run_config.scenario, run_config.uam_density,
                                                                      
                                                                       datetime.now().strftime("%Y%m%d-%H%M%S")))
 
@@ -699,92 +1230,228 @@ def extract_info(filename):
     return uam_hubs_number.group(1) if uam_hubs_number else "NULL", remaining_string
 
 # both
-def process_options():
+def get_net_path(scenario_path: str) -> str:
+    return os.path.join(os.path.dirname(scenario_path),
+                        ET.parse(scenario_path).getroot().find(".//net-file").get("value").split("/")[0])
+
+
+# both
+def process_options(options) -> RunConfig:
+    """
+    Builds the run configuration from the simConfig.py defaults and the given command line options.
+    """
+    verbosity = None
     if options.verbosity is not None:
         match options.verbosity:
             case "none":
-                config.verbosity = Verbosity.NONE
+                verbosity = Verbosity.NONE
             case "sparse":
-                config.verbosity = Verbosity.SPARSE
+                verbosity = Verbosity.SPARSE
             case "normal":
-                config.verbosity = Verbosity.NORMAL
+                verbosity = Verbosity.NORMAL
             case "verbose":
-                config.verbosity = Verbosity.VERBOSE
-    if options.time_steps is not None:
-        config.seconds_to_simulate = options.time_steps
-    if options.step_length is not None:
-        config.step_length = options.step_length
-    if options.loop is not None:
-        config.loop = options.loop
-    if options.uam_vehicles_per_hub is not None:
-        config.uam_vehicles_per_hub = options.uam_vehicles_per_hub
-    if options.uam_vehicle_capacity is not None:
-        config.uam_vehicle_capacity = options.uam_vehicle_capacity
-    if options.group_finding_time is not None:
-        config.group_finding_time = options.group_finding_time
+                verbosity = Verbosity.VERBOSE
     #if options.lateral_resolution is not None:
-    #    config.lateral_resolution = options.lateral_resolution
-    if options.uam_upper_bound is not None:
-        config.uam_upper_bound = options.uam_upper_bound
-    if options.uam_step_size is not None:
-        config.uam_step_size = options.uam_step_size
-    if options.uam_start_density is not None:
-        config.uam_density = options.uam_start_density
-        config.uam_start_density = options.uam_start_density
-    if options.nogui is not None:
-        config.no_gui = options.nogui
+    #    lateral_resolution = options.lateral_resolution
+    scenario = options.scenario
+    scenario_path = None
     if options.scenario is not None:
-        config.scenario = options.scenario
+        scenario_path = config.scenarios[options.scenario]
     if options.scenario_path is not None:
         hubs_and_name = extract_info(os.path.basename(options.scenario_path))
-        config.scenario = hubs_and_name[1]
+        scenario = hubs_and_name[1]
+        scenario_path = options.scenario_path
+    return build_run_config(verbosity=verbosity,
+                            seconds_to_simulate=options.time_steps,
+                            step_length=options.step_length,
+                            loop=options.loop,
+                            uam_vehicles_per_hub=options.uam_vehicles_per_hub,
+                            uam_vehicle_capacity=options.uam_vehicle_capacity,
+                            group_finding_time=options.group_finding_time,
+                            uam_upper_bound=options.uam_upper_bound,
+                            uam_step_size=options.uam_step_size,
+                            uam_density=options.uam_start_density,
+                            uam_start_density=options.uam_start_density,
+                            no_gui=options.nogui,
+                            seed=options.seed,
+                            use_run_cache=False if options.no_cache else None,
+                            parallel_runs=options.parallel_runs,
+                            record_trace=options.record_trace or None,
+                            memory_report_interval=options.memory_report_interval,
+                            checkpoint_interval=options.checkpoint_interval,
+                            stale_entry_max_age=options.stale_entry_max_age,
+                            catchment_prefilter=options.catchment_prefilter or None,
+                            catchment_circuity=options.catchment_circuity,
+                            catchment_audit_interval=options.catchment_audit_interval,
+                            intermodal_router=options.intermodal_router,
+                            mode_choice_backend=options.mode_choice_backend,
+                            reuse_sumo_process=options.reuse_sumo or None,
+                            mode_choice_batch_size=options.mode_choice_batch_size,
+                            mode_choice_max_concurrency=options.mode_choice_max_concurrency,
+                            mode_choice_timeout=options.mode_choice_timeout,
+                            mode_choice_stub_latency=options.mode_choice_stub_latency,
+                            scenario=scenario,
+                            scenario_path=scenario_path)
+
+
+# both
+def run_simulation(sumo_binary: str, run_config: RunConfig, edge_index: EdgeIndex, label: str = "default",
+                   session: SumoSession = None):
+    """
+    Runs a single simulation with the given run config, unless a complete results folder with the same
+    fingerprint is already registered in the run index. Runs with a mode choice backend are always simulated, as the
+    answers of the backend arrive after a varying number of steps.
+
+    :param label: label of the TraCI connection, has to be unique among the simulations running at the same time
+    :param session: reuse the SUMO process of this session instead of starting a new one, except for recorded runs
+    """
+    fingerprint = runCache.compute_run_fingerprint(run_config.scenario_path, dataclasses.asdict(run_config),
+                                                   run_config.seed, runCache.get_sumo_version(sumo_binary))
+    if run_config.use_run_cache and not run_config.record_trace and run_config.mode_choice_backend == "":
+        cached_results_folder = runCache.lookup(fingerprint, run_config.run_index_file)
+        if cached_results_folder != "":
+            print("Skipping uam_density " + str(run_config.uam_density) + ": identical configuration already simulated in \""
+                  + cached_results_folder + "\".")
+            return
+
+    run_config = dataclasses.replace(run_config, results_folder=get_new_results_folder(run_config))
+    traci_start_config = generate_start_config(sumo_binary, run_config)
+    completion_metadata = {"scenario": run_config.scenario, "scenario_path": run_config.scenario_path,
+                           "uam_density": run_config.uam_density, "seed": run_config.seed}
+    if session is not None and not run_config.record_trace:
+        try:
+            run(run_config, edge_index, session.connect(traci_start_config), session)
+        except Exception:
+            session.close()  # the next run starts a new SUMO process
+            raise
+        session.pending_completion = lambda: runCache.mark_complete(run_config.results_folder, fingerprint,
+                                                                    completion_metadata, run_config.run_index_file)
+        return
+
+    # traci starts sumo as a subprocess and then this script connects and runs
+    # traci.start is not thread-safe, e.g. two simulations could be assigned the same free port
+    with traci_start_lock:
+        traci.start(traci_start_config, label=label)
+        conn = traci.getConnection(label)
+    trace_recorder = None
+    if run_config.record_trace:
+        trace_metadata = traciReplay.get_trace_metadata(run_config, get_net_path(run_config.scenario_path),
+                                                        runCache.get_sumo_version(sumo_binary))
+        trace_recorder = traciReplay.TraceRecorder(conn, os.path.join(run_config.results_folder,
+                                                                      traciReplay.trace_file_name), trace_metadata)
+    run(run_config, edge_index, conn)
+    if trace_recorder is not None:
+        trace_recorder.close()
+    runCache.mark_complete(run_config.results_folder, fingerprint, completion_metadata, run_config.run_index_file)
+
+
+# both
+def resume_simulation(sumo_binary: str, results_folder: str, checkpoint: dict, edge_index: EdgeIndex):
+    """
+    Continues an interrupted run from the last checkpoint in its results folder. The uam logs are continued, SUMO's
+    own output files of the rest of the run are written to a resume-<time> subfolder, as SUMO cannot append to them.
+    """
+    results_folder = os.path.normpath(results_folder)
+    run_config = dataclasses.replace(checkpoint["run_config"], results_folder=results_folder)
+    fingerprint = runCache.compute_run_fingerprint(run_config.scenario_path, dataclasses.asdict(run_config),
+                                                   run_config.seed, runCache.get_sumo_version(sumo_binary))
+    sumo_results_folder = os.path.join(results_folder, "resume-{:.0f}".format(checkpoint["time"]))
+    os.makedirs(sumo_results_folder, exist_ok=True)
+    state_path = os.path.join(sumo_results_folder, "state.xml.gz")
+    runCheckpoint.prepare_state_file(os.path.join(results_folder, checkpoint["state_file"]), state_path)
+    traci_start_config = generate_start_config(sumo_binary, dataclasses.replace(run_config,
+                                                                                 results_folder=sumo_results_folder))
+    traci_start_config += ["--load-state", state_path, "--begin", str(checkpoint["time"])]
+    if run_config.verbosity >= Verbosity.SPARSE:
+        print("Resuming uam_density " + str(run_config.uam_density) + " at time " + str(checkpoint["time"])
+              + " from \"" + results_folder + "\".")
+    with traci_start_lock:
+        traci.start(traci_start_config, label="resume")
+        conn = traci.getConnection("resume")
+    run(run_config, edge_index, conn, checkpoint=checkpoint)
+    os.remove(state_path)
+    completion_metadata = {"scenario": run_config.scenario, "scenario_path": run_config.scenario_path,
+                           "uam_density": run_config.uam_density, "seed": run_config.seed}
+    runCache.mark_complete(results_folder, fingerprint, completion_metadata, run_config.run_index_file)
+
+
+# both
+def run_simulations(sumo_binary: str, run_configs: list[RunConfig], edge_index: EdgeIndex, parallel_runs: int = 1,
+                    reuse_sumo_process: bool = False):
+    """
+    Runs all given simulations, up to parallel_runs of them at the same time. Each simulation gets its own SUMO
+    instance, TraCI connection and controller thread, so while one thread waits for SUMO to finish a simulation step,
+    the others keep advancing their own simulations. The edge index is only read and therefore shared.
+    With reuse_sumo_process, each thread keeps its SUMO instance in a SumoSession and reloads it for its next simulation.
+    """
+    if parallel_runs <= 1:
+        session = SumoSession() if reuse_sumo_process else None
+        try:
+            for run_config in run_configs:
+                if run_config.loop:
+                    print("uam_density: " + str(run_config.uam_density) + ", uam_upper_bound: " + str(
+                        run_config.uam_upper_bound) + ", uam_step_size: " + str(run_config.uam_step_size))
+                run_simulation(sumo_binary, run_config, edge_index, session=session)
+        finally:
+            if session is not None:
+                session.close()
+        return
+
+    sessions = dict()
+
+    def run_in_thread_session(run_config: RunConfig, label: str):
+        session = None
+        if reuse_sumo_process:
+            session = sessions.setdefault(threading.get_ident(), SumoSession("session" + str(threading.get_ident())))
+            label = session.label
+        run_simulation(sumo_binary, run_config, edge_index, label, session)
+
+    try:
+        with ThreadPoolExecutor(max_workers=parallel_runs) as executor:
+            futures = dict()
+            for run_config in run_configs:
+                label = "uam{:.3f}".format(run_config.uam_density)
+                futures[executor.submit(run_in_thread_session, run_config, label)] = label
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    print("Finished simulation \"" + futures[future] + "\".")
+                except Exception as e:
+                    print("Error: simulation \"" + futures[future] + "\" failed: " + str(e))
+    finally:
+        for session in sessions.values():
+            session.close()
 
 
 # both
 if __name__ == '__main__':
 
     options = get_options()
-    process_options()
-    if config.scenario not in config.scenarios.keys():
-        net_path = os.path.join(os.path.dirname(options.scenario_path), ET.parse(options.scenario_path).getroot().find(
-            ".//net-file").get("value").split("/")[0])
-        scenario_path = options.scenario_path
+    resume_checkpoint = None
+    if options.resume is not None:
+        resume_checkpoint = runCheckpoint.read_checkpoint(options.resume)
+        base_run_config = resume_checkpoint["run_config"]
     else:
-        net_path = os.path.join(os.path.dirname(config.scenarios[config.scenario]),
-                                ET.parse(config.scenarios[config.scenario]).getroot().find(
-                                    ".//net-file").get("value").split("/")[0])
-        scenario_path = config.scenarios[config.scenario]
-
-    net = sumolib.net.readNet(net_path)
+        base_run_config = process_options(options)
+    # only the edge geometry and permissions are needed, they are cached per network content in cache_folder_path
+    edge_index = load_edge_index(get_net_path(base_run_config.scenario_path))
+    if base_run_config.catchment_prefilter:
+        # built once here, so that parallel runs only read the cached catchment
+        load_hub_catchment(get_net_path(base_run_config.scenario_path))
+    if base_run_config.intermodal_router == "python":
+        load_uam_router(get_net_path(base_run_config.scenario_path))
 
     # check binary
-    if config.no_gui:
+    if base_run_config.no_gui:
         sumoBinary = checkBinary('sumo')
-        config.no_gui = True
     else:
         sumoBinary = checkBinary('sumo-gui')
-        config.no_gui = False
-
-    generate_base_results_folder(scenario_path)
-
-    if not config.loop:  # run simulation once
-        results_folder = get_new_results_folder()
-        traci_start_config = generate_start_config(sumoBinary, results_folder)
-        # traci starts sumo as a subprocess and then this script connects and runs
-        traci.start(traci_start_config)
-        run()
-    else:  # run multiple simulations in a row, looping through uam density
-        while config.uam_density <= config.uam_upper_bound:
-            print("uam_density: " + str(config.uam_density) + ", uam_upper_bound: " + str(
-                config.uam_upper_bound) + ", uam_step_size: " + str(config.uam_step_size))
-            if config.uam_density > 1.0:  # we can't convert over 100% of vehicles to alternatives
-                break
-            results_folder = get_new_results_folder()
-            traci_start_config = generate_start_config(sumoBinary, results_folder)
-            # traci starts sumo as a subprocess and then this script connects and runs
-            traci.start(traci_start_config)
-            run()
-            if config.uam_step_size == 0.0:
-                break
-            config.uam_density += config.uam_step_size
-        config.uam_density = config.uam_start_density
+
+    if resume_checkpoint is not None:
+        resume_simulation(sumoBinary, options.resume, resume_checkpoint, edge_index)
+    else:
+        base_run_config = generate_base_results_folder(base_run_config)
+
+        # without the loop option, only a single simulation is run
+        run_simulations(sumoBinary, get_density_sweep(base_run_config), edge_index, base_run_config.parallel_runs,
+                        base_run_config.reuse_sumo_process)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+import gzip
+import xml.etree.ElementTree as ET
+
+chunk_size = 1 << 20
+
+
+def open_xml(path: str, mode: str = 'rb'):
+    """
+    Opens a (gzipped) xml file in binary mode, .gz files are compressed transparently.
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+def find_root_start(data: bytes) -> (int, bytes, bool):
+    """
+    Finds the start tag of the root element behind the xml declaration, comments and doctype.
+    Returns the position behind the start tag, the name of the root element and whether the root element is empty
+    (<additional/>), or None if data does not contain the complete start tag yet.
+    """
+    pos = 3 if data.startswith(b"\xef\xbb\xbf") else 0
+    while True:
+        while pos < len(data) and data[pos:pos + 1].isspace():
+            pos += 1
+        if data.startswith(b"<?", pos):
+            end = data.find(b"?>", pos)
+            pos = -1 if end < 0 else end + 2
+        elif data.startswith(b"<!--", pos):
+            end = data.find(b"-->", pos)
+            pos = -1 if end < 0 else end + 3
+        elif data.startswith(b"<!", pos):
+            end = data.find(b">", pos)
+            if end >= 0 and data.find(b"[", pos, end) >= 0:
+                # doctype with an internal subset
+                end = data.find(b"]", pos)
+                end = -1 if end < 0 else data.find(b">", end)
+            pos = -1 if end < 0 else end + 1
+        elif data.startswith(b"<", pos):
+            break
+        else:
+            return None
+        if pos < 0:
+            return None
+    # attribute values may contain ">", so only quotes are skipped
+    name_end = pos + 1
+    while name_end < len(data) and not data[name_end:name_end + 1].isspace() and data[name_end:name_end + 1] not in (b">", b"/"):
+        name_end += 1
+    quote = None
+    for index in range(name_end, len(data)):
+        char = data[index:index + 1]
+        if quote is not None:
+            if char == quote:
+                quote = None
+        elif char in (b'"', b"'"):
+            quote = char
+        elif char == b">":
+            return index + 1, data[pos + 1:name_end], data[index - 1:index] == b"/"
+    return None
+
+
+def serialize(elements: list[ET.Element]) -> bytes:
+    """
+    Returns the elements one per line, indented like the children of a SUMO root element.
+    """
+    serialized = list()
+    for element in elements:
+        element.tail = None
+        serialized.append(b"\n    " + ET.tostring(element))
+    return b"".join(serialized)
+
+
+def read_prolog(in_file) -> (bytes, int, bytes, bool):
+    """
+    Reads chunks until the start tag of the root element is complete. Returns the data read so far and the result of
+    find_root_start.
+    """
+    data = bytes()
+    while True:
+        chunk = in_file.read(chunk_size)
+        data += chunk
+        root_start = find_root_start(data)
+        if root_start is not None:
+            return (data,) + root_start
+        if not chunk:
+            raise ValueError("no root element found")
+
+
+def insert_elements(in_path: str, out_path: str, first_elements: list[ET.Element] = (),
+                    last_elements: list[ET.Element] = ()):
+    """
+    Copies an xml file and inserts elements as first and last children of its root element. The file is copied in
+    chunks without parsing it, so the memory use does not depend on the file size and everything else, including
+    comments and formatting, stays unchanged.
+    """
+    with open_xml(in_path) as in_file, open_xml(out_path, 'wb') as out_file:
+        data, content_start, root_name, is_empty = read_prolog(in_file)
+        if is_empty:
+            # <additional/> becomes <additional>...</additional>
+            out_file.write(data[:content_start - 2].rstrip() + b">" + serialize(list(first_elements) + list(last_elements))
+                           + b"\n</" + root_name + b">" + data[content_start:])
+            for chunk in iter(lambda: in_file.read(chunk_size), b""):
+                out_file.write(chunk)
+            return
+        out_file.write(data[:content_start] + serialize(first_elements))
+        data = data[content_start:]
+        # everything before the last closing tag of the root element seen so far can be written
+        end_tag = b"</" + root_name
+        while True:
+            end = data.rfind(end_tag)
+            keep_from = end if end >= 0 else max(0, len(data) - len(end_tag))
+            out_file.write(data[:keep_from])
+            data = data[keep_from:]
+            chunk = in_file.read(chunk_size)
+            if not chunk:
+                break
+            data += chunk
+        if not data.startswith(end_tag):
+            raise ValueError("\"" + in_path + "\" has no closing tag for its root element")
+        out_file.write(serialize(last_elements) + (b"\n" if len(last_elements) > 0 else b"") + data)
+
+
+def rewrite_elements(in_path: str, out_path: str, rewrite, last_elements: list[ET.Element] = ()):
+    """
+    Copies an xml file and replaces each child of the root element by the elements rewrite(child) returns, an empty
+    list removes the child. The children are parsed and written one at a time, so only a single child has to fit into
+    memory. The prolog and the start tag of the root element are copied unchanged, comments between the children are
+    dropped.
+    """
+    with open_xml(in_path) as in_file:
+        data, content_start, root_name, is_empty = read_prolog(in_file)
+    with open_xml(in_path) as in_file, open_xml(out_path, 'wb') as out_file:
+        out_file.write(data[:content_start - 2].rstrip() + b">" if is_empty else data[:content_start])
+        depth = 0
+        root = None
+        for event, element in ET.iterparse(in_file, events=("start", "end")):
+            if event == "start":
+                depth += 1
+                if root is None:
+                    root = element
+                continue
+            depth -= 1
+            if depth == 1:
+                out_file.write(serialize(rewrite(element)))
+                # drop the written child from the tree
+                root.clear()
+        out_file.write(serialize(last_elements) + b"\n</" + root_name + b">\n")